@@ -0,0 +1,238 @@
+# Helper functions to find duplicate image files in directory trees
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+
+from dammap.common.constants import AGG_DIR, MAC_PATH, OUT_DIR
+
+# Bytes hashed from the start of each file before hashing whole files
+PARTIAL_HASH_BYTES = 64 * 1024
+HASH_BLOCK_BYTES = 1024 * 1024
+DUPES_REPORT_FNAME = "duplicate_files.json"
+
+
+# ...............................................
+def hashfile(fullfname, max_bytes=None, blocksize=HASH_BLOCK_BYTES):
+    """Compute the BLAKE2b hash of a file, or of the start of a file.
+
+    Args:
+        fullfname (str): full filename.
+        max_bytes (int): number of bytes to hash from the start of the file; None
+            for the whole file.
+        blocksize (int): bytes read at a time.
+
+    Returns:
+        hex digest of the hash (str)
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    remaining = max_bytes
+    with open(fullfname, "rb") as f:
+        while remaining is None or remaining > 0:
+            size = blocksize if remaining is None else min(blocksize, remaining)
+            buf = f.read(size)
+            if not buf:
+                break
+            hasher.update(buf)
+            if remaining is not None:
+                remaining -= len(buf)
+    return hasher.hexdigest()
+
+
+# .............................................................................
+class DeDuper():
+    """Find files with identical contents in one or more directory trees.
+
+    Files are grouped by size, then by a hash of their first PARTIAL_HASH_BYTES,
+    then by a hash of their full contents, so only files that still match are read
+    completely.
+    """
+    def __init__(
+            self, source_path, dest_path, *additional_paths, base_path=None,
+            workers=8, logger=None):
+        """Constructor.
+
+        Args:
+            source_path (str): directory tree to search.
+            dest_path (str): directory tree to search, holding the files to keep.
+            additional_paths (str): other directory trees to search, if they exist.
+            base_path (str): directory for relative filenames in reports, defaults to
+                the dams_aggregate tree.
+            workers (int): number of threads reading files in parallel.
+            logger (object): logger for recording messages to file or command line.
+        """
+        self.source_paths = [source_path]
+        self.dest_path = dest_path
+        for pth in (dest_path, *additional_paths):
+            if os.path.exists(pth) and pth not in self.source_paths:
+                self.source_paths.append(pth)
+        if base_path is None:
+            base_path = os.path.join(MAC_PATH, AGG_DIR)
+        self.base_path = base_path
+        self.workers = workers
+        self._logger = logger
+        self._groups = None
+
+    # ...............................................
+    def _log(self, msg):
+        if self._logger is not None:
+            self._logger.info(msg)
+        else:
+            print(msg)
+
+    # ...............................................
+    def _scan_sizes(self):
+        """Group all non-hidden files in source_paths by size.
+
+        Returns:
+            dict of {size: [fullname, ...]}
+        """
+        sizes = {}
+        seen = set()
+        stack = list(self.source_paths)
+        while stack:
+            pth = stack.pop()
+            with os.scandir(pth) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        fullname = os.path.realpath(entry.path)
+                        # Overlapping source paths list a file only once
+                        if fullname not in seen:
+                            seen.add(fullname)
+                            try:
+                                sizes[entry.stat().st_size].append(fullname)
+                            except KeyError:
+                                sizes[entry.stat().st_size] = [fullname]
+        return sizes
+
+    # ...............................................
+    def _rebucket(self, buckets, max_bytes):
+        """Split buckets of possible duplicates by file hash.
+
+        Args:
+            buckets (list): list of (key, [fullname, ...]) with 2 or more files each.
+            max_bytes (int): number of bytes to hash from the start of each file;
+                None for whole files.
+
+        Returns:
+            list of ((key, hash), [fullname, ...]) with 2 or more files each.
+        """
+        fullnames = [fn for _key, fnames in buckets for fn in fnames]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            hashes = list(executor.map(
+                lambda fn: hashfile(fn, max_bytes=max_bytes), fullnames))
+        new_buckets = {}
+        idx = 0
+        for key, fnames in buckets:
+            for fn in fnames:
+                try:
+                    new_buckets[(key, hashes[idx])].append(fn)
+                except KeyError:
+                    new_buckets[(key, hashes[idx])] = [fn]
+                idx += 1
+        return [(key, fnames) for key, fnames in new_buckets.items() if len(fnames) > 1]
+
+    # ...............................................
+    def find_duplicates(self):
+        """Find groups of files with identical contents.
+
+        Returns:
+            list of (size, hash, [fullname, ...]) for each group of 2 or more
+                identical files, with filenames sorted.
+        """
+        sizes = self._scan_sizes()
+        file_count = sum(len(fnames) for fnames in sizes.values())
+        buckets = [(size, fnames) for size, fnames in sizes.items() if len(fnames) > 1]
+        self._log(
+            f"{file_count} files, {sum(len(f) for _, f in buckets)} with the same size")
+        # Hash the start of each file
+        buckets = self._rebucket(buckets, PARTIAL_HASH_BYTES)
+        # Partial hash covered all of a small file
+        groups = []
+        large = []
+        for (size, phash), fnames in buckets:
+            if size <= PARTIAL_HASH_BYTES:
+                groups.append((size, phash, sorted(fnames)))
+            else:
+                large.append(((size, phash), fnames))
+        self._log(f"{sum(len(f) for _, f in large)} large files to hash fully")
+        for ((size, _phash), fhash), fnames in self._rebucket(large, None):
+            groups.append((size, fhash, sorted(fnames)))
+        groups.sort(key=lambda grp: grp[2][0])
+        self._groups = groups
+        return groups
+
+    # ...............................................
+    def _relative(self, fullname):
+        return os.path.relpath(fullname, self.base_path)
+
+    # ...............................................
+    def write_report(self, out_fname):
+        """Write groups of duplicate files to a JSON file.
+
+        Args:
+            out_fname (str): full filename of the JSON report.
+
+        Returns:
+            count of duplicate groups.
+
+        Note:
+            Filenames are relative to base_path.  In each group, keep is the first
+            file in dest_path, or the first file if none are in dest_path.
+        """
+        if self._groups is None:
+            self.find_duplicates()
+        groups = []
+        wasted = 0
+        for size, fhash, fnames in self._groups:
+            keep = fnames[0]
+            for fn in fnames:
+                if fn.startswith(os.path.join(os.path.realpath(self.dest_path), "")):
+                    keep = fn
+                    break
+            groups.append({
+                "size": size,
+                "hash": fhash,
+                "keep": self._relative(keep),
+                "duplicates": [self._relative(fn) for fn in fnames if fn != keep]})
+            wasted += size * (len(fnames) - 1)
+        report = {
+            "base_path": self.base_path,
+            "source_paths": self.source_paths,
+            "group_count": len(groups),
+            "duplicate_bytes": wasted,
+            "groups": groups}
+        with open(out_fname, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        self._log(
+            f"Wrote {len(groups)} groups of duplicates ({wasted} bytes) to {out_fname}")
+        return len(groups)
+
+
+# ..............................................................................
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find image files with identical contents.")
+    parser.add_argument(
+        "dest_path", help="Directory tree holding the files to keep.")
+    parser.add_argument(
+        "source_paths", nargs="*", help="Other directory trees to search.")
+    parser.add_argument(
+        "--base_path", default=os.path.join(MAC_PATH, AGG_DIR),
+        help="Directory for relative filenames in the report.")
+    parser.add_argument(
+        "--out_fname", default=os.path.join(MAC_PATH, OUT_DIR, DUPES_REPORT_FNAME),
+        help="Full filename of the JSON report.")
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Number of threads reading files.")
+    args = parser.parse_args()
+
+    deduper = DeDuper(
+        args.dest_path, args.dest_path, *args.source_paths,
+        base_path=args.base_path, workers=args.workers)
+    deduper.write_report(args.out_fname)
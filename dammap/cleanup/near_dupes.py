@@ -0,0 +1,371 @@
+# Helper functions to find visually identical image files, such as re-exported,
+# resized or renamed copies, which have different file contents
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+from logging import INFO
+import os
+from PIL import Image, ImageOps
+
+from dammap.common.constants import (
+    AGG_DIR, ALL_DATA_KEYS as ADK, IMAGE_KEYS as IK, MAC_PATH, META_CACHE_FNAME,
+    OUT_DIR)
+from dammap.common.util import walk_image_tree
+
+# Width and height of the difference grid; hashes have HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 8
+# Maximum number of differing bits between hashes of near-duplicate images
+NEAR_DUPE_DISTANCE = 6
+NEAR_DUPES_REPORT_FNAME = "near_duplicate_images.json"
+
+
+# .............................................................................
+def dhash(fullfname, hash_size=HASH_SIZE):
+    """Compute the difference hash (dHash) of an image file.
+
+    Module-level so that it can be dispatched to a process pool.
+
+    Args:
+        fullfname (str): full path to the image file.
+        hash_size (int): width and height of the grid of brightness differences.
+
+    Returns:
+        hsh (int): hash with hash_size * hash_size bits, None if the image cannot be
+            read.
+        msg (str): error message if the image cannot be read, otherwise None.
+
+    Note:
+        JPEG images are decoded in draft mode, at 1/2, 1/4 or 1/8 scale, then rotated
+        by their EXIF orientation, so copies that were re-saved with rotated pixels
+        match the original.  Each bit records whether a pixel of the greyscale
+        image, reduced to (hash_size + 1) x hash_size, is brighter than its right
+        neighbor.
+    """
+    try:
+        with Image.open(fullfname) as image:
+            # Only affects JPEG images
+            image.draft("L", (hash_size * 8, hash_size * 8))
+            image = ImageOps.exif_transpose(image)
+            small = image.convert("L").resize(
+                (hash_size + 1, hash_size), Image.LANCZOS)
+    except Exception as e:
+        return None, f" *** Unable to hash file {fullfname}, {e}"
+    pixels = list(small.getdata())
+    hsh = 0
+    for row in range(hash_size):
+        start = row * (hash_size + 1)
+        for col in range(hash_size):
+            hsh = (hsh << 1) | (pixels[start + col] > pixels[start + col + 1])
+    return hsh, None
+
+
+# .............................................................................
+def hamming(hash1, hash2):
+    """Count the bits that differ between two hashes.
+
+    Args:
+        hash1 (int): first hash.
+        hash2 (int): second hash.
+
+    Returns:
+        number of differing bits (int)
+    """
+    return bin(hash1 ^ hash2).count("1")
+
+
+# .............................................................................
+class BKTree(object):
+    """Burkhard-Keller tree of hashes, for lookup within a Hamming distance.
+
+    Each child of a node is keyed by its distance to the node, so by the triangle
+    inequality a search within max_distance of a hash h only descends into children
+    keyed within max_distance of the distance from h to the node.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self):
+        """Create an empty tree."""
+        # Each node is [hash, [key, ...], {distance: child_node, ...}]
+        self._root = None
+        self._count = 0
+
+    # ...............................................
+    def add(self, hsh, key):
+        """Add a hash to the tree.
+
+        Args:
+            hsh (int): hash value.
+            key (object): identifier returned by searches.  Keys with identical hashes
+                share one node.
+        """
+        self._count += 1
+        if self._root is None:
+            self._root = [hsh, [key], {}]
+            return
+        node = self._root
+        while True:
+            dist = hamming(hsh, node[0])
+            if dist == 0:
+                node[1].append(key)
+                return
+            try:
+                node = node[2][dist]
+            except KeyError:
+                node[2][dist] = [hsh, [key], {}]
+                return
+
+    # ...............................................
+    def find(self, hsh, max_distance):
+        """Find all keys with hashes within a Hamming distance of a hash.
+
+        Args:
+            hsh (int): hash value to search for.
+            max_distance (int): maximum number of differing bits.
+
+        Returns:
+            list of (distance, key) tuples, closest first.
+        """
+        found = []
+        if self._root is None:
+            return found
+        stack = [self._root]
+        while stack:
+            node_hash, keys, children = stack.pop()
+            dist = hamming(hsh, node_hash)
+            if dist <= max_distance:
+                found.extend((dist, key) for key in keys)
+            for child_dist, child in children.items():
+                if dist - max_distance <= child_dist <= dist + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda dk: dk[0])
+        return found
+
+    # ...............................................
+    def __len__(self):
+        return self._count
+
+
+# .............................................................................
+class NearDuper(object):
+    """Find clusters of visually identical images, with their metadata.
+
+    Every image file in the tree is hashed, including re-exported or resized copies
+    whose EXIF metadata was stripped, which are not in PicMapper image metadata.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(
+            self, image_path, image_meta=None, is_dam_separated=False, workers=1,
+            logger=None):
+        """Constructor.
+
+        Args:
+            image_path (str): root path for image files.
+            image_meta (dict): {relfname: DamMeta, ...}, as in
+                PicMapper.all_data[ALL_DATA_KEYS.IMAGE_META], for the metadata of
+                images that have it.
+            is_dam_separated (bool): True if images are organized in arroyo/dam/image
+                directories, False for arroyo/image directories.
+            workers (int): number of processes hashing images in parallel.  If 1,
+                hash images serially on the calling thread.
+            logger (object): logger for recording messages to file or command line.
+        """
+        self.image_path = image_path
+        self.image_meta = image_meta or {}
+        self.is_dam_separated = is_dam_separated
+        self.workers = workers
+        self._logger = logger
+        # {relfname: hash}
+        self.hashes = None
+        self._clusters = None
+
+    # ...............................................
+    def _log(self, msg):
+        if self._logger is not None:
+            self._logger.log(INFO, msg)
+        else:
+            print(msg)
+
+    # ...............................................
+    def compute_hashes(self):
+        """Compute the dHash of every image file under image_path.
+
+        Returns:
+            count of images hashed.
+        """
+        files = {}
+        for _arr, _dam, entry in walk_image_tree(
+                self.image_path, is_dam_separated=self.is_dam_separated):
+            files[os.path.relpath(entry.path, self.image_path)] = entry.path
+        relfnames = sorted(files.keys())
+        fullfnames = [files[relfname] for relfname in relfnames]
+        if self.workers > 1:
+            self._log(f"Hashing {len(relfnames)} images with {self.workers} processes")
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(
+                    dhash, fullfnames,
+                    chunksize=max(1, len(relfnames) // (self.workers * 4))))
+        else:
+            results = map(dhash, fullfnames)
+        self.hashes = {}
+        for relfname, (hsh, msg) in zip(relfnames, results):
+            if hsh is None:
+                if self._logger is not None:
+                    self._logger.error(msg)
+                else:
+                    print(msg)
+            else:
+                self.hashes[relfname] = hsh
+        self._clusters = None
+        return len(self.hashes)
+
+    # ...............................................
+    def find_clusters(self, max_distance=NEAR_DUPE_DISTANCE):
+        """Group images connected by chains of hashes within a Hamming distance.
+
+        Args:
+            max_distance (int): maximum number of differing bits between the hashes
+                of neighboring images in a cluster.
+
+        Returns:
+            list of clusters of 2 or more images, each a sorted list of relfnames,
+                ordered by their first relfname.
+
+        Note:
+            Each image is looked up in a BK-tree of the images before it, so images
+            are compared only to hashes in the branches that can hold a match, not
+            to every other image.
+        """
+        if self.hashes is None:
+            self.compute_hashes()
+        relfnames = sorted(self.hashes.keys())
+        parent = list(range(len(relfnames)))
+
+        def _find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        tree = BKTree()
+        for i, relfname in enumerate(relfnames):
+            for _dist, j in tree.find(self.hashes[relfname], max_distance):
+                ri = _find(i)
+                rj = _find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+            tree.add(self.hashes[relfname], i)
+
+        groups = {}
+        for i, relfname in enumerate(relfnames):
+            try:
+                groups[_find(i)].append(relfname)
+            except KeyError:
+                groups[_find(i)] = [relfname]
+        self._clusters = [grp for grp in groups.values() if len(grp) > 1]
+        self._log(
+            f"Found {len(self._clusters)} clusters of near-duplicate images within "
+            f"{max_distance} bits")
+        return self._clusters
+
+    # ...............................................
+    def _member(self, relfname, first_hash):
+        hsh = self.hashes[relfname]
+        member = {
+            "relfname": relfname,
+            "dhash": f"{hsh:0{HASH_SIZE * HASH_SIZE // 4}x}",
+            "distance": hamming(hsh, first_hash),
+            "has_meta": relfname in self.image_meta,
+            IK.ARROYO_NAME: None,
+            IK.DAM_NAME: None,
+            IK.IMG_DATE: None,
+            IK.LON: None,
+            IK.LAT: None,
+            IK.CAMERA: None}
+        # Images without metadata, such as copies with stripped EXIF, have none
+        dimg = self.image_meta.get(relfname)
+        if dimg is not None:
+            member[IK.ARROYO_NAME] = dimg.arroyo_name
+            member[IK.DAM_NAME] = dimg.dam_name
+            member[IK.IMG_DATE] = dimg.img_date
+            member[IK.CAMERA] = dimg.guilty_party
+            if dimg.dd_ok:
+                member[IK.LON] = dimg.longitude
+                member[IK.LAT] = dimg.latitude
+        return member
+
+    # ...............................................
+    def write_report(self, out_fname, max_distance=NEAR_DUPE_DISTANCE):
+        """Write clusters of near-duplicate images, with metadata, to a JSON file.
+
+        Args:
+            out_fname (str): full filename of the JSON report.
+            max_distance (int): maximum number of differing bits between the hashes
+                of neighboring images in a cluster, if clusters were not yet found.
+
+        Returns:
+            count of clusters.
+
+        Note:
+            Each member records its hash distance from the first image in its cluster,
+            and the EXIF date and coordinates from its DamMeta, so copies of one
+            photograph with conflicting dates or locations can be reconciled.
+            Members without metadata have has_meta False and null metadata.
+        """
+        if self._clusters is None:
+            self.find_clusters(max_distance=max_distance)
+        clusters = []
+        for grp in self._clusters:
+            first_hash = self.hashes[grp[0]]
+            clusters.append([self._member(relfname, first_hash) for relfname in grp])
+        report = {
+            "hash_size": HASH_SIZE,
+            "image_count": len(self.hashes),
+            "cluster_count": len(clusters),
+            "clusters": clusters}
+        with open(out_fname, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        self._log(f"Wrote {len(clusters)} clusters of near-duplicates to {out_fname}")
+        return len(clusters)
+
+
+# ..............................................................................
+if __name__ == "__main__":
+    from dammap.common.metacache import MetaCache
+    from dammap.common.util import get_logger
+    from dammap.transform.dam_map import PicMapper
+
+    parser = argparse.ArgumentParser(
+        description="Find visually identical image files, by perceptual hash.")
+    parser.add_argument(
+        "--image_path", default=os.path.join(MAC_PATH, AGG_DIR),
+        help="Root path for image files.")
+    parser.add_argument(
+        "--is_dam_separated", action="store_true",
+        help="Images are organized in arroyo/dam/image directories.")
+    parser.add_argument(
+        "--max_distance", type=int, default=NEAR_DUPE_DISTANCE,
+        help="Maximum number of differing hash bits between near-duplicates.")
+    parser.add_argument(
+        "--out_fname",
+        default=os.path.join(MAC_PATH, OUT_DIR, NEAR_DUPES_REPORT_FNAME),
+        help="Full filename of the JSON report.")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="Number of processes reading images.")
+    args = parser.parse_args()
+
+    outpath = os.path.join(MAC_PATH, OUT_DIR)
+    logger, _logfname = get_logger(outpath, logname="near_dupes")
+    meta_cache = MetaCache(
+        os.path.join(outpath, META_CACHE_FNAME), MAC_PATH, logger=logger)
+    pm = PicMapper(args.image_path, meta_cache=meta_cache, logger=logger)
+    pm.populate_images(is_dam_separated=args.is_dam_separated, workers=args.workers)
+    meta_cache.close()
+
+    near_duper = NearDuper(
+        args.image_path, image_meta=pm.all_data[ADK.IMAGE_META],
+        is_dam_separated=args.is_dam_separated, workers=args.workers, logger=logger)
+    near_duper.write_report(args.out_fname, max_distance=args.max_distance)
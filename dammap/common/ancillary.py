@@ -0,0 +1,324 @@
+# Ancillary vector data, loaded once and indexed for batched image coordinate queries
+import heapq
+from logging import WARN
+import numpy as np
+import os
+from osgeo import ogr, osr
+
+from dammap.common.constants import (
+    DRAINAGE_NAME_FIELD, FLOW_CELL_SIZE, FLOW_MAX_DISTANCE, FLOW_NODE_TOLERANCE)
+from dammap.common.spatial import (
+    PolygonIndex, SegmentIndex, metric_srs, set_xy_axis_order)
+
+
+# .............................................................................
+def _list_vector_files(vector_path):
+    """List shapefiles in a directory, or a single vector file.
+
+    Args:
+        vector_path (str): directory of shapefiles, or full filename of a vector file.
+
+    Returns:
+        sorted list of full filenames.
+    """
+    if os.path.isdir(vector_path):
+        return sorted(
+            os.path.join(vector_path, fname) for fname in os.listdir(vector_path)
+            if fname.lower().endswith(".shp") and not fname.startswith("."))
+    return [vector_path]
+
+
+# .............................................................................
+def _read_layer_geometries(vector_fname, name_field):
+    """Read the geometries of a vector file, projected to METRIC_CRS.
+
+    Args:
+        vector_fname (str): full filename of a vector file readable by OGR.
+        name_field (str): attribute holding the name of each feature.  If the layer
+            has no such attribute, features are named by the file basename.  If None,
+            features are named by their feature id.
+
+    Yields:
+        (name, ogr.Geometry) for each feature with a geometry.
+
+    Raises:
+        Exception: on a file OGR cannot open, or a layer without a spatial reference.
+    """
+    ds = ogr.Open(vector_fname)
+    if ds is None:
+        raise Exception(f"Unable to open vector file {vector_fname}")
+    lyr = ds.GetLayer(0)
+    src_srs = lyr.GetSpatialRef()
+    if src_srs is None:
+        raise Exception(f"Vector file {vector_fname} has no spatial reference")
+    transform = osr.CoordinateTransformation(
+        set_xy_axis_order(src_srs.Clone()), metric_srs())
+    name_idx = -1
+    if name_field is not None:
+        name_idx = lyr.GetLayerDefn().GetFieldIndex(name_field)
+    default_name = os.path.splitext(os.path.basename(vector_fname))[0]
+    for feat in lyr:
+        geom = feat.GetGeometryRef()
+        if geom is None:
+            continue
+        geom = geom.Clone()
+        geom.Transform(transform)
+        if name_field is None:
+            name = feat.GetFID()
+        elif name_idx >= 0 and feat.IsFieldSet(name_idx):
+            name = feat.GetField(name_idx)
+        else:
+            name = default_name
+        yield name, geom
+    ds = None
+
+
+# .............................................................................
+def _polygon_rings(geom):
+    """List the rings of all parts of a polygon or multipolygon.
+
+    Args:
+        geom (ogr.Geometry): polygon or multipolygon.
+
+    Returns:
+        list of [(x, y), ...] for each ring, empty for other geometry types.
+    """
+    gtype = ogr.GT_Flatten(geom.GetGeometryType())
+    if gtype == ogr.wkbPolygon:
+        return [
+            geom.GetGeometryRef(i).GetPoints()
+            for i in range(geom.GetGeometryCount())]
+    if gtype == ogr.wkbMultiPolygon:
+        rings = []
+        for i in range(geom.GetGeometryCount()):
+            rings.extend(_polygon_rings(geom.GetGeometryRef(i)))
+        return rings
+    return []
+
+
+# .............................................................................
+def _line_parts(geom):
+    """List the vertices of all parts of a line or multiline.
+
+    Args:
+        geom (ogr.Geometry): line string or multi line string.
+
+    Returns:
+        list of [(x, y), ...] for each part, empty for other geometry types.
+    """
+    gtype = ogr.GT_Flatten(geom.GetGeometryType())
+    if gtype == ogr.wkbLineString:
+        return [geom.GetPoints()]
+    if gtype == ogr.wkbMultiLineString:
+        return [
+            geom.GetGeometryRef(i).GetPoints()
+            for i in range(geom.GetGeometryCount())]
+    return []
+
+
+# .............................................................................
+def read_drainage_index(drainage_path, name_field=DRAINAGE_NAME_FIELD, logger=None):
+    """Load drainage polygons once into an index for locating image coordinates.
+
+    Args:
+        drainage_path (str): directory of drainage polygon shapefiles, such as
+            ANC_DIR/DRAINAGE_DIR, or full filename of one polygon vector file.
+        name_field (str): attribute holding the drainage name.  Features of a file
+            without this attribute are named by the file basename.
+        logger (object): logger for recording messages to file or command line.
+
+    Returns:
+        dammap.common.spatial.PolygonIndex of drainage polygons in METRIC_CRS, keyed
+            by drainage name.
+
+    Raises:
+        Exception: on no polygons found in drainage_path.
+    """
+    index = PolygonIndex()
+    for vector_fname in _list_vector_files(drainage_path):
+        for name, geom in _read_layer_geometries(vector_fname, name_field):
+            rings = [ring for ring in _polygon_rings(geom) if len(ring) >= 3]
+            if rings:
+                index.insert(name, rings)
+    if len(index) == 0:
+        raise Exception(f"No drainage polygons found in {drainage_path}")
+    if logger is not None:
+        logger.info(f"Read {len(index)} drainage polygons from {drainage_path}")
+    return index
+
+
+# .............................................................................
+class FlowNetwork(object):
+    """Flowline network, loaded once, for snapping image coordinates to channels.
+
+    Flowline files carry no flow direction, so each line is assumed to be
+    digitized downstream, draining from its first to its last vertex; this is not
+    checked against elevation, and lines digitized upstream give wrong chainage.
+    read warns when the network topology suggests otherwise.  Lines whose ends are
+    within node_tolerance are joined, and the chainage of a point is its distance
+    along the network, downstream, to the outlet it drains to.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self, cell_size=FLOW_CELL_SIZE, node_tolerance=FLOW_NODE_TOLERANCE):
+        """Create an empty network.
+
+        Args:
+            cell_size (float): width and height, in meters, of the cells of the
+                segment index.
+            node_tolerance (float): distance, in meters, within which line ends are
+                joined.
+        """
+        self.segments = SegmentIndex(cell_size)
+        self.node_tolerance = node_tolerance
+        # (start node, end node) of each line in segments
+        self._ends = []
+        # Distance from the end of each line to its outlet, computed on first snap
+        self._outlet_dist = None
+
+    # ...............................................
+    def _node(self, x, y):
+        return (round(x / self.node_tolerance), round(y / self.node_tolerance))
+
+    # ...............................................
+    def add_line(self, flow_id, coords):
+        """Add a flowline to the network.
+
+        Args:
+            flow_id (object): identifier of the flowline.
+            coords (list): list of (x, y) vertices in METRIC_CRS, in flow direction.
+        """
+        if len(coords) < 2:
+            return
+        self.segments.insert_line(flow_id, coords)
+        self._ends.append((self._node(*coords[0][:2]), self._node(*coords[-1][:2])))
+        self._outlet_dist = None
+
+    # ...............................................
+    def _compute_outlet_distances(self):
+        """Compute the shortest distance downstream from each line end to an outlet.
+
+        Note:
+            Outlets are line ends that no line leaves.  Distances spread upstream
+            from all outlets at once, shortest first, so a line draining to more
+            than one outlet gets the nearest, and lines in a loop with no outlet get
+            NaN.
+        """
+        leaving = set()
+        entering = {}
+        for idx, (start, end) in enumerate(self._ends):
+            leaving.add(start)
+            try:
+                entering[end].append(idx)
+            except KeyError:
+                entering[end] = [idx]
+        heap = [(0.0, node) for node in entering if node not in leaving]
+        heapq.heapify(heap)
+        node_dist = {}
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if node in node_dist:
+                continue
+            node_dist[node] = dist
+            for idx in entering.get(node, []):
+                start = self._ends[idx][0]
+                if start not in node_dist:
+                    heapq.heappush(heap, (dist + self.segments.lengths[idx], start))
+        self._outlet_dist = np.array(
+            [node_dist.get(end, np.nan) for _start, end in self._ends],
+            dtype=np.float64)
+
+    # ...............................................
+    def junction_counts(self):
+        """Count nodes where lines join and where lines split.
+
+        Returns:
+            joins (int): count of nodes that two or more lines end at.
+            splits (int): count of nodes that two or more lines start at.
+
+        Note:
+            Drainage networks digitized downstream join far more often than they
+            split, so more splits than joins suggests lines digitized upstream.
+        """
+        starts = {}
+        ends = {}
+        for start, end in self._ends:
+            starts[start] = starts.get(start, 0) + 1
+            ends[end] = ends.get(end, 0) + 1
+        joins = sum(1 for count in ends.values() if count > 1)
+        splits = sum(1 for count in starts.values() if count > 1)
+        return joins, splits
+
+    # ...............................................
+    def snap(self, x, y, max_distance=FLOW_MAX_DISTANCE):
+        """Find the nearest flowline, the distance to it, and the chainage of points.
+
+        Args:
+            x (numpy.ndarray): eastings in METRIC_CRS, NaN for no coordinates.
+            y (numpy.ndarray): northings in METRIC_CRS, NaN for no coordinates.
+            max_distance (float): greatest distance, in meters, from a point to its
+                flowline.
+
+        Returns:
+            flow_ids (list): flow_id of the nearest flowline to each point, None for
+                points without coordinates or farther than max_distance.
+            distance (numpy.ndarray): perpendicular distance, in meters, from each
+                point to its flowline, NaN where flow_id is None.
+            chainage (numpy.ndarray): distance, in meters, from the point on the
+                flowline closest to each point, downstream to the outlet, NaN where
+                flow_id is None or the flowline has no outlet.
+        """
+        if self._outlet_dist is None:
+            self._compute_outlet_distances()
+        line_idx, distance, along = self.segments.nearest(x, y, max_distance)
+        chainage = np.full(len(line_idx), np.nan, dtype=np.float64)
+        good = line_idx >= 0
+        lengths = np.array(self.segments.lengths, dtype=np.float64)
+        chainage[good] = (
+            lengths[line_idx[good]] - along[good] + self._outlet_dist[line_idx[good]])
+        flow_ids = [
+            None if idx < 0 else self.segments.keys[idx] for idx in line_idx.tolist()]
+        return flow_ids, distance, chainage
+
+    # ...............................................
+    @classmethod
+    def read(
+            cls, flowline_fname, id_field=None, cell_size=FLOW_CELL_SIZE,
+            node_tolerance=FLOW_NODE_TOLERANCE, logger=None):
+        """Load a flowline vector file into a network.
+
+        Args:
+            flowline_fname (str): full filename of a line vector file, such as
+                ANC_DIR/FLOWLINE_FNAME.
+            id_field (str): attribute holding the flowline identifier; if None, use
+                the feature id.
+            cell_size (float): width and height, in meters, of the cells of the
+                segment index.
+            node_tolerance (float): distance, in meters, within which line ends are
+                joined.
+            logger (object): logger for recording messages to file or command line.
+
+        Returns:
+            FlowNetwork of all lines in flowline_fname, in METRIC_CRS.
+
+        Raises:
+            Exception: on no lines found in flowline_fname.
+        """
+        network = cls(cell_size=cell_size, node_tolerance=node_tolerance)
+        for flow_id, geom in _read_layer_geometries(flowline_fname, id_field):
+            for coords in _line_parts(geom):
+                network.add_line(flow_id, coords)
+        if len(network.segments) == 0:
+            raise Exception(f"No flowlines found in {flowline_fname}")
+        if logger is not None:
+            logger.info(
+                f"Read {len(network.segments.keys)} flowlines with "
+                f"{len(network.segments)} segments from {flowline_fname}")
+            joins, splits = network.junction_counts()
+            if splits > joins:
+                logger.log(
+                    WARN, f"Flowlines in {flowline_fname} split at {splits} nodes and "
+                          f"join at {joins}, so may be digitized upstream; chainage "
+                          f"assumes they are digitized downstream")
+        return network
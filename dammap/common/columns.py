@@ -0,0 +1,164 @@
+# Columnar arrays of image metadata common for anaya project
+import datetime
+import numpy as np
+
+from dammap.common.spatial import project_to_meters
+
+# Date ordinal for images without a valid date
+NO_DATE = -1
+
+
+# .............................................................................
+class ImageColumns(object):
+    """Columnar NumPy view of DamMeta objects, for batched spatial operations.
+
+    Row i of every array describes the image relfnames[i].  Images without valid
+    coordinates have NaN longitude and latitude, and NaN x and y.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self, image_meta):
+        """Build arrays from a dictionary of image metadata.
+
+        Args:
+            image_meta (dict): {relfname: DamMeta, ...}, as in
+                PicMapper.all_data[ALL_DATA_KEYS.IMAGE_META].
+        """
+        count = len(image_meta)
+        self.relfnames = list(image_meta.keys())
+        self.index = {relfname: i for i, relfname in enumerate(self.relfnames)}
+        self.longitude = np.full(count, np.nan, dtype=np.float64)
+        self.latitude = np.full(count, np.nan, dtype=np.float64)
+        self.arroyo_id = np.zeros(count, dtype=np.int32)
+        self.date_ordinal = np.full(count, NO_DATE, dtype=np.int64)
+        # Coordinates in meters, projected on first use
+        self._x = self._y = None
+        # Arroyo names, in order of first appearance; arroyo_id indexes this list
+        self.arroyo_names = []
+        arroyo_ids = {}
+        for i, dimg in enumerate(image_meta.values()):
+            if dimg.dd_ok:
+                self.longitude[i] = dimg.longitude
+                self.latitude[i] = dimg.latitude
+            try:
+                self.arroyo_id[i] = arroyo_ids[dimg.arroyo_name]
+            except KeyError:
+                arroyo_ids[dimg.arroyo_name] = len(self.arroyo_names)
+                self.arroyo_names.append(dimg.arroyo_name)
+                self.arroyo_id[i] = arroyo_ids[dimg.arroyo_name]
+            self.date_ordinal[i] = self._date_to_ordinal(dimg.img_date)
+
+    # ...............................................
+    @staticmethod
+    def _date_to_ordinal(date_seq):
+        try:
+            return datetime.date(*date_seq[:3]).toordinal()
+        except (TypeError, ValueError):
+            return NO_DATE
+
+    # ...............................................
+    def __len__(self):
+        return len(self.relfnames)
+
+    # ...............................................
+    def _project(self):
+        if self._x is None:
+            self._x, self._y = project_to_meters(self.longitude, self.latitude)
+
+    # ...............................................
+    @property
+    def x(self):
+        """Eastings of image coordinates, in meters in METRIC_CRS."""
+        self._project()
+        return self._x
+
+    # ...............................................
+    @property
+    def y(self):
+        """Northings of image coordinates, in meters in METRIC_CRS."""
+        self._project()
+        return self._y
+
+    # ...............................................
+    @property
+    def has_geo(self):
+        """Boolean mask of images with valid coordinates."""
+        return ~np.isnan(self.longitude)
+
+    # ...............................................
+    def in_bbox(self, bbox):
+        """Boolean mask of images with coordinates within a bounding box.
+
+        Args:
+            bbox (tuple): bounds in (min_x, min_y, max_x, max_y) format.
+
+        Returns:
+            numpy.ndarray of bool, False for images without coordinates.
+        """
+        with np.errstate(invalid="ignore"):
+            return (
+                (self.longitude >= bbox[0]) & (self.longitude <= bbox[2]) &
+                (self.latitude >= bbox[1]) & (self.latitude <= bbox[3]))
+
+    # ...............................................
+    def extent(self, mask=None):
+        """Bounds of image coordinates.
+
+        Args:
+            mask (numpy.ndarray): optional boolean mask of images to include.
+
+        Returns:
+            (min_x, min_y, max_x, max_y), or None if no images have coordinates.
+        """
+        good = self.has_geo
+        if mask is not None:
+            good &= mask
+        if not good.any():
+            return None
+        x = self.longitude[good]
+        y = self.latitude[good]
+        return (float(x.min()), float(y.min()), float(x.max()), float(y.max()))
+
+    # ...............................................
+    def group_by_arroyo(self, mask=None):
+        """Indices of images in each arroyo.
+
+        Args:
+            mask (numpy.ndarray): optional boolean mask of images to include.
+
+        Returns:
+            dict of {arroyo_name: numpy.ndarray of indices, ...}, in order of first
+                appearance.
+        """
+        if mask is None:
+            idxs = np.arange(len(self))
+        else:
+            idxs = np.flatnonzero(mask)
+        groups = {}
+        ids = self.arroyo_id[idxs]
+        # Stable sort keeps original order within each arroyo
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        idxs = idxs[order]
+        bounds = np.flatnonzero(np.diff(ids)) + 1
+        for grp in np.split(idxs, bounds):
+            if len(grp) > 0:
+                groups[self.arroyo_names[self.arroyo_id[grp[0]]]] = grp
+        return {name: groups[name] for name in self.arroyo_names if name in groups}
+
+    # ...............................................
+    def distance_matrix(self, rows, cols):
+        """Euclidean distances, in meters, between two sets of images.
+
+        Args:
+            rows (numpy.ndarray): indices of images for matrix rows.
+            cols (numpy.ndarray): indices of images for matrix columns.
+
+        Returns:
+            numpy.ndarray of shape (len(rows), len(cols)); NaN where either image has
+                no coordinates.
+        """
+        dx = self.x[rows][:, np.newaxis] - self.x[cols][np.newaxis, :]
+        dy = self.y[rows][:, np.newaxis] - self.y[cols][np.newaxis, :]
+        return np.sqrt(dx * dx + dy * dy)
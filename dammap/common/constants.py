@@ -9,23 +9,48 @@ ALL_DATA_DIR = "dams_aggregate"
 SURVEY_DIR = "2025_survey"
 SURVEY_DAMSEP_DIR = "dams_2025_damsep"
 ANC_DIR = "ancillary"
+# Subdirectory of ANC_DIR with drainage polygon shapefiles, and their name attribute
+DRAINAGE_DIR = "USGS"
+DRAINAGE_NAME_FIELD = "Name"
+# Flowline shapefile in ANC_DIR
+FLOWLINE_FNAME = "flowline_140814.shp"
+# Flowline segment grid cell size, and farthest image snapped to a flowline, meters
+FLOW_CELL_SIZE = 50.0
+FLOW_MAX_DISTANCE = 500.0
+# Flowline ends closer than this, in meters, are joined in the network
+FLOW_NODE_TOLERANCE = 0.01
 OUT_DIR ="outdam"
 AGG_DIR = "dams_aggregate"
 THUMB_DIR = "thumb"
 THUMB_DIR_SMALL = "small_thumb"
+RESIZE_DIR = "resize"
 SAT_FNAME = "op140814.tif"
 RESIZE_WIDTH = 500
 SAT_IMAGE_FNAME = "op140814.tif"
 DUPES_FNAME = "duplicate_coords"
 DUPES_SHPFNAME = "analyze/anaya_overlaps.shp"
+META_CACHE_FNAME = "image_meta_cache.sqlite"
+MANIFEST_FNAME = "image_manifest.json"
 DAM_PREFIX = "dam"
 
-DAM_BUFFER = .005
+# Distances between images are in meters, in METRIC_CRS; about .005 decimal degrees
+DAM_BUFFER = 500.0
 THUMB_WIDTH = 2000
-# (Decimal degrees, meters latitude); longitude slightly less
-BIG_DISTANCE = (0.0001, 11.1)
+SMALL_THUMB_WIDTH = 150
+# Meters; about .0001 decimal degrees latitude, longitude slightly less
+BIG_DISTANCE = 11.1
+# Early images matched to ground-truth dams per batch of distance matrix rows
+MATCH_CHUNK_ROWS = 1024
 
 
+# NAD 1983 StatePlane New Mexico Central (ESRI:102713, see docs/notes.md), with
+# meters instead of US survey feet, for distances between image coordinates
+METRIC_CRS = (
+    "+proj=tmerc +lat_0=31 +lon_0=-106.25 +k=0.9999 +x_0=500000 +y_0=0 "
+    "+ellps=GRS80 +datum=NAD83 +units=m +no_defs")
+# Most point-edge pairs compared in one array by point-in-polygon tests
+PIP_CHUNK_CELLS = 1000000
+
 MAX_Y = 35.45045
 MIN_Y = 35.43479
 MAX_X = -106.05353
@@ -45,6 +70,8 @@ PARENS = ["(", ")"]
 DELETES = ["'", ""]
 
 IMAGE_EXTENSIONS = (".jpg", ".tif", ".tiff")
+# Bytes read from the start of a JPEG file to find EXIF metadata (APP1 max is 64 KB)
+EXIF_READ_BYTES = 128 * 1024
 
 # Metadata for all dam data
 class ALL_DATA_KEYS ():
@@ -65,6 +92,8 @@ class IMAGE_KEYS():
     # Data from directory and filenames
     FILE_PATH = "fullpath"
     THUMB = "thumb"
+    THUMB_KML = "thumb_kml"
+    THUMB_SMALL = "thumb_sm"
     BASE_NAME = "basename"
     ARROYO_NAME = "arroyo"
     ARROYO_NUM = "arroyo_num"
@@ -90,10 +119,23 @@ class IMAGE_KEYS():
     Y_SEC = "y_sec"
     IN_BNDS = "in_bounds"
     NO_GEO = "no_geo"
+    # Computed from coordinates of all images
+    CLUSTER = "cluster"
+    # Drainage polygon containing the image coordinates, from ancillary data
+    DRAINAGE = "drainage"
+    # Nearest flowline, distance to it, and distance along the channel network to its
+    # outlet, in meters, from ancillary data
+    FLOW_ID = "flow_id"
+    FLOW_DIST = "flow_dist"
+    CHAINAGE = "chainage"
+    # Camera make and model, from image files, not written to outputs
+    CAMERA = "camera"
 
 SHP_FIELDS = [
     (IMAGE_KEYS.FILE_PATH, OFTString),
     (IMAGE_KEYS.THUMB, OFTString),
+    (IMAGE_KEYS.THUMB_KML, OFTString),
+    (IMAGE_KEYS.THUMB_SMALL, OFTString),
     (IMAGE_KEYS.BASE_NAME, OFTString),
     (IMAGE_KEYS.ARROYO_NAME, OFTString),
     (IMAGE_KEYS.ARROYO_NUM, OFTInteger),
@@ -117,7 +159,54 @@ SHP_FIELDS = [
     (IMAGE_KEYS.Y_MIN, OFTInteger),
     (IMAGE_KEYS.Y_SEC, OFTReal),
     (IMAGE_KEYS.IN_BNDS, OFTInteger),
-    (IMAGE_KEYS.NO_GEO, OFTInteger)
+    (IMAGE_KEYS.NO_GEO, OFTInteger),
+    (IMAGE_KEYS.CLUSTER, OFTInteger),
+    (IMAGE_KEYS.DRAINAGE, OFTString),
+    (IMAGE_KEYS.FLOW_ID, OFTString),
+    (IMAGE_KEYS.FLOW_DIST, OFTReal),
+    (IMAGE_KEYS.CHAINAGE, OFTReal)
+    ]
+# Fields of SHP_FIELDS by type, for typed formats other than shapefiles
+INTEGER_FIELDS = tuple(fld for fld, fldtype in SHP_FIELDS if fldtype == OFTInteger)
+REAL_FIELDS = tuple(fld for fld, fldtype in SHP_FIELDS if fldtype == OFTReal)
+
+# Point file of coordinates shared by more than one image, one feature per point
+DUPES_SHP_FIELDS = [
+    ("img_count", OFTInteger),
+    ("arroyo_ct", OFTInteger),
+    ("arroyos", OFTString),
+    ("first_img", OFTString)
+    ]
+# Columns of the CSV duplicate coordinates report, one row per image
+DUPES_CSV_FIELDS = [
+    "group", "img_count", "arroyo_ct", IMAGE_KEYS.WKT, IMAGE_KEYS.ARROYO_NAME,
+    "relfname", IMAGE_KEYS.VERB_LON, IMAGE_KEYS.VERB_LAT, IMAGE_KEYS.CAMERA
+    ]
+
+# OGR drivers for vector outputs, by filename extension
+VECTOR_DRIVERS = {
+    ".shp": "ESRI Shapefile",
+    ".gpkg": "GPKG",
+    ".fgb": "FlatGeobuf"
+    }
+# Features written per transaction, for drivers supporting transactions
+FEATURE_BATCH = 10000
+
+# KML template in the data directory, and placemarks written per buffered chunk
+KML_TEMPLATE_FNAME = "kmlTemplate.kml"
+KML_BATCH = 1000
+# Region-tiled KML: most placemarks in a tile before splitting into quadrants, deepest
+# split, and on-screen size of a tile, in pixels, at which it is loaded
+KML_TILE_MAX = 100
+KML_TILE_DEPTH = 12
+KML_LOD_PIXELS = 256
+KML_TILE_DIR = "tiles"
+
+# Thumbnail (width, subdirectory of OUT_DIR, record field), largest first
+THUMB_SIZES = [
+    (THUMB_WIDTH, THUMB_DIR, IMAGE_KEYS.THUMB),
+    (RESIZE_WIDTH, RESIZE_DIR, IMAGE_KEYS.THUMB_KML),
+    (SMALL_THUMB_WIDTH, THUMB_DIR_SMALL, IMAGE_KEYS.THUMB_SMALL)
     ]
 
 
@@ -1,13 +1,55 @@
 import exifread
+import io
 from logging import INFO, WARN, ERROR
 import os
 from PIL import Image
 
-from dammap.common.constants import (DATE_SEP, IMAGE_KEYS, IMG_META, SEPARATOR)
+from dammap.common.constants import (
+    DATE_SEP, EXIF_READ_BYTES, IMAGE_KEYS, IMG_META, SEPARATOR, SHP_FIELDS)
 from dammap.common.util import ready_filename
 
+# Fieldnames of record rows, in output order
+RECORD_FIELDS = tuple(fldname for fldname, _fldtype in SHP_FIELDS)
+
+
 # .............................................................................
 class DamMeta(object):
+    """Metadata for one dam image, from its path, filename and image file metadata.
+
+    Attributes are held in __slots__ to keep many thousands of objects small.  Record
+    rows for output are computed on first access, and discarded when any attribute
+    written to the record is reassigned.
+    """
+    __slots__ = (
+        "_logger", "fullpath", "relfname", "basename",
+        "x_deg", "x_min", "x_sec", "x_dir", "y_deg", "y_min", "y_sec", "y_dir",
+        "longitude", "latitude",
+        "cluster_id", "resolved_longitude", "resolved_latitude", "drainage",
+        "flow_id", "flow_dist", "chainage",
+        "verbatim_longitude", "verbatim_latitude",
+        "verbatim_longitude_direction", "verbatim_latitude_direction",
+        "img_date", "thumb", "thumb_kml", "thumb_small", "in_bounds",
+        "arroyo_num", "arroyo_name",
+        "dam_name", "dam_date", "dam_calc", "dam_calc_dist", "picnum",
+        "wkt", "guilty_party", "has_meta",
+        "_row", "_csv_row")
+
+    # Attributes written to records; reassigning one discards cached rows
+    _RECORD_ATTRS = frozenset((
+        "fullpath", "thumb", "thumb_kml", "thumb_small", "basename",
+        "arroyo_name", "arroyo_num", "dam_name",
+        "picnum", "dam_date", "img_date", "longitude", "latitude", "wkt",
+        "verbatim_longitude", "verbatim_latitude",
+        "verbatim_longitude_direction", "verbatim_latitude_direction",
+        "x_dir", "x_deg", "x_min", "x_sec", "y_dir", "y_deg", "y_min", "y_sec",
+        "in_bounds", "cluster_id", "drainage", "flow_id", "flow_dist", "chainage"))
+
+    # Record field for each thumbnail attribute
+    _THUMB_ATTRS = {
+        IMAGE_KEYS.THUMB: "thumb",
+        IMAGE_KEYS.THUMB_KML: "thumb_kml",
+        IMAGE_KEYS.THUMB_SMALL: "thumb_small"}
+
     # ............................................................................
     # Constructor
     # .............................................................................
@@ -21,7 +63,8 @@ class DamMeta(object):
             longitude=None, latitude=None,
             x_dir=None, x_deg=None, x_min=None, x_sec=None,
             y_dir=None, y_deg=None, y_min=None, y_sec=None,
-            in_bounds=None, no_geo=None, is_dam_separated=False, logger=None):
+            in_bounds=None, no_geo=None, is_dam_separated=False, img_meta=None,
+            cache=None, logger=None):
         """Create a dam object from an image file.
 
         Args:
@@ -34,7 +77,8 @@ class DamMeta(object):
             dam_name (str): name of the dam as determined by the file (arroyo) name
             dam_date (str): date of the dam as determined by the file name
             dam_calc (str): closest 2025 dam name, calculated by distance.
-            dam_calc_dist (real): distance from 2025 dam calculated as closest.
+            dam_calc_dist (real): distance in meters from 2025 dam calculated as
+                closest.
             picnum (str): number of the image file as determined by the file name
             img_date (str): date of the image as determined by the image file metadata
             verbatim_longitude (str): longitude value of the image as reported by the
@@ -65,14 +109,20 @@ class DamMeta(object):
             y_min (int): latitude minutes, as read from the image metadata.
             y_sec (float): latitude seconds, as read from the image metadata.
             in_bounds (int): 1 if within the extent of some externally provided bounding box
+            img_meta (dict): values previously parsed from the image file metadata by
+                read_image_meta.  If provided, the image file is not opened.
+            cache (dammap.common.metacache.MetaCache): cache of parsed image metadata,
+                consulted before opening the image file.
             logger (object): logger for recording messages to file or command line.
         """
+        self._row = None
+        self._csv_row = None
         self._logger = logger
         self.fullpath = fullpath
-        self._relative_path_idx = len(basepath)
+        relative_path_idx = len(basepath)
         if not basepath.endswith(os.sep):
-            self._relative_path_idx += 1
-        self.relfname = self.fullpath[self._relative_path_idx:]
+            relative_path_idx += 1
+        self.relfname = self.fullpath[relative_path_idx:]
         self.basename = os.path.basename(self.relfname)
         self.x_deg = x_deg
         self.x_min = x_min
@@ -84,20 +134,33 @@ class DamMeta(object):
         self.y_dir = y_dir
         self.longitude = longitude
         self.latitude = latitude
+        # Buffer cluster and its coordinates, assigned by PicMapper.cluster_images
+        self.cluster_id = None
         self.resolved_longitude = None
         self.resolved_latitude = None
+        # Name of the drainage polygon containing the image, assigned by
+        # PicMapper.tag_drainages
+        self.drainage = None
+        # Nearest flowline, distance to it and channel distance to the outlet, in
+        # meters, assigned by PicMapper.snap_to_flowlines
+        self.flow_id = None
+        self.flow_dist = None
+        self.chainage = None
         self.verbatim_longitude = verbatim_longitude
         self.verbatim_latitude = verbatim_latitude
         self.verbatim_longitude_direction = verbatim_longitude_direction
         self.verbatim_latitude_direction = verbatim_latitude_direction
         self.img_date = img_date
         self.thumb = thumb
+        self.thumb_kml = None
+        self.thumb_small = None
         self.in_bounds = in_bounds
         self.arroyo_num = arroyo_num
         self.arroyo_name = arroyo_name
         self.dam_name = dam_name
         self.dam_date = dam_date
         self.dam_calc = dam_calc
+        self.dam_calc_dist = dam_calc_dist
         self.picnum = picnum
         self.wkt = None
         self.guilty_party = "unknown"
@@ -117,25 +180,77 @@ class DamMeta(object):
         if None in (
                 x_deg, x_min, x_sec, x_dir, y_deg, y_min, y_sec, y_dir,
                 longitude, latitude):
-            tags, self.guilty_party = DamMeta.get_image_metadata(self.fullpath, self._logger)
-            if tags is not None and len(tags) > 0:
-                self.img_date = DamMeta.get_camera_date(tags, self._logger)
-                xydd, xdms, ydms, verbatim_coordinates = self._get_coordinates(tags)
-                if None not in (xydd, xdms, ydms, verbatim_coordinates):
-                    (self.verbatim_longitude,
-                     self.verbatim_longitude_direction,
-                     self.verbatim_latitude,
-                     self.verbatim_latitude_direction) = verbatim_coordinates
-                    (self.x_deg, self.x_min, self.x_sec, self.x_dir) = xdms
-                    (self.y_deg, self.y_min, self.y_sec, self.y_dir) = ydms
-                    # Limit these to 7 digits past decimal point
-                    self.longitude = float(f"{xydd[0]:.7f}")
-                    self.latitude = float(f"{xydd[1]:.7f}")
-                self.set_wkt()
-                if is_dam_separated and self.img_date[0] == 2025:
-                    self.dam_calc_dist = 0
-            else:
-                self.has_meta = False
+            if img_meta is None:
+                if cache is not None:
+                    img_meta = cache.get(self.fullpath)
+                if img_meta is None:
+                    img_meta = DamMeta.read_image_meta(self.fullpath, self._logger)
+                    if cache is not None:
+                        cache.put(self.fullpath, img_meta)
+            self._set_image_meta(img_meta, is_dam_separated)
+
+    # ...............................................
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in DamMeta._RECORD_ATTRS:
+            object.__setattr__(self, "_row", None)
+            object.__setattr__(self, "_csv_row", None)
+
+    # ...............................................
+    def _set_image_meta(self, img_meta, is_dam_separated):
+        self.guilty_party = img_meta[IMAGE_KEYS.CAMERA]
+        if img_meta[IMAGE_KEYS.IMG_DATE] is not None:
+            self.img_date = img_meta[IMAGE_KEYS.IMG_DATE]
+            if img_meta[IMAGE_KEYS.LON] is not None:
+                self.verbatim_longitude = img_meta[IMAGE_KEYS.VERB_LON]
+                self.verbatim_longitude_direction = img_meta[IMAGE_KEYS.VERB_LON_DIR]
+                self.verbatim_latitude = img_meta[IMAGE_KEYS.VERB_LAT]
+                self.verbatim_latitude_direction = img_meta[IMAGE_KEYS.VERB_LAT_DIR]
+                self.x_deg = img_meta[IMAGE_KEYS.X_DEG]
+                self.x_min = img_meta[IMAGE_KEYS.X_MIN]
+                self.x_sec = img_meta[IMAGE_KEYS.X_SEC]
+                self.x_dir = img_meta[IMAGE_KEYS.X_DIR]
+                self.y_deg = img_meta[IMAGE_KEYS.Y_DEG]
+                self.y_min = img_meta[IMAGE_KEYS.Y_MIN]
+                self.y_sec = img_meta[IMAGE_KEYS.Y_SEC]
+                self.y_dir = img_meta[IMAGE_KEYS.Y_DIR]
+                self.longitude = img_meta[IMAGE_KEYS.LON]
+                self.latitude = img_meta[IMAGE_KEYS.LAT]
+            self.set_wkt()
+            if is_dam_separated and self.img_date[0] == 2025:
+                self.dam_calc_dist = 0
+        else:
+            self.has_meta = False
+
+    # ...............................................
+    @property
+    def image_meta(self):
+        """Values read from the image file metadata, in the format of read_image_meta.
+
+        Returns:
+            img_meta (dict): parsed image metadata, keyed by IMAGE_KEYS.
+        """
+        img_date = None
+        if self.has_meta:
+            img_date = self.img_date
+        return {
+            IMAGE_KEYS.CAMERA: self.guilty_party,
+            IMAGE_KEYS.IMG_DATE: img_date,
+            IMAGE_KEYS.VERB_LON: self.verbatim_longitude,
+            IMAGE_KEYS.VERB_LON_DIR: self.verbatim_longitude_direction,
+            IMAGE_KEYS.VERB_LAT: self.verbatim_latitude,
+            IMAGE_KEYS.VERB_LAT_DIR: self.verbatim_latitude_direction,
+            IMAGE_KEYS.X_DEG: self.x_deg,
+            IMAGE_KEYS.X_MIN: self.x_min,
+            IMAGE_KEYS.X_SEC: self.x_sec,
+            IMAGE_KEYS.X_DIR: self.x_dir,
+            IMAGE_KEYS.Y_DEG: self.y_deg,
+            IMAGE_KEYS.Y_MIN: self.y_min,
+            IMAGE_KEYS.Y_SEC: self.y_sec,
+            IMAGE_KEYS.Y_DIR: self.y_dir,
+            IMAGE_KEYS.LON: self.longitude,
+            IMAGE_KEYS.LAT: self.latitude,
+        }
 
     # # ...............................................
     # def set_logger(self, logger):
@@ -223,6 +338,35 @@ class DamMeta(object):
 
         return valstr
 
+    # ...............................................
+    @staticmethod
+    def _read_exif_tags(f):
+        """Read EXIF tags, skipping MakerNotes and thumbnails.
+
+        Args:
+            f (file): image file opened in binary mode.
+
+        Returns:
+            tags (dict): exifread tags
+
+        Note:
+            The EXIF (APP1) segment of a JPEG file is at most 64 KB and near the start
+            of the file, so only a bounded prefix of JPEG files is read.  TIFF IFDs may
+            be anywhere in the file, so TIFF files are read by exifread directly.
+        """
+        tags = None
+        head = f.read(EXIF_READ_BYTES)
+        if head[:2] == b"\xff\xd8":
+            try:
+                tags = exifread.process_file(
+                    io.BytesIO(head), details=False, extract_thumbnail=False)
+            except Exception:
+                tags = None
+        # TIFF, or EXIF was not found within the prefix
+        if not tags:
+            tags = exifread.process_file(f, details=False, extract_thumbnail=False)
+        return tags
+
     # ...............................................
     @staticmethod
     def get_image_metadata(fullname, logger=None):
@@ -232,8 +376,8 @@ class DamMeta(object):
         try:
             # Open file in binary mode
             f = open(fullname, "rb")
-            # Get Exif tags
-            tags = exifread.process_file(f)
+            # Get Exif tags, only GPS, date, and camera tags are used
+            tags = DamMeta._read_exif_tags(f)
         except Exception as e:
             # print, do not log
             print(f"   ** exifread unable to process file {fullname}: {e}")
@@ -268,6 +412,76 @@ class DamMeta(object):
                             break
         return tags, guilty_party
 
+    # ...............................................
+    @staticmethod
+    def read_image_meta(fullname, logger=None):
+        """Read the GPS, date and camera values from an image file.
+
+        Args:
+            fullname (str): full path to the image file.
+            logger (object): logger for recording messages to file or command line.
+
+        Returns:
+            img_meta (dict): parsed image metadata, keyed by IMAGE_KEYS.  IMG_DATE is
+                None if the file has no usable metadata, LON and LAT (and the other
+                coordinate values) are None if coordinates could not be parsed.
+        """
+        tags, guilty_party = DamMeta.get_image_metadata(fullname, logger)
+        return DamMeta.parse_image_tags(tags, guilty_party, logger)
+
+    # ...............................................
+    @staticmethod
+    def parse_image_tags(tags, guilty_party, logger=None):
+        """Parse the GPS, date and camera values from exifread tags.
+
+        Args:
+            tags (dict): exifread tags returned by get_image_metadata.
+            guilty_party (str): camera make and model.
+            logger (object): logger for recording messages to file or command line.
+
+        Returns:
+            img_meta (dict): parsed image metadata, keyed by IMAGE_KEYS.
+        """
+        img_meta = {
+            IMAGE_KEYS.CAMERA: guilty_party,
+            IMAGE_KEYS.IMG_DATE: None,
+            IMAGE_KEYS.VERB_LON: None,
+            IMAGE_KEYS.VERB_LON_DIR: None,
+            IMAGE_KEYS.VERB_LAT: None,
+            IMAGE_KEYS.VERB_LAT_DIR: None,
+            IMAGE_KEYS.X_DEG: None,
+            IMAGE_KEYS.X_MIN: None,
+            IMAGE_KEYS.X_SEC: None,
+            IMAGE_KEYS.X_DIR: None,
+            IMAGE_KEYS.Y_DEG: None,
+            IMAGE_KEYS.Y_MIN: None,
+            IMAGE_KEYS.Y_SEC: None,
+            IMAGE_KEYS.Y_DIR: None,
+            IMAGE_KEYS.LON: None,
+            IMAGE_KEYS.LAT: None,
+        }
+        if tags is not None and len(tags) > 0:
+            img_meta[IMAGE_KEYS.IMG_DATE] = DamMeta.get_camera_date(tags, logger)
+            xydd, xdms, ydms, verbatim_coordinates = DamMeta._get_coordinates(
+                tags, guilty_party, logger)
+            if None not in (xydd, xdms, ydms, verbatim_coordinates):
+                (img_meta[IMAGE_KEYS.VERB_LON],
+                 img_meta[IMAGE_KEYS.VERB_LON_DIR],
+                 img_meta[IMAGE_KEYS.VERB_LAT],
+                 img_meta[IMAGE_KEYS.VERB_LAT_DIR]) = verbatim_coordinates
+                (img_meta[IMAGE_KEYS.X_DEG],
+                 img_meta[IMAGE_KEYS.X_MIN],
+                 img_meta[IMAGE_KEYS.X_SEC],
+                 img_meta[IMAGE_KEYS.X_DIR]) = xdms
+                (img_meta[IMAGE_KEYS.Y_DEG],
+                 img_meta[IMAGE_KEYS.Y_MIN],
+                 img_meta[IMAGE_KEYS.Y_SEC],
+                 img_meta[IMAGE_KEYS.Y_DIR]) = ydms
+                # Limit these to 7 digits past decimal point
+                img_meta[IMAGE_KEYS.LON] = float(f"{xydd[0]:.7f}")
+                img_meta[IMAGE_KEYS.LAT] = float(f"{xydd[1]:.7f}")
+        return img_meta
+
     # ...............................................
     @staticmethod
     def get_camera_date(tags, logger):
@@ -278,11 +492,13 @@ class DamMeta(object):
             try:
                 date_tuple = [int(x) for x in dtstr.split(":")]
             except:
-                logger(WARN, f"datestr {dtstr} cannot be parsed into integers")
+                if logger is not None:
+                    logger.log(WARN, f"datestr {dtstr} cannot be parsed into integers")
         return date_tuple
 
     # ...............................................
-    def _get_location_vals(self, tags, locKey, dirKey):
+    @staticmethod
+    def _get_location_vals(tags, locKey, dirKey):
         dd = degrees = minutes = seconds = nsew = None
         isNegative = False
         # Get longitude or latitude
@@ -305,34 +521,36 @@ class DamMeta(object):
         return dd, degrees, minutes, seconds, nsew
 
     # ...............................................
-    def _get_coordinates(self, tags):
+    @staticmethod
+    def _get_coordinates(tags, guilty_party, logger):
         dd = xdms = ydms = verbatim_coordinates = None
         gpskeys = [k for k in tags.keys() if k.startswith("GPS")]
         if not gpskeys:
-            self._logger.log(
-                WARN, f"No GPS keys in {tags.keys()} for {self.guilty_party}")
+            logger.log(
+                WARN, f"No GPS keys in {tags.keys()} for {guilty_party}")
         else:
             # Are the GPS tags present?
             try:
                 verbatim_longitude = f"{tags[IMG_META.X_KEY]}"
                 verbatim_latitude = f"{tags[IMG_META.Y_KEY]}"
             except KeyError as e:
-                self._logger.log(
-                    WARN, f"Missing tag in {gpskeys} for {self.guilty_party}, {e}")
+                logger.log(
+                    WARN, f"Missing tag in {gpskeys} for {guilty_party}, {e}")
             else:
                 try:
                     verbatim_longitude_dir = f"{tags[IMG_META.X_DIR_KEY]}"
                     verbatim_latitude_dir = f"{tags[IMG_META.Y_DIR_KEY]}"
                 except KeyError as e:
-                    self._logger.log(
-                        WARN, f"Missing direction tag in {gpskeys} for {self.guilty_party}, {e}")
+                    logger.log(
+                        WARN,
+                        f"Missing direction tag in {gpskeys} for {guilty_party}, {e}")
                 else:
                     verbatim_coordinates = (
                         verbatim_longitude, verbatim_longitude_dir,
                         verbatim_latitude, verbatim_latitude_dir)
-                    xdd, xdeg, xmin, xsec, xdir = self._get_location_vals(
+                    xdd, xdeg, xmin, xsec, xdir = DamMeta._get_location_vals(
                         tags, IMG_META.X_KEY, IMG_META.X_DIR_KEY)
-                    ydd, ydeg, ymin, ysec, ydir = self._get_location_vals(
+                    ydd, ydeg, ymin, ysec, ydir = DamMeta._get_location_vals(
                         tags, IMG_META.Y_KEY, IMG_META.Y_DIR_KEY)
                     # Convert to desired format
                     dd = (xdd, ydd)
@@ -341,6 +559,29 @@ class DamMeta(object):
 
         return dd, xdms, ydms, verbatim_coordinates
 
+    # ...............................................
+    def set_thumb(self, fldname, thumb):
+        """Set the thumbnail filename for one thumbnail size.
+
+        Args:
+            fldname (str): record field for the thumbnail size, one of
+                IMAGE_KEYS.THUMB, THUMB_KML, or THUMB_SMALL.
+            thumb (str): filename of the thumbnail relative to a common directory path
+        """
+        setattr(self, DamMeta._THUMB_ATTRS[fldname], thumb)
+
+    # ...............................................
+    @property
+    def thumbs(self):
+        """Thumbnail filenames, keyed by record field.
+
+        Returns:
+            dict of {fldname: thumb}, for the thumbnails of this image.
+        """
+        return {
+            fldname: getattr(self, attr)
+            for fldname, attr in DamMeta._THUMB_ATTRS.items()}
+
     # ...............................................
     @property
     def dd_ok(self):
@@ -356,69 +597,83 @@ class DamMeta(object):
         if self.dd_ok:
             self.wkt = f"Point ({self.longitude:.7f}  {self.latitude:.7f})"
 
+    # ...............................................
+    @property
+    def row(self):
+        """Values for output, in the order of RECORD_FIELDS.
+
+        Returns:
+            tuple of values, cached until a recorded attribute is reassigned.
+
+        Note:
+            Lists such as img_date and dam_date are not copied; modifying them in
+            place does not refresh a cached row.
+        """
+        if self._row is None:
+            self._row = (
+                self.fullpath,
+                self.thumb,
+                self.thumb_kml,
+                self.thumb_small,
+                self.basename,
+                self.arroyo_name,
+                self.arroyo_num,
+                self.dam_name,
+                self.picnum,
+                self.dam_date,
+                self.img_date,
+                self.longitude,
+                self.latitude,
+                self.wkt,
+                self.verbatim_longitude,
+                self.verbatim_latitude,
+                self.verbatim_longitude_direction,
+                self.verbatim_latitude_direction,
+                self.x_dir,
+                self.x_deg,
+                self.x_min,
+                self.x_sec,
+                self.y_dir,
+                self.y_deg,
+                self.y_min,
+                self.y_sec,
+                self.in_bounds,
+                self.dd_ok,
+                self.cluster_id,
+                self.drainage,
+                self.flow_id,
+                self.flow_dist,
+                self.chainage)
+        return self._row
+
+    # ...............................................
+    @property
+    def row_for_csv(self):
+        """Values for CSV output, in the order of RECORD_FIELDS.
+
+        Returns:
+            tuple of values, with names, dates and verbatim coordinates as strings,
+                cached until a recorded attribute is reassigned.
+        """
+        if self._csv_row is None:
+            row = list(self.row)
+            for fldname in (
+                    IMAGE_KEYS.DAM_NAME, IMAGE_KEYS.IMG_DATE,
+                    IMAGE_KEYS.VERB_LON, IMAGE_KEYS.VERB_LAT):
+                idx = RECORD_FIELDS.index(fldname)
+                row[idx] = str(row[idx])
+            self._csv_row = tuple(row)
+        return self._csv_row
+
     # ...............................................
     @property
     def record(self):
-        return {
-            IMAGE_KEYS.FILE_PATH: self.fullpath,
-            IMAGE_KEYS.THUMB: self.thumb,
-            IMAGE_KEYS.BASE_NAME: self.basename,
-            IMAGE_KEYS.ARROYO_NAME: self.arroyo_name,
-            IMAGE_KEYS.ARROYO_NUM: self.arroyo_num,
-            IMAGE_KEYS.DAM_NAME: self.dam_name,
-            IMAGE_KEYS.PIC_NUM: self.picnum,
-            IMAGE_KEYS.DAM_DATE: self.dam_date,
-            IMAGE_KEYS.IMG_DATE: self.img_date,
-            IMAGE_KEYS.LON: self.longitude,
-            IMAGE_KEYS.LAT: self.latitude,
-            IMAGE_KEYS.WKT: self.wkt,
-            IMAGE_KEYS.VERB_LON: self.verbatim_longitude,
-            IMAGE_KEYS.VERB_LAT: self.verbatim_latitude,
-            IMAGE_KEYS.VERB_LON_DIR: self.verbatim_longitude_direction,
-            IMAGE_KEYS.VERB_LAT_DIR: self.verbatim_latitude_direction,
-            IMAGE_KEYS.X_DIR: self.x_dir,
-            IMAGE_KEYS.X_DEG: self.x_deg,
-            IMAGE_KEYS.X_MIN: self.x_min,
-            IMAGE_KEYS.X_SEC: self.x_sec,
-            IMAGE_KEYS.Y_DIR: self.y_dir,
-            IMAGE_KEYS.Y_DEG: self.y_deg,
-            IMAGE_KEYS.Y_MIN: self.y_min,
-            IMAGE_KEYS.Y_SEC: self.y_sec,
-            IMAGE_KEYS.IN_BNDS: self.in_bounds,
-            IMAGE_KEYS.NO_GEO: self.dd_ok
-        }
+        return dict(zip(RECORD_FIELDS, self.row))
 
     # ...............................................
     @property
     def record_for_csv(self):
-        return {
-            IMAGE_KEYS.FILE_PATH: self.fullpath,
-            IMAGE_KEYS.THUMB: self.thumb,
-            IMAGE_KEYS.BASE_NAME: self.basename,
-            IMAGE_KEYS.ARROYO_NAME: self.arroyo_name,
-            IMAGE_KEYS.ARROYO_NUM: self.arroyo_num,
-            IMAGE_KEYS.DAM_NAME: str(self.dam_name),
-            IMAGE_KEYS.PIC_NUM: self.picnum,
-            IMAGE_KEYS.DAM_DATE: self.dam_date,
-            IMAGE_KEYS.IMG_DATE: str(self.img_date),
-            IMAGE_KEYS.LON: self.longitude,
-            IMAGE_KEYS.LAT: self.latitude,
-            IMAGE_KEYS.WKT: self.wkt,
-            IMAGE_KEYS.VERB_LON: str(self.verbatim_longitude),
-            IMAGE_KEYS.VERB_LAT: str(self.verbatim_latitude),
-            IMAGE_KEYS.VERB_LON_DIR: self.verbatim_longitude_direction,
-            IMAGE_KEYS.VERB_LAT_DIR: self.verbatim_latitude_direction,
-            IMAGE_KEYS.X_DIR: self.x_dir,
-            IMAGE_KEYS.X_DEG: self.x_deg,
-            IMAGE_KEYS.X_MIN: self.x_min,
-            IMAGE_KEYS.X_SEC: self.x_sec,
-            IMAGE_KEYS.Y_DIR: self.y_dir,
-            IMAGE_KEYS.Y_DEG: self.y_deg,
-            IMAGE_KEYS.Y_MIN: self.y_min,
-            IMAGE_KEYS.Y_SEC: self.y_sec,
-            IMAGE_KEYS.IN_BNDS: self.in_bounds,
-            IMAGE_KEYS.NO_GEO: self.dd_ok
-        }
+        return dict(zip(RECORD_FIELDS, self.row_for_csv))
 
 """
 from dammap.common.dammeta import *
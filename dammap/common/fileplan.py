@@ -0,0 +1,435 @@
+"""Plan, check and execute batches of file renames and copies, with a journal."""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import shutil
+
+# Operations in a plan
+OP_RENAME = "rename"
+OP_COPY = "copy"
+# Journal events, one JSON object per line
+EVENT_PLAN = "plan"
+EVENT_START = "start"
+EVENT_DONE = "done"
+EVENT_COMPLETE = "complete"
+EVENT_UNDONE = "undone"
+EVENT_ROLLED_BACK = "rolled_back"
+
+
+# .............................................................................
+class FileOpPlan(object):
+    """Set of file renames and copies, checked in memory before any file is touched.
+
+    Renames (moves within a filesystem) and copies are added to the plan, then
+    resolve checks for missing sources and colliding destinations, and orders the
+    renames so that each destination is vacated before it is filled.  Renames that
+    form a cycle, such as swapping two names, are routed through a temporary name.
+    execute performs the renames serially, then the copies with a thread pool,
+    recording each step before and after it is performed in an optional JSON-lines
+    journal, so an interrupted plan can be resumed or rolled back.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self, logger=None):
+        """Create an empty plan.
+
+        Args:
+            logger (object): logger for recording messages to file or command line.
+        """
+        self._logger = logger
+        # [(op, src, dst, overwrite), ...] in the order added
+        self._ops = []
+
+    # ...............................................
+    def _log(self, msg):
+        if self._logger is not None:
+            self._logger.info(msg)
+        else:
+            print(msg)
+
+    # ...............................................
+    def add_rename(self, src, dst):
+        """Add a rename or move of a file or directory to the plan.
+
+        Args:
+            src (str): full path of the existing file or directory.
+            dst (str): full path of the new name.  Missing parent directories are
+                created.
+        """
+        if src != dst:
+            self._ops.append((OP_RENAME, src, dst, False))
+
+    # ...............................................
+    def add_copy(self, src, dst, overwrite=False):
+        """Add a copy of a file, with permissions and metadata, to the plan.
+
+        Args:
+            src (str): full path of the existing file.
+            dst (str): full path of the copy.  Missing parent directories are created.
+            overwrite (bool): flag indicating whether to replace an existing dst.
+        """
+        self._ops.append((OP_COPY, src, dst, overwrite))
+
+    # ...............................................
+    def __len__(self):
+        return len(self._ops)
+
+    # ...............................................
+    def validate(self, skip=None):
+        """Find operations that cannot be executed.
+
+        Args:
+            skip (set): indices of operations to leave out of the plan.
+
+        Returns:
+            dict of {op_index: message} for each operation that has a missing source,
+                duplicates the source or destination of another operation, or would
+                overwrite a file that is not moved away by the plan.
+        """
+        skip = skip or set()
+        problems = {}
+        rename_srcs = {}
+        dsts = {}
+        for idx, (op, src, dst, _overwrite) in enumerate(self._ops):
+            if idx in skip:
+                continue
+            if op == OP_RENAME:
+                if src in rename_srcs:
+                    problems[idx] = f"{src} is already renamed by the plan"
+                else:
+                    rename_srcs[src] = idx
+            if dst in dsts:
+                problems[idx] = f"{dst} is already a destination in the plan"
+            else:
+                dsts[dst] = idx
+        for idx, (op, src, dst, overwrite) in enumerate(self._ops):
+            if idx in skip or idx in problems:
+                continue
+            if not os.path.exists(src):
+                problems[idx] = f"{src} does not exist"
+            elif op == OP_COPY and src in rename_srcs:
+                problems[idx] = f"{src} is renamed by the plan before it can be copied"
+            elif os.path.exists(dst) and dst not in rename_srcs and not overwrite:
+                problems[idx] = f"{dst} already exists"
+            elif op == OP_COPY and dst in rename_srcs:
+                problems[idx] = f"{dst} is renamed by the plan, so cannot be a copy"
+        return problems
+
+    # ...............................................
+    def resolve(self, skip_invalid=False):
+        """Check the plan and order it into executable steps.
+
+        Args:
+            skip_invalid (bool): If True, leave out operations that fail validate,
+                and any that then fail because of them.  If False, raise an
+                exception.
+
+        Returns:
+            list of [op, src, dst, overwrite] steps, renames first, in an order that
+                vacates each destination before it is filled.
+
+        Raises:
+            Exception: on invalid operations, if skip_invalid is False.
+        """
+        skip = set()
+        problems = self.validate()
+        # Leaving out one rename can strand the renames waiting for it to vacate a name
+        while problems:
+            if not skip_invalid:
+                raise Exception(
+                    f"{len(problems)} invalid operations in plan, first: "
+                    f"{problems[min(problems)]}")
+            for idx in sorted(problems):
+                self._log(f"Skip {self._ops[idx][0]}: {problems[idx]}")
+            skip.update(problems)
+            problems = self.validate(skip=skip)
+
+        renames = [
+            idx for idx, op in enumerate(self._ops)
+            if op[0] == OP_RENAME and idx not in skip]
+        by_src = {self._ops[idx][1]: idx for idx in renames}
+        steps = []
+        visiting = 1
+        done = 2
+        state = {}
+        for start in renames:
+            path = []
+            idx = start
+            while idx is not None and idx not in state:
+                state[idx] = visiting
+                path.append(idx)
+                # Rename that must first vacate this destination
+                idx = by_src.get(self._ops[idx][2])
+            if idx is not None and state[idx] == visiting:
+                # Destinations are unique, so a cycle is only entered at its start
+                first = self._ops[path[0]]
+                tmp = os.path.join(
+                    os.path.dirname(first[1]),
+                    f".{os.path.basename(first[1])}.{path[0]}.tmp")
+                steps.append([OP_RENAME, first[1], tmp, False])
+                for cidx in reversed(path[1:]):
+                    steps.append(list(self._ops[cidx]))
+                steps.append([OP_RENAME, tmp, first[2], False])
+                self._log(f"Renaming {len(path)} files in a cycle through {tmp}")
+            else:
+                for pidx in reversed(path):
+                    steps.append(list(self._ops[pidx]))
+            for pidx in path:
+                state[pidx] = done
+        for idx, op in enumerate(self._ops):
+            if op[0] == OP_COPY and idx not in skip:
+                steps.append(list(op))
+        return steps
+
+    # ...............................................
+    def dry_run(self, skip_invalid=False):
+        """Log the steps execute would perform, without touching any files.
+
+        Args:
+            skip_invalid (bool): If True, log and leave out invalid operations.  If
+                False, raise an exception on invalid operations.
+
+        Returns:
+            list of [op, src, dst, overwrite] steps, as returned by resolve.
+        """
+        steps = self.resolve(skip_invalid=skip_invalid)
+        for op, src, dst, _overwrite in steps:
+            self._log(f"{op} {src} --> {dst}")
+        self._log(f"Plan has {len(steps)} steps for {len(self._ops)} operations")
+        return steps
+
+    # ...............................................
+    def execute(self, journal_fname=None, workers=8, skip_invalid=False):
+        """Resolve and perform all steps of the plan.
+
+        Args:
+            journal_fname (str): full filename of a JSON-lines journal recording the
+                steps and each completed step, to resume or roll back the plan.
+            workers (int): number of threads copying files.
+            skip_invalid (bool): If True, log and leave out invalid operations.  If
+                False, raise an exception on invalid operations.
+
+        Returns:
+            count of steps performed.
+
+        Raises:
+            Exception: on invalid operations, if skip_invalid is False.
+            Exception: on an existing journal_fname, which may hold an unfinished plan.
+        """
+        steps = self.resolve(skip_invalid=skip_invalid)
+        journal = None
+        if journal_fname is not None:
+            if os.path.exists(journal_fname):
+                raise Exception(
+                    f"Journal {journal_fname} exists; resume or roll back its plan, "
+                    f"or remove it")
+            journal = open(journal_fname, "w", encoding="utf-8")
+            journal.write(json.dumps({"event": EVENT_PLAN, "steps": steps}) + "\n")
+            journal.flush()
+        try:
+            count = _run_steps(steps, set(), {}, journal, workers, self._log)
+        finally:
+            if journal is not None:
+                journal.close()
+        return count
+
+    # ...............................................
+    @staticmethod
+    def _read_journal(journal_fname):
+        steps = None
+        done = set()
+        # {step: flag indicating whether its destination existed}, for started steps
+        started = {}
+        complete = rolled_back = False
+        with open(journal_fname, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # Last line may be partial after a crash
+                    continue
+                if rec["event"] == EVENT_PLAN:
+                    steps = rec["steps"]
+                elif rec["event"] == EVENT_START:
+                    # A resumed step keeps the state from before it first started
+                    started.setdefault(rec["step"], rec.get("replaced", False))
+                elif rec["event"] == EVENT_DONE:
+                    done.add(rec["step"])
+                elif rec["event"] == EVENT_UNDONE:
+                    done.discard(rec["step"])
+                    started.pop(rec["step"], None)
+                elif rec["event"] == EVENT_COMPLETE:
+                    complete = True
+                elif rec["event"] == EVENT_ROLLED_BACK:
+                    rolled_back = True
+        if steps is None:
+            raise Exception(f"Journal {journal_fname} has no plan")
+        return steps, done, started, complete, rolled_back
+
+    # ...............................................
+    @classmethod
+    def resume(cls, journal_fname, workers=8, logger=None):
+        """Perform the steps of a journaled plan that were not completed.
+
+        Args:
+            journal_fname (str): full filename of a journal written by execute.
+            workers (int): number of threads copying files.
+            logger (object): logger for recording messages to file or command line.
+
+        Returns:
+            count of steps performed.
+
+        Raises:
+            Exception: on a journal without a plan, or for a rolled back plan.
+        """
+        plan = cls(logger=logger)
+        steps, done, started, complete, rolled_back = cls._read_journal(
+            journal_fname)
+        if rolled_back:
+            raise Exception(f"Plan in {journal_fname} was rolled back")
+        if complete:
+            plan._log(f"Plan in {journal_fname} is already complete")
+            return 0
+        plan._log(f"Resuming {len(steps) - len(done)} of {len(steps)} steps")
+        with open(journal_fname, "a", encoding="utf-8") as journal:
+            return _run_steps(steps, done, started, journal, workers, plan._log)
+
+    # ...............................................
+    @classmethod
+    def rollback(cls, journal_fname, logger=None):
+        """Undo the started steps of a journaled plan, last first.
+
+        Args:
+            journal_fname (str): full filename of a journal written by execute.
+            logger (object): logger for recording messages to file or command line.
+
+        Returns:
+            count of steps undone.
+
+        Note:
+            Only steps recorded in the journal are undone.  Renames are reversed and
+            copies are deleted.  A rename interrupted before it was recorded as done
+            is reversed if its destination exists and its source does not.  Files
+            replaced by a copy cannot be restored, so copies whose destination
+            existed before they started are kept.
+        """
+        plan = cls(logger=logger)
+        steps, done, started, _complete, rolled_back = cls._read_journal(
+            journal_fname)
+        if rolled_back:
+            plan._log(f"Plan in {journal_fname} is already rolled back")
+            return 0
+        count = 0
+        with open(journal_fname, "a", encoding="utf-8") as journal:
+            for sidx in range(len(steps) - 1, -1, -1):
+                if sidx not in started and sidx not in done:
+                    continue
+                op, src, dst, _overwrite = steps[sidx]
+                if op == OP_RENAME:
+                    if sidx not in done and not _renamed(src, dst):
+                        # Interrupted before the rename
+                        continue
+                    os.rename(dst, src)
+                elif started.get(sidx, False):
+                    plan._log(f"Keep {dst}, which replaced an existing file")
+                    continue
+                elif os.path.exists(dst):
+                    os.remove(dst)
+                journal.write(json.dumps({"event": EVENT_UNDONE, "step": sidx}) + "\n")
+                journal.flush()
+                count += 1
+            journal.write(json.dumps({"event": EVENT_ROLLED_BACK}) + "\n")
+        plan._log(f"Rolled back {count} steps from {journal_fname}")
+        return count
+
+
+# .............................................................................
+def _renamed(src, dst):
+    # Only meaningful for the one rename in progress; others may share names
+    return os.path.exists(dst) and not os.path.exists(src)
+
+
+# .............................................................................
+def _run_steps(steps, done, started, journal, workers, log):
+    """Perform steps not yet done, renames serially, then copies in a thread pool.
+
+    Args:
+        steps (list): [op, src, dst, overwrite] steps, as returned by resolve.
+        done (set): indices of steps already performed.
+        started (dict): {step index: flag indicating whether its destination
+            existed} for steps already started.
+        journal (file): open journal, or None.
+        workers (int): number of threads copying files.
+        log (method): function to log messages.
+
+    Returns:
+        count of steps performed.
+
+    Raises:
+        Exception: on a failed rename or copy, after journaling completed steps.
+    """
+    def _start(sidx):
+        # Record whether a copy replaces a file, so rollback knows to keep it
+        if sidx in started:
+            return
+        started[sidx] = os.path.exists(steps[sidx][2])
+        if journal is not None:
+            rec = {"event": EVENT_START, "step": sidx}
+            if started[sidx]:
+                rec["replaced"] = True
+            journal.write(json.dumps(rec) + "\n")
+            journal.flush()
+
+    def _mark(sidx):
+        done.add(sidx)
+        if journal is not None:
+            journal.write(json.dumps({"event": EVENT_DONE, "step": sidx}) + "\n")
+            journal.flush()
+
+    todo = [sidx for sidx in range(len(steps)) if sidx not in done]
+    for pth in sorted({os.path.dirname(steps[sidx][2]) for sidx in todo}):
+        if pth:
+            os.makedirs(pth, exist_ok=True)
+    count = 0
+    copies = []
+    for sidx in todo:
+        op, src, dst, _overwrite = steps[sidx]
+        if op == OP_RENAME:
+            # Interrupted after the rename but before journaling it
+            if sidx in started and _renamed(src, dst):
+                _mark(sidx)
+                continue
+            _start(sidx)
+            try:
+                os.rename(src, dst)
+            except OSError as e:
+                raise Exception(f"Failed to rename {src} to {dst} ({e})")
+            _mark(sidx)
+            count += 1
+        else:
+            copies.append(sidx)
+    if copies:
+        # Journal all copies before any runs, so rollback finds unjournaled copies
+        for sidx in copies:
+            _start(sidx)
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(shutil.copy2, steps[sidx][1], steps[sidx][2]): sidx
+                for sidx in copies}
+            for future in as_completed(futures):
+                sidx = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f"Failed to copy {steps[sidx][1]} ({e})")
+                else:
+                    _mark(sidx)
+                    count += 1
+        if errors:
+            raise Exception(f"{len(errors)} copies failed, first: {errors[0]}")
+    if journal is not None:
+        journal.write(json.dumps({"event": EVENT_COMPLETE}) + "\n")
+    log(f"Performed {count} of {len(steps)} steps")
+    return count
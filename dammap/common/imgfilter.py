@@ -0,0 +1,105 @@
+# Spatial and date filters applied to image metadata as images are read
+import datetime
+
+from dammap.common.constants import IMAGE_KEYS
+from dammap.common.spatial import point_in_polygon
+
+
+# .............................................................................
+class ImageFilter(object):
+    """Area and date range of images to keep when reading image files.
+
+    Filters are tested against the GPS and date values read from an image file, before
+    a DamMeta is built, so rejected images are never fully processed or held in
+    memory.  Unset filters accept every image.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self, bbox=None, polygon=None, start_date=None, end_date=None):
+        """Constructor.
+
+        Args:
+            bbox (tuple): bounds of images to keep, in (min_x, min_y, max_x, max_y)
+                format, in decimal degrees.
+            polygon (list): list of (longitude, latitude) vertices of a polygon
+                containing images to keep.
+            start_date (datetime.date): earliest image date to keep.
+            end_date (datetime.date): latest image date to keep.
+
+        Raises:
+            Exception: on polygon with fewer than 3 vertices.
+            Exception: on start_date later than end_date.
+        """
+        if polygon is not None:
+            polygon = [(float(x), float(y)) for x, y in polygon]
+            if len(polygon) < 3:
+                raise Exception(f"Polygon {polygon} must have at least 3 vertices")
+            # Test the polygon bounds before the polygon
+            xs = [x for x, _ in polygon]
+            ys = [y for _, y in polygon]
+            poly_bbox = (min(xs), min(ys), max(xs), max(ys))
+            if bbox is None:
+                bbox = poly_bbox
+            else:
+                bbox = (
+                    max(bbox[0], poly_bbox[0]), max(bbox[1], poly_bbox[1]),
+                    min(bbox[2], poly_bbox[2]), min(bbox[3], poly_bbox[3]))
+        if start_date is not None and end_date is not None and start_date > end_date:
+            raise Exception(f"Start date {start_date} is after end date {end_date}")
+        self.bbox = bbox
+        self.polygon = polygon
+        self.start_date = start_date
+        self.end_date = end_date
+
+    # ...............................................
+    @property
+    def is_spatial(self):
+        """True if images must have coordinates within an area to be kept."""
+        return self.bbox is not None
+
+    # ...............................................
+    @property
+    def is_temporal(self):
+        """True if images must have a date within a range to be kept."""
+        return self.start_date is not None or self.end_date is not None
+
+    # ...............................................
+    def accepts(self, img_meta):
+        """Test whether to keep an image, from its parsed image file metadata.
+
+        Args:
+            img_meta (dict): parsed image metadata, keyed by IMAGE_KEYS, as returned
+                by DamMeta.read_image_meta.
+
+        Returns:
+            True if the image passes all filters, False otherwise.  Images without
+                coordinates fail a spatial filter, and images without a valid date
+                fail a date filter.
+        """
+        if self.is_temporal:
+            try:
+                img_date = datetime.date(*img_meta[IMAGE_KEYS.IMG_DATE][:3])
+            except (TypeError, ValueError):
+                return False
+            if self.start_date is not None and img_date < self.start_date:
+                return False
+            if self.end_date is not None and img_date > self.end_date:
+                return False
+        if self.is_spatial:
+            x = img_meta[IMAGE_KEYS.LON]
+            y = img_meta[IMAGE_KEYS.LAT]
+            if x is None or y is None:
+                return False
+            if (x < self.bbox[0] or x > self.bbox[2] or
+                    y < self.bbox[1] or y > self.bbox[3]):
+                return False
+            if self.polygon is not None and not point_in_polygon(x, y, self.polygon):
+                return False
+        return True
+
+    # ...............................................
+    def __repr__(self):
+        return (
+            f"ImageFilter(bbox={self.bbox}, polygon={self.polygon}, "
+            f"start_date={self.start_date}, end_date={self.end_date})")
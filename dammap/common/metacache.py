@@ -0,0 +1,191 @@
+"""Persistent cache of image metadata, to avoid re-reading unchanged image files."""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+from dammap.common.constants import MAC_PATH, META_CACHE_FNAME, OUT_DIR
+
+
+# .............................................................................
+class MetaCache(object):
+    """SQLite cache of parsed image metadata keyed on relative path, size and mtime.
+
+    Values are the dictionaries returned by DamMeta.read_image_meta.  Entries are
+    invalid, and ignored, when the size or modification time of the image file no
+    longer match the cached values.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self, cache_fname, base_path, logger=None):
+        """Open or create a cache file, and read all entries into memory.
+
+        Args:
+            cache_fname (str): full filename of the SQLite cache file.
+            base_path (str): common directory for all cached image files; keys are
+                image filenames relative to this path.
+            logger (object): logger for recording messages to file or command line.
+        """
+        self.cache_fname = cache_fname
+        self.base_path = base_path
+        self._logger = logger
+        self._lock = threading.Lock()
+        # {relpath: (size, mtime_ns, json_meta)}
+        self._entries = {}
+        self._dirty = {}
+        self.hits = 0
+        self.misses = 0
+
+        pth = os.path.dirname(cache_fname)
+        if pth and not os.path.exists(pth):
+            os.makedirs(pth)
+        self._conn = sqlite3.connect(cache_fname, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_meta ("
+            "relpath TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, meta TEXT)")
+        for relpath, size, mtime_ns, meta in self._conn.execute(
+                "SELECT relpath, size, mtime_ns, meta FROM image_meta"):
+            self._entries[relpath] = (size, mtime_ns, meta)
+
+    # ...............................................
+    def _log(self, msg):
+        if self._logger is not None:
+            self._logger.info(msg)
+        else:
+            print(msg)
+
+    # ...............................................
+    def _relpath(self, fullpath):
+        return os.path.relpath(fullpath, self.base_path)
+
+    # ...............................................
+    def get(self, fullpath, stat=None):
+        """Return cached metadata for an image file, if present and current.
+
+        Args:
+            fullpath (str): full filename of the image file.
+            stat (os.stat_result): optional stat of the file, to avoid another call.
+
+        Returns:
+            img_meta (dict): parsed image metadata, or None if the file is not in the
+                cache or has changed since it was cached.
+        """
+        if stat is None:
+            try:
+                stat = os.stat(fullpath)
+            except OSError:
+                return None
+        relpath = self._relpath(fullpath)
+        with self._lock:
+            try:
+                size, mtime_ns, meta = self._entries[relpath]
+            except KeyError:
+                self.misses += 1
+                return None
+            if size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                # Stale entry, invalidate
+                del self._entries[relpath]
+                self._dirty[relpath] = None
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(meta)
+
+    # ...............................................
+    def put(self, fullpath, img_meta, stat=None):
+        """Add or replace cached metadata for an image file.
+
+        Args:
+            fullpath (str): full filename of the image file.
+            img_meta (dict): parsed image metadata from DamMeta.read_image_meta.
+            stat (os.stat_result): optional stat of the file, to avoid another call.
+        """
+        if stat is None:
+            try:
+                stat = os.stat(fullpath)
+            except OSError:
+                return
+        relpath = self._relpath(fullpath)
+        entry = (stat.st_size, stat.st_mtime_ns, json.dumps(img_meta))
+        with self._lock:
+            self._entries[relpath] = entry
+            self._dirty[relpath] = entry
+
+    # ...............................................
+    def save(self):
+        """Write new, changed, and invalidated entries to the cache file."""
+        with self._lock:
+            deletes = [(relpath, ) for relpath, e in self._dirty.items() if e is None]
+            upserts = [
+                (relpath, e[0], e[1], e[2])
+                for relpath, e in self._dirty.items() if e is not None]
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM image_meta WHERE relpath = ?", deletes)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO image_meta (relpath, size, mtime_ns, meta) "
+                    "VALUES (?, ?, ?, ?)", upserts)
+            self._dirty = {}
+        self._log(
+            f"Saved {len(upserts)} and removed {len(deletes)} entries in "
+            f"{self.cache_fname}")
+
+    # ...............................................
+    def prune(self):
+        """Remove entries for image files which are missing or have changed.
+
+        Returns:
+            count of removed entries.
+        """
+        stale = []
+        with self._lock:
+            for relpath, (size, mtime_ns, _meta) in self._entries.items():
+                try:
+                    stat = os.stat(os.path.join(self.base_path, relpath))
+                except OSError:
+                    stale.append(relpath)
+                else:
+                    if size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                        stale.append(relpath)
+            for relpath in stale:
+                del self._entries[relpath]
+                self._dirty[relpath] = None
+        self.save()
+        return len(stale)
+
+    # ...............................................
+    def close(self):
+        """Save any changes and close the cache file."""
+        if self._dirty:
+            self.save()
+        self._log(f"Image metadata cache hits: {self.hits}, misses: {self.misses}")
+        self._conn.close()
+
+    # ...............................................
+    def __len__(self):
+        return len(self._entries)
+
+
+# .............................................................................
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Manage the cache of image metadata.")
+    parser.add_argument(
+        "--base_path", default=MAC_PATH,
+        help="Common directory for cached image files.")
+    parser.add_argument(
+        "--cache_fname", default=os.path.join(MAC_PATH, OUT_DIR, META_CACHE_FNAME),
+        help="Full filename of the cache file.")
+    parser.add_argument(
+        "--prune", action="store_true",
+        help="Remove entries for missing or changed image files.")
+    args = parser.parse_args()
+
+    cache = MetaCache(args.cache_fname, args.base_path)
+    print(f"{len(cache)} entries in {args.cache_fname}")
+    if args.prune:
+        count = cache.prune()
+        print(f"Pruned {count} stale entries, {len(cache)} remain")
+    cache.close()
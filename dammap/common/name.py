@@ -2,8 +2,11 @@
 from logging import INFO, WARN, ERROR
 import os.path
 
-from dammap.common.constants import IMAGE_EXTENSIONS, DATE_SEP, SEPARATOR
+from dammap.common.constants import (
+    IMAGE_EXTENSIONS, IMAGE_KEYS, DATE_SEP, SEPARATOR)
 from dammap.common.dammeta import DamMeta
+from dammap.common.fileplan import FileOpPlan
+from dammap.common.util import walk_image_tree
 
 class DamNameOp():
 
@@ -51,14 +54,31 @@ class DamNameOp():
         damname = damrec.arroyo_name.lower()
         yr, mo, dy = damrec.img_date
         # change into strings
-        datestr = DATE_SEP.join([yr, f"{mo:02d}", f"{dy:02d}"])
+        datestr = DATE_SEP.join([f"{yr}", f"{mo:02d}", f"{dy:02d}"])
         newbasename = SEPARATOR.join([damname, datestr, damrec.picnum])
         return f"{newbasename}{ext}"
 
 
     # ...............................................
     @staticmethod
-    def check_filename(dataroot, full_fname, logger):
+    def check_filename(dataroot, full_fname, logger, img_meta=None):
+        """Check that an image filename follows the name_yyyy-mm-dd_num pattern.
+
+        Args:
+            dataroot (str): root path for image files.
+            full_fname (str): full path to the image file.
+            logger (object): logger for recording messages to file or command line.
+            img_meta (dict): metadata parsed from the image file by
+                DamMeta.read_image_meta, if already read.
+
+        Returns:
+            new_fname (str): a filename constructed from the arroyo, camera date and
+                picture number if the file is named by the camera, None if such a file
+                has no usable metadata, otherwise full_fname.
+            img_meta (dict): img_meta, or metadata read from the image file to
+                construct new_fname, to be passed on to DamMeta so the file is not
+                read again; None if the file was not read.
+        """
         do_rename = False
         fullpth, fname = os.path.split(full_fname)
         relpth = fullpth[len(dataroot)+1:]
@@ -68,7 +88,7 @@ class DamNameOp():
         except ValueError:
             arr = pthparts[0]
         arr_name = arr.split(SEPARATOR)[1]
-        basefname = os.path.splitext(fname)[0]
+        basefname, ext = os.path.splitext(fname)
         fparts = basefname.split(SEPARATOR)
         try:
             dam_name, fulldate, picnum = fparts
@@ -88,15 +108,18 @@ class DamNameOp():
                 except ValueError:
                     logger.log(WARN, f"Filename {basefname} does not end with an int")
         if do_rename:
-            tags, _ = DamMeta.get_image_metadata(full_fname, logger)
-            if tags:
-                (yr, mo, dy) = DamMeta.get_camera_date(tags, logger)
-                datestr = DATE_SEP.join([yr, f"{mo:02d}", f"{dy:02d}"])
+            if img_meta is None:
+                img_meta = DamMeta.read_image_meta(full_fname, logger)
+            # Date is None if the file has no usable metadata
+            if img_meta[IMAGE_KEYS.IMG_DATE] is not None:
+                (yr, mo, dy) = img_meta[IMAGE_KEYS.IMG_DATE]
+                datestr = DATE_SEP.join([f"{yr}", f"{mo:02d}", f"{dy:02d}"])
                 newfname = SEPARATOR.join([arr_name.lower(), datestr, picnum])
-                return os.path.join(fullpth, newfname)
+                return os.path.join(fullpth, f"{newfname}{ext}"), img_meta
+            return None, img_meta
         else:
             # Existing fname is correct
-            return full_fname
+            return full_fname, img_meta
 
     # .............................................................................
     @staticmethod
@@ -272,40 +295,53 @@ class DamNameOp():
     #     new_rel_filename = os.path.join(new_arroyo_dir, new_arroyo_fname)
     #     return new_rel_filename
 # .............................................................................
-def fix_names_in_tree(inpath, do_files=False):
+def fix_names_in_tree(
+        inpath, do_files=False, dry_run=False, journal_fname=None, logger=None):
     """Fix names in a tree, either directories or files.
 
     Args:
         inpath (str): base directory
         do_files (bool): False if rename directories, True if rename files
+        dry_run (bool): If True, log the planned renames without renaming anything.
+        journal_fname (str): full filename of a journal of completed renames, to
+            resume or roll back an interrupted run with FileOpPlan.
+        logger (object): logger for recording messages to file or command line.
+
+    Returns:
+        count of renames performed, or planned if dry_run.
     """
     start = len(inpath) + 1
-    for root, dirlist, files in os.walk(inpath):
-        # Fix directories
-        if not do_files:
-            for olddir in dirlist:
-                # Fix filenames
-                newdir = DamNameOp.fix_name(olddir)
-                os.rename(os.path.join(root, olddir), os.path.join(root, newdir))
-                print("{} --> {}".format(olddir, newdir))
-        # Fix files
-        else:
-            for fname in files:
-                basename, ext = os.path.splitext(fname)
-                if not fname.startswith(".") and ext.lower() == ".jpg":
-                    old_filename = os.path.join(root, fname)
-                    newname = DamNameOp.fix_name(basename, ext=ext)
-                    new_filename = os.path.join(root, newname)
-                    # Test before rename
-                    rel_fname = new_filename[start:]
-                    arroyo_num, arroyo_name, name, date_lst, picnum = \
-                        DamNameOp.parse_relative_fname(rel_fname)
-                    if (None in (arroyo_num, arroyo_name, name, picnum)
-                            or len(date_lst) < 2):
-                        print("Stop me now! {}".format(rel_fname))
-                    else:
-                        os.rename(old_filename, new_filename)
-                        print("Rename {} --> {}".format(fname, newname))
+    plan = FileOpPlan(logger=logger)
+    # Fix directories; names are not yet standard, so cannot be classified
+    if not do_files:
+        with os.scandir(inpath) as it:
+            olddirs = [
+                entry.name for entry in it
+                if entry.is_dir() and not entry.name.startswith(".")]
+        for olddir in olddirs:
+            newdir = DamNameOp.fix_name(olddir)
+            plan.add_rename(os.path.join(inpath, olddir), os.path.join(inpath, newdir))
+    # Fix files
+    else:
+        for arr_entry, _dam_entry, entry in walk_image_tree(inpath):
+            fname = entry.name
+            basename, ext = os.path.splitext(fname)
+            if ext.lower() == ".jpg":
+                old_filename = entry.path
+                newname = DamNameOp.fix_name(basename, ext=ext)
+                new_filename = os.path.join(arr_entry.path, newname)
+                # Test before rename
+                rel_fname = new_filename[start:]
+                arroyo_num, arroyo_name, name, date_lst, picnum = \
+                    DamNameOp.parse_relative_fname(rel_fname)
+                if (None in (arroyo_num, arroyo_name, name, picnum)
+                        or date_lst is None or len(date_lst) < 2):
+                    print("Stop me now! {}".format(rel_fname))
+                else:
+                    plan.add_rename(old_filename, new_filename)
+    if dry_run:
+        return len(plan.dry_run(skip_invalid=True))
+    return plan.execute(journal_fname=journal_fname, skip_invalid=True)
 
 
 # ...............................................
@@ -316,17 +352,15 @@ def test_names_in_tree(inpath):
         inpath (str): base directory
     """
     start = len(inpath) + 1
-    for root, dirlist, files in os.walk(inpath):
-        for fname in files:
-            if not fname.startswith(".") and fname.lower().endswith("jpg"):
-                full_fname = os.path.join(root, fname)
-                rel_fname = full_fname[start:]
-                arroyo_num, arroyo_name, name, date_lst, picnum = \
-                    DamNameOp.parse_relative_fname(rel_fname)
-                print("Relative filename {} parses to: ".format(rel_fname))
-                print("   Arroyo: {} {}".format(arroyo_num, arroyo_name))
-                print("   Dam:    {}, {}-{}-{}, {}".format(
-                    name, date_lst[0], date_lst[1], date_lst[2], picnum))
+    for _arr_entry, _dam_entry, entry in walk_image_tree(inpath):
+        if entry.name.lower().endswith("jpg"):
+            rel_fname = entry.path[start:]
+            arroyo_num, arroyo_name, name, date_lst, picnum = \
+                DamNameOp.parse_relative_fname(rel_fname)
+            print("Relative filename {} parses to: ".format(rel_fname))
+            print("   Arroyo: {} {}".format(arroyo_num, arroyo_name))
+            print("   Dam:    {}, {}-{}-{}, {}".format(
+                name, date_lst[0], date_lst[1], date_lst[2], picnum))
 
 # # .............................................................................
 # def move_arroyos(csvfilename, delimiter, field, dest_arroyo_dir, logger):
@@ -1,43 +1,61 @@
 """Process Anaya dam photographs and create CSV, shapefile, and KML file for display."""
 import datetime
-
-from osgeo import ogr
+import numpy as np
 import os
 
 from dammap.common.constants import (
     AGG_DIR, ALL_DATA_KEYS as ADK, BIG_DISTANCE, DAM_BUFFER, DAM_PREFIX, EARLY_DATA_DIR,
-    MAC_PATH, MAX_X, MAX_Y, MIN_X, MIN_Y, OUT_DIR, SEPARATOR, SURVEY_DAMSEP_DIR, SURVEY_DIR)
-from dammap.common.util import (
-    do_recognize_image_file, rename_in_place, copy_fileandmeta_to_dir)
+    MAC_PATH, MATCH_CHUNK_ROWS, MAX_X, MAX_Y, MIN_X, MIN_Y, OUT_DIR, SEPARATOR,
+    SURVEY_DAMSEP_DIR, SURVEY_DIR)
+from dammap.common.util import walk_image_tree
+from dammap.common.fileplan import FileOpPlan
 from dammap.common.name import DamNameOp
-from dammap.common.dammeta import DamMeta
+from dammap.common.columns import ImageColumns
+from dammap.common.spatial import project_to_meters
 from dammap.transform.dam_map import PicMapper
 
 # DELETE_CHARS = ["\"", ",", """, " ", "(", ")", "_"]
 
 # .............................................................................
-def standardize_camera_filenames(surveypath):
+def standardize_camera_filenames(
+        surveypath, logger, dry_run=False, journal_fname=None):
+    """Rename image files named by the camera to the name_yyyy-mm-dd_num pattern.
+
+    Args:
+        surveypath: full path to directory containing arroyo directories containing
+            images.
+        logger: logger for recording messages to file or command line.
+        dry_run: If True, log the planned renames without renaming any files.
+        journal_fname: full filename of a journal of completed renames, to resume or
+            roll back an interrupted run with FileOpPlan.
+
+    Returns:
+        count of renames performed, or planned if dry_run.
+
+    Note:
+        DamNameOp.check_filename reads image metadata only for files that need a new
+        name, and constructs the same name reported when the files are ingested.
+        Renames onto existing files are skipped.
+    """
     logger.info(f"Start Standardizing Camera Filenames in {surveypath}")
-    for root, arroyos, _ in os.walk(surveypath):
-        for arr in arroyos:
-            logger.info(f"Reading arroyo {arr}")
-            pth = os.path.join(root, arr)
-            files = os.listdir(pth)
-            for fname in files:
-                if do_recognize_image_file(fname):
-                    logger.info(f"Found file {fname}")
-                    fullfname = os.path.join(root, arr, fname)
-
-                    # Get metadata from directory and filename
-                    damrec = DamMeta(fullfname, surveypath, logger=logger)
-                    if damrec.has_meta:
-                        new_basefname = DamNameOp.create_filename(fullfname, damrec)
-                        rename_in_place(fullfname, new_basefname)
-                    else:
-                        logger.info(f"Cannot read metadata from {fullfname}")
+    plan = FileOpPlan(logger=logger)
+    for _arr_entry, _dam_entry, entry in walk_image_tree(surveypath):
+        fullfname = entry.path
+        # Construct a new filename from directory, filename and image metadata
+        new_fullfname, _img_meta = DamNameOp.check_filename(
+            surveypath, fullfname, logger)
+        if new_fullfname is None:
+            logger.info(f"Cannot read metadata from {fullfname}")
+        else:
+            plan.add_rename(fullfname, new_fullfname)
+    if dry_run:
+        return len(plan.dry_run(skip_invalid=True))
+    return plan.execute(journal_fname=journal_fname, skip_invalid=True)
 
 # .............................................................................
-def create_dam_subdir_structure_for_unique_dams(surveypath, survey_damsep_path):
+def create_dam_subdir_structure_for_unique_dams(
+        surveypath, survey_damsep_path, logger, dry_run=False, journal_fname=None,
+        workers=8):
     """Create subdirectories for each dam within each arroyo directory.
 
     Args:
@@ -45,6 +63,14 @@ def create_dam_subdir_structure_for_unique_dams(surveypath, survey_damsep_path):
             images.
         survey_damsep_path: full path for new directory containing arroyo directories containing
             dam subdirectories containing images.
+        logger: logger for recording messages to file or command line.
+        dry_run: If True, log the planned copies without copying any files.
+        journal_fname: full filename of a journal of completed copies, to resume or
+            roll back an interrupted run with FileOpPlan.
+        workers: number of threads copying files.
+
+    Returns:
+        count of copies performed, or planned if dry_run.
 
     Note:
         This function assumes that each image represents a unique dam, none are grouped.
@@ -63,21 +89,22 @@ def create_dam_subdir_structure_for_unique_dams(surveypath, survey_damsep_path):
                     ...
     """
     logger.info("Start Restructuring Arroyos/Dams")
-    for root, arroyos, _ in os.walk(surveypath):
-        for arr in arroyos:
+    plan = FileOpPlan(logger=logger)
+    curr_arr = None
+    for arr_entry, _dam_entry, entry in walk_image_tree(surveypath):
+        arr = arr_entry.name
+        if arr != curr_arr:
             # Start numbering dams in arroyo, 1 per image
+            curr_arr = arr
             damnum = 0
-            logger.info(f"Arroyo {arr}")
-            oldpath = os.path.join(root, arr)
-            files = os.listdir(oldpath)
-            for fname in files:
-                if do_recognize_image_file(fname):
-                    damnum += 1
-                    damdir = f"{DAM_PREFIX}{SEPARATOR}{damnum}"
-                    newpath = os.path.join(survey_damsep_path, arr, damdir)
-                    # logger.info(f"Dam {damdir}")
-                    oldpath = os.path.join(root, arr)
-                    copy_fileandmeta_to_dir(oldpath, newpath, fname)
+        damnum += 1
+        damdir = f"{DAM_PREFIX}{SEPARATOR}{damnum}"
+        newpath = os.path.join(survey_damsep_path, arr, damdir)
+        # Like copy_fileandmeta_to_dir, replace existing copies
+        plan.add_copy(entry.path, os.path.join(newpath, entry.name), overwrite=True)
+    if dry_run:
+        return len(plan.dry_run())
+    return plan.execute(journal_fname=journal_fname, workers=workers)
 
 
 # .............................................................................
@@ -121,45 +148,154 @@ def match_dams_to_survey(earlypath, gt_damsep_path, aggregate_path, logger):
     pm_early = PicMapper(earlypath, buffer_distance=DAM_BUFFER, logger=logger)
     pm_early.populate_images(is_dam_separated=False)
     logger.info(f"Read {pm_early.all_data['img_count']} 2013-2024 images")
-    old_arroyos = pm_early.all_data[ADK.ARROYO_FILES]
     old_img_meta = pm_early.all_data[ADK.IMAGE_META]
     idx = len(MAC_PATH) + 1
 
-    for arr_name, arr_gt_files in gt_pm.all_data[ADK.ARROYO_FILES].items():
+    # Match all arroyos at once
+    dam_calcs, mismatches = match_all_old_coords(gt_img_meta, old_img_meta, logger)
+    old_arroyos = {dimg.arroyo_name for dimg in old_img_meta.values()}
+    for arr_name, arr_dam_calcs in dam_calcs.items():
         # if arr_name in ["PricesTrail", "Tiny"]:
         logger.info(f"-- Arroyo {arr_name}")
-        try:
-            arr_old_files = old_arroyos[arr_name]
-        except:
+        if arr_name not in old_arroyos:
             logger.info(f"{arr_name} does not exist in old dataset")
-        else:
-            dam_calcs = match_old_coords_to_arroyo(
-                arr_gt_files, arr_old_files, gt_img_meta, old_img_meta,
-                aggregate_path, logger)
-            for damname, dimg_lst in dam_calcs.items():
-                logger.info(f"  -- Dam {damname}")
-                for dimg in dimg_lst:
-                    oldpath = os.path.split(dimg.fullpath)[0]
-                    relpath = DamNameOp.construct_relative_path(dimg)
-                    newpath = os.path.join(aggregate_path, relpath)
-                    if dimg.dam_calc_dist > BIG_DISTANCE[0]:
-                        logger.info(
-                            f"    -- BIG Distance {dimg.dam_calc_dist:.7f}; "
-                            f"copy {oldpath[idx:]}/{dimg.basename} to {dimg.dam_calc} "
-                            f"in {newpath[idx:]}")
-                    else:
-                        logger.info(
-                            f"    -- Distance {dimg.dam_calc_dist:.7f}; "
-                            f"copy {oldpath[idx:]}/{dimg.basename} to {dimg.dam_calc} "
-                            f"in {newpath[idx:]}")
-                    # copy_fileandmeta_to_dir(
-                    #     oldpath, newpath, dimg.basename, basepath=MAC_PATH)
+            continue
+        for damname, dimg_lst in arr_dam_calcs.items():
+            logger.info(f"  -- Dam {damname}")
+            for dimg in dimg_lst:
+                oldpath = os.path.split(dimg.fullpath)[0]
+                relpath = DamNameOp.construct_relative_path(dimg)
+                newpath = os.path.join(aggregate_path, relpath)
+                if dimg.dam_calc_dist > BIG_DISTANCE:
+                    logger.info(
+                        f"    -- BIG Distance {dimg.dam_calc_dist:.2f} m; "
+                        f"copy {oldpath[idx:]}/{dimg.basename} to {dimg.dam_calc} "
+                        f"in {newpath[idx:]}")
+                else:
+                    logger.info(
+                        f"    -- Distance {dimg.dam_calc_dist:.2f} m; "
+                        f"copy {oldpath[idx:]}/{dimg.basename} to {dimg.dam_calc} "
+                        f"in {newpath[idx:]}")
+                # copy_fileandmeta_to_dir(
+                #     oldpath, newpath, dimg.basename, basepath=MAC_PATH)
+    for rfname, arr_name, dam, dist, near_arr, near_dam, near_dist in mismatches:
+        logger.info(
+            f"Mismatch for {rfname}: {arr_name} {dam} {dist:.2f} m, but {near_arr} "
+            f"{near_dam} {near_dist:.2f} m is closer")
+
+
+# .............................................................................
+def match_all_old_coords(
+        gt_img_meta, old_img_meta, logger, k=1, chunk_rows=MATCH_CHUNK_ROWS):
+    """Match coordinates of all early survey images to the closest dam in their arroyo.
+
+    Args:
+        gt_img_meta: dict of relative filename to DamMeta in ground-truth dataset
+        old_img_meta: dict of relative filename to DamMeta in old dataset
+        logger: logger for recording messages to file or command line.
+        k: number of nearest dams to find for each image.  If k > 1, log images
+            whose second-closest dam is within BIG_DISTANCE of the closest, as an
+            ambiguous match.
+        chunk_rows: number of early images per batch of the distance matrix.
+
+    Returns:
+        dam_calcs (dict): {arroyo_name: {dam_name: [DamMeta, ...], ...}, ...} for
+            all ground-truth arroyos and dams, each list starting with the
+            ground-truth image followed by the matched early images.
+        mismatches (list): (relfname, arroyo_name, dam_name, distance,
+            nearest_arroyo_name, nearest_dam_name, nearest_distance) for each early
+            image whose nearest dam overall is in a different arroyo than its own.
+
+    Postcondition:
+        Each matched early DamMeta has dam_calc and dam_calc_dist set to its closest
+            dam in the same arroyo, with the distance in meters.
+
+    Note:
+        Coordinates are projected once to meters in METRIC_CRS, and early images are
+        compared to all ground-truth dams in batches of chunk_rows rows of a distance
+        matrix.  Distances to dams in other arroyos are masked to find the closest dam
+        in the same arroyo, and unmasked to find the closest dam overall.
+    """
+    # Ground-truth dams, by arroyo and dam name, in order of first appearance
+    gt_dams = {}
+    for gt_dimg in gt_img_meta.values():
+        if gt_dimg.dam_calc_dist != 0:
+            logger.info(
+                f"Ground-truth {gt_dimg.dam_calc} distance {gt_dimg.dam_calc_dist}")
+        if gt_dimg.dd_ok:
+            gt_dams[(gt_dimg.arroyo_name, gt_dimg.dam_calc)] = gt_dimg
+    dam_calcs = {}
+    arroyo_ids = {}
+    gt_keys = list(gt_dams.keys())
+    for arr_name, dam in gt_keys:
+        arroyo_ids.setdefault(arr_name, len(arroyo_ids))
+        dam_calcs.setdefault(arr_name, {})[dam] = [gt_dams[(arr_name, dam)]]
+    gt_x, gt_y = project_to_meters(
+        [gt_dams[key].longitude for key in gt_keys],
+        [gt_dams[key].latitude for key in gt_keys])
+    gt_arr = np.array([arroyo_ids[arr] for arr, _ in gt_keys], dtype=np.int32)
+
+    # Early images with coordinates, and ground-truth id of their arroyo
+    old_cols = ImageColumns(old_img_meta)
+    old_arr_lookup = np.array(
+        [arroyo_ids.get(name, -1) for name in old_cols.arroyo_names] or [-1],
+        dtype=np.int32)
+    old_arr = old_arr_lookup[old_cols.arroyo_id]
+    for i in np.flatnonzero(~old_cols.has_geo).tolist():
+        logger.info(f"No coordinates to match for {old_cols.relfnames[i]}")
+    for name in old_cols.arroyo_names:
+        if name not in arroyo_ids:
+            logger.info(f"{name} does not exist in ground-truth dataset")
+    rows = np.flatnonzero(old_cols.has_geo & (old_arr >= 0))
+
+    mismatches = []
+    kk = min(k, len(gt_keys))
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        dx = old_cols.x[chunk][:, np.newaxis] - gt_x[np.newaxis, :]
+        dy = old_cols.y[chunk][:, np.newaxis] - gt_y[np.newaxis, :]
+        dist = np.sqrt(dx * dx + dy * dy)
+        overall = np.argmin(dist, axis=1)
+        same = np.where(
+            old_arr[chunk][:, np.newaxis] == gt_arr[np.newaxis, :], dist, np.inf)
+        # k closest in the same arroyo, ties in ground-truth order
+        nearest = np.empty((len(chunk), kk), dtype=np.int64)
+        nearest_dist = np.empty((len(chunk), kk), dtype=np.float64)
+        chunk_idxs = np.arange(len(chunk))
+        for j in range(kk):
+            nearest[:, j] = np.argmin(same, axis=1)
+            nearest_dist[:, j] = same[chunk_idxs, nearest[:, j]]
+            same[chunk_idxs, nearest[:, j]] = np.inf
+
+        for r, i in enumerate(chunk.tolist()):
+            rfname = old_cols.relfnames[i]
+            arr_name, closest_dam = gt_keys[nearest[r, 0]]
+            closest_dist = float(nearest_dist[r, 0])
+            if kk > 1 and np.isfinite(nearest_dist[r, 1]) and (
+                    nearest_dist[r, 1] - closest_dist < BIG_DISTANCE):
+                logger.info(
+                    f"Ambiguous match for {rfname}: {closest_dam} {closest_dist:.2f} m, "
+                    f"{gt_keys[nearest[r, 1]][1]} {nearest_dist[r, 1]:.2f} m")
+            old_dimg = old_img_meta[rfname]
+            old_dimg.dam_calc = closest_dam
+            old_dimg.dam_calc_dist = closest_dist
+            dam_calcs[arr_name][closest_dam].append(old_dimg)
+            near_arr, near_dam = gt_keys[overall[r]]
+            near_dist = float(dist[r, overall[r]])
+            if near_arr != arr_name and near_dist < closest_dist:
+                mismatches.append((
+                    rfname, arr_name, closest_dam, closest_dist, near_arr, near_dam,
+                    near_dist))
+    logger.info(
+        f"Matched {len(rows)} early images to {len(gt_keys)} ground-truth dams, "
+        f"{len(mismatches)} closer to a dam in another arroyo")
+    return dam_calcs, mismatches
 
 
 # .............................................................................
 def match_old_coords_to_arroyo(
         arr_gt_files, arr_old_files, gt_img_meta, old_img_meta,
-        outpath, logger):
+        outpath, logger, k=1):
     """Match coordinates of early survey images to closest dam in 2025 survey.
 
     Args:
@@ -168,39 +304,22 @@ def match_old_coords_to_arroyo(
         gt_img_meta: dict of relative filename to DamMeta in ground-truth dataset
         old_img_meta: dict of relative filename to DamMeta in old dataset
         outpath: parent path for new, matched, combined dataset
+        logger: logger for recording messages to file or command line.
+        k: number of nearest dams to find for each image.  If k > 1, log images
+            whose second-closest dam is within BIG_DISTANCE of the closest, as an
+            ambiguous match.
 
     Returns:
         dict of {dam_name: [DamMeta, ...], ...} for all dams in arr_name
 
+    Note:
+        To match all arroyos, call match_all_old_coords once instead.
     """
-    # make a dict of dam:ground-truth-coords for arroyo
-    gtdam_coords = {}
-    # make a dict of dam:[DamMeta, ...] for arroyo to return
-    dam_calcs = {}
-    for gt_rfname in arr_gt_files:
-        gt_dimg = gt_img_meta[gt_rfname]
-        if gt_dimg.dam_calc_dist != 0:
-            logger.info(f"Ground-truth {gt_dimg.dam_calc} distance {gt_dimg.dam_calc_dist}")
-        gtdam_coords[gt_dimg.dam_calc] = [gt_dimg.longitude, gt_dimg.latitude]
-        dam_calcs[gt_dimg.dam_calc] = [gt_dimg]
-
-    # examine each old image and find closest ground-truth dam
-    for rfname in arr_old_files:
-        # copy_fileandmeta_to_dir(oldpath, newpath, fname)
-        old_dimg = old_img_meta[rfname]
-        old_coords = [old_dimg.longitude, old_dimg.latitude]
-        closest_dist = 100
-        closest_dam = None
-        for dam, gt_coords in gtdam_coords.items():
-            # Create a line and measure length
-            ln = ogr.Geometry(ogr.wkbLineString)
-            ln.AddPoint(*old_coords)
-            ln.AddPoint(*gt_coords)
-            dist = ln.Length()
-            if closest_dam is None or dist < closest_dist:
-                closest_dam = dam
-                closest_dist = dist
-        old_dimg.dam_calc = closest_dam
-        old_dimg.dam_calc_dist = closest_dist
-        dam_calcs[closest_dam].append(old_dimg)
-    return dam_calcs
+    dam_calcs, _mismatches = match_all_old_coords(
+        {rfname: gt_img_meta[rfname] for rfname in arr_gt_files},
+        {rfname: old_img_meta[rfname] for rfname in arr_old_files},
+        logger, k=k)
+    arr_dam_calcs = {}
+    for dams in dam_calcs.values():
+        arr_dam_calcs.update(dams)
+    return arr_dam_calcs
@@ -0,0 +1,488 @@
+# Spatial indexes and geometry helpers common for anaya project
+import math
+import numpy as np
+from osgeo import osr
+
+from dammap.common.constants import METRIC_CRS, PIP_CHUNK_CELLS
+
+# Transformation from decimal degrees to METRIC_CRS, created on first use
+_METRIC_TRANSFORM = None
+
+
+# .............................................................................
+def _grid_ring(col, row, r, bounds):
+    # Cells at Chebyshev distance r from (col, row), within the occupied cells
+    # bounds (min_col, min_row, max_col, max_row)
+    min_col, min_row, max_col, max_row = bounds
+    if r == 0:
+        if min_col <= col <= max_col and min_row <= row <= max_row:
+            yield col, row
+        return
+    cols = range(max(col - r, min_col), min(col + r, max_col) + 1)
+    for rw in (row - r, row + r):
+        if min_row <= rw <= max_row:
+            for c in cols:
+                yield c, rw
+    rows = range(max(row - r + 1, min_row), min(row + r - 1, max_row) + 1)
+    for c in (col - r, col + r):
+        if min_col <= c <= max_col:
+            for rw in rows:
+                yield c, rw
+
+
+# .............................................................................
+def _grid_ring_range(col, row, bounds):
+    # First and last rings from (col, row) holding cells within bounds
+    min_col, min_row, max_col, max_row = bounds
+    first_r = max(0, min_col - col, col - max_col, min_row - row, row - max_row)
+    last_r = max(
+        abs(col - min_col), abs(col - max_col), abs(row - min_row), abs(row - max_row))
+    return first_r, last_r
+
+
+# .............................................................................
+def cluster_within_distance(coords, distance):
+    """Group points connected by chains of neighbors within a distance.
+
+    Points are bucketed into a grid of cells of width distance, so each point is
+    compared only to points in its own and the 8 adjacent cells, and groups are
+    merged with a union-find.
+
+    Args:
+        coords (list): list of (x, y) tuples.
+        distance (float): maximum distance between neighboring points in a cluster.
+
+    Returns:
+        list of cluster ids, one per point in coords.  Ids are numbered from 0 in
+            order of the first point of each cluster in coords, so they are stable for
+            the same input order.
+
+    Raises:
+        Exception: on distance not positive.
+    """
+    if not distance > 0:
+        raise Exception(f"Cluster distance {distance} must be positive")
+    parent = list(range(len(coords)))
+
+    def _find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    cells = {}
+    for i, (x, y) in enumerate(coords):
+        col = math.floor(x / distance)
+        row = math.floor(y / distance)
+        for c in (col - 1, col, col + 1):
+            for r in (row - 1, row, row + 1):
+                for j in cells.get((c, r), []):
+                    dx = coords[j][0] - x
+                    dy = coords[j][1] - y
+                    if dx * dx + dy * dy <= distance * distance:
+                        ri = _find(i)
+                        rj = _find(j)
+                        if ri != rj:
+                            # Keep the earlier point as root
+                            parent[max(ri, rj)] = min(ri, rj)
+        try:
+            cells[(col, row)].append(i)
+        except KeyError:
+            cells[(col, row)] = [i]
+
+    cluster_ids = []
+    root_ids = {}
+    for i in range(len(coords)):
+        root = _find(i)
+        try:
+            cluster_ids.append(root_ids[root])
+        except KeyError:
+            root_ids[root] = len(root_ids)
+            cluster_ids.append(root_ids[root])
+    return cluster_ids
+
+
+# .............................................................................
+def set_xy_axis_order(srs):
+    """Set a spatial reference to take and return coordinates in x, y order.
+
+    Args:
+        srs (osr.SpatialReference): spatial reference to modify.
+
+    Returns:
+        srs, for chaining.
+
+    Note:
+        GDAL 3+ otherwise expects latitude before longitude for EPSG:4326.
+    """
+    if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+# .............................................................................
+def metric_srs():
+    """Create the spatial reference for METRIC_CRS, in x, y order.
+
+    Returns:
+        osr.SpatialReference
+
+    Raises:
+        Exception: on METRIC_CRS not readable by osr.
+    """
+    srs = osr.SpatialReference()
+    if srs.ImportFromProj4(METRIC_CRS) != 0:
+        raise Exception(f"Unable to read projection {METRIC_CRS}")
+    return set_xy_axis_order(srs)
+
+
+# .............................................................................
+def _get_metric_transform():
+    global _METRIC_TRANSFORM
+    if _METRIC_TRANSFORM is None:
+        src_srs = osr.SpatialReference()
+        src_srs.ImportFromEPSG(4326)
+        _METRIC_TRANSFORM = osr.CoordinateTransformation(
+            set_xy_axis_order(src_srs), metric_srs())
+    return _METRIC_TRANSFORM
+
+
+# .............................................................................
+def project_to_meters(longitude, latitude):
+    """Project decimal degree coordinates to meters in METRIC_CRS.
+
+    Args:
+        longitude (numpy.ndarray): longitudes, NaN for points without coordinates.
+        latitude (numpy.ndarray): latitudes, NaN for points without coordinates.
+
+    Returns:
+        x (numpy.ndarray): eastings in meters, NaN for points without coordinates.
+        y (numpy.ndarray): northings in meters, NaN for points without coordinates.
+
+    Note:
+        All points are projected in a single call to the coordinate transformation,
+        so Euclidean distances between the results are in meters.
+    """
+    longitude = np.asarray(longitude, dtype=np.float64)
+    latitude = np.asarray(latitude, dtype=np.float64)
+    x = np.full(longitude.shape, np.nan, dtype=np.float64)
+    y = np.full(latitude.shape, np.nan, dtype=np.float64)
+    good = ~(np.isnan(longitude) | np.isnan(latitude))
+    if good.any():
+        points = np.column_stack((longitude[good], latitude[good])).tolist()
+        projected = np.array(
+            _get_metric_transform().TransformPoints(points), dtype=np.float64)
+        x[good] = projected[:, 0]
+        y[good] = projected[:, 1]
+    return x, y
+
+
+# .............................................................................
+def point_in_polygon(x, y, ring):
+    """Test whether a point is inside a polygon, by ray casting.
+
+    Args:
+        x (float): x coordinate of the point.
+        y (float): y coordinate of the point.
+        ring (list): list of (x, y) vertices of the polygon boundary, in either
+            winding order; the last vertex may repeat the first.
+
+    Returns:
+        True if the point is inside the polygon, False otherwise.  Points exactly on
+            the boundary may fall on either side.
+    """
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        # Edge crosses the horizontal line through the point, right of the point
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+# .............................................................................
+def points_in_polygon(x, y, rings, max_cells=PIP_CHUNK_CELLS):
+    """Test whether points are inside a polygon, by ray casting all points at once.
+
+    Args:
+        x (numpy.ndarray): x coordinates of the points.
+        y (numpy.ndarray): y coordinates of the points.
+        rings (list): numpy.ndarray of shape (n, 2) for each boundary ring of the
+            polygon, exterior and holes, in any winding order.  Rings of all parts of
+            a multipolygon may be combined, if the parts do not overlap.
+        max_cells (int): most point-edge pairs compared in one array.
+
+    Returns:
+        numpy.ndarray of bool, True for points inside the polygon.  Points exactly on
+            the boundary may fall on either side.
+
+    Note:
+        A point is inside if a ray from it crosses the edges of all rings an odd
+        number of times, so holes are excluded without knowing which ring is the
+        exterior.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Edges as (x1, y1, x2, y2), closing each ring
+    edges = np.concatenate([
+        np.column_stack((ring, np.roll(ring, -1, axis=0))) for ring in rings])
+    x1, y1, x2, y2 = (edges[:, i][np.newaxis, :] for i in range(4))
+    inside = np.zeros(len(x), dtype=bool)
+    step = max(1, max_cells // len(edges))
+    for start in range(0, len(x), step):
+        px = x[start:start + step, np.newaxis]
+        py = y[start:start + step, np.newaxis]
+        # Edges spanning the horizontal line through each point; horizontal edges
+        # never span it, so their division by zero is discarded
+        spans = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crosses = spans & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+        inside[start:start + step] = (np.count_nonzero(crosses, axis=1) % 2) == 1
+    return inside
+
+
+# .............................................................................
+class PolygonIndex(object):
+    """Prepared polygons for locating many points at once.
+
+    Each polygon keeps its bounding box and edge rings.  Points are sorted by x once
+    per query, so each polygon tests only the points within the x range of its
+    bounding box, found by binary search, then within its y range, and only those
+    are tested against its edges.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self):
+        """Create an empty index."""
+        self.keys = []
+        self._rings = []
+        self._bboxes = []
+
+    # ...............................................
+    def insert(self, key, rings):
+        """Add a polygon to the index.
+
+        Args:
+            key (object): identifier returned by queries.
+            rings (list): list of [(x, y), ...] vertices for each boundary ring of
+                the polygon, exterior and holes, for all parts of a multipolygon.
+
+        Raises:
+            Exception: on a polygon without a ring of at least 3 vertices.
+        """
+        rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in rings]
+        rings = [ring for ring in rings if len(ring) >= 3]
+        if not rings:
+            raise Exception(f"Polygon {key} has no ring with 3 or more vertices")
+        allpts = np.concatenate(rings)
+        self.keys.append(key)
+        self._rings.append(rings)
+        self._bboxes.append((
+            allpts[:, 0].min(), allpts[:, 1].min(),
+            allpts[:, 0].max(), allpts[:, 1].max()))
+
+    # ...............................................
+    def locate(self, x, y):
+        """Find the polygon containing each point.
+
+        Args:
+            x (numpy.ndarray): x coordinates of the points, NaN for no coordinates.
+            y (numpy.ndarray): y coordinates of the points, NaN for no coordinates.
+
+        Returns:
+            numpy.ndarray of polygon indexes into keys, one per point, -1 for points
+                in no polygon or without coordinates.  A point in overlapping
+                polygons gets the first inserted.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        found = np.full(len(x), -1, dtype=np.int64)
+        # Points with coordinates, sorted by x
+        order = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        order = order[np.argsort(x[order], kind="stable")]
+        sorted_x = x[order]
+        for pidx, (min_x, min_y, max_x, max_y) in enumerate(self._bboxes):
+            lo = np.searchsorted(sorted_x, min_x, side="left")
+            hi = np.searchsorted(sorted_x, max_x, side="right")
+            cand = order[lo:hi]
+            cand = cand[(found[cand] < 0) & (y[cand] >= min_y) & (y[cand] <= max_y)]
+            if len(cand) > 0:
+                inside = points_in_polygon(x[cand], y[cand], self._rings[pidx])
+                found[cand[inside]] = pidx
+        return found
+
+    # ...............................................
+    def __len__(self):
+        return len(self.keys)
+
+
+# .............................................................................
+class SegmentIndex(object):
+    """Uniform grid over the segments of polylines for nearest-segment queries.
+
+    Each segment is bucketed into every cell its bounding box overlaps.  Queries
+    search rings of cells outward from the query point, stopping when no unsearched
+    cell can hold a closer segment, and compute distances to all segments of a ring
+    at once.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self, cell_size):
+        """Create an empty grid.
+
+        Args:
+            cell_size (float): width and height of each grid cell, in the same units
+                as line coordinates.
+
+        Raises:
+            Exception: on cell_size not positive.
+        """
+        if not cell_size > 0:
+            raise Exception(f"Grid cell size {cell_size} must be positive")
+        self.cell_size = cell_size
+        # Key and length of each line
+        self.keys = []
+        self.lengths = []
+        # Per segment: (x1, y1, x2, y2), line index, distance along line to its start
+        self._segs = []
+        self._seg_line = []
+        self._seg_start = []
+        # {(col, row): [segment index, ...], ...}
+        self._cells = {}
+        self._min_col = self._min_row = self._max_col = self._max_row = None
+        # Arrays of segment values, built on first query
+        self._arrays = None
+
+    # ...............................................
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    # ...............................................
+    def insert_line(self, key, coords):
+        """Add the segments of a polyline to the grid.
+
+        Args:
+            key (object): identifier of the line, returned by queries.
+            coords (list): list of (x, y) vertices of the line, in order.
+
+        Returns:
+            index of the line in keys.
+        """
+        line_idx = len(self.keys)
+        along = 0.0
+        for (x1, y1, *_), (x2, y2, *_) in zip(coords[:-1], coords[1:]):
+            seg_idx = len(self._segs)
+            self._segs.append((x1, y1, x2, y2))
+            self._seg_line.append(line_idx)
+            self._seg_start.append(along)
+            along += math.hypot(x2 - x1, y2 - y1)
+            min_col, min_row = self._cell(min(x1, x2), min(y1, y2))
+            max_col, max_row = self._cell(max(x1, x2), max(y1, y2))
+            for col in range(min_col, max_col + 1):
+                for row in range(min_row, max_row + 1):
+                    try:
+                        self._cells[(col, row)].append(seg_idx)
+                    except KeyError:
+                        self._cells[(col, row)] = [seg_idx]
+            if self._min_col is None:
+                self._min_col, self._min_row = min_col, min_row
+                self._max_col, self._max_row = max_col, max_row
+            else:
+                self._min_col = min(self._min_col, min_col)
+                self._min_row = min(self._min_row, min_row)
+                self._max_col = max(self._max_col, max_col)
+                self._max_row = max(self._max_row, max_row)
+        self.keys.append(key)
+        self.lengths.append(along)
+        self._arrays = None
+        return line_idx
+
+    # ...............................................
+    def _get_arrays(self):
+        if self._arrays is None:
+            segs = np.array(self._segs, dtype=np.float64).reshape(-1, 4)
+            self._arrays = (
+                segs[:, 0], segs[:, 1], segs[:, 2], segs[:, 3],
+                np.array(self._seg_line, dtype=np.int64),
+                np.array(self._seg_start, dtype=np.float64),
+                {cell: np.array(ids, dtype=np.int64)
+                 for cell, ids in self._cells.items()})
+        return self._arrays
+
+    # ...............................................
+    def nearest(self, x, y, max_distance):
+        """Find the nearest segment to each of many points.
+
+        Args:
+            x (numpy.ndarray): x coordinates of the points, NaN for no coordinates.
+            y (numpy.ndarray): y coordinates of the points, NaN for no coordinates.
+            max_distance (float): greatest distance from a point to its segment.
+
+        Returns:
+            line_idx (numpy.ndarray): index into keys of the line with the nearest
+                segment to each point, -1 for points without coordinates or with no
+                segment within max_distance.
+            distance (numpy.ndarray): perpendicular distance from each point to the
+                nearest segment, or to its closest end, NaN where line_idx is -1.
+            along (numpy.ndarray): distance along the line, from its first vertex, to
+                the point on the segment closest to each point, NaN where line_idx is
+                -1.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        line_idx = np.full(len(x), -1, dtype=np.int64)
+        distance = np.full(len(x), np.nan, dtype=np.float64)
+        along = np.full(len(x), np.nan, dtype=np.float64)
+        if not self._segs:
+            return line_idx, distance, along
+        x1, y1, x2, y2, seg_line, seg_start, cells = self._get_arrays()
+        dx = x2 - x1
+        dy = y2 - y1
+        len2 = dx * dx + dy * dy
+        # Rings beyond max_distance hold no segment close enough
+        max_r = math.ceil(max_distance / self.cell_size) + 1
+        bounds = (self._min_col, self._min_row, self._max_col, self._max_row)
+        for i in np.flatnonzero(~(np.isnan(x) | np.isnan(y))).tolist():
+            px = x[i]
+            py = y[i]
+            col, row = self._cell(px, py)
+            r, last_r = _grid_ring_range(col, row, bounds)
+            last_r = min(max_r, last_r)
+            best_dist = np.inf
+            best_seg = -1
+            best_t = 0.0
+            while r <= last_r:
+                ids = [
+                    cells[cell] for cell in _grid_ring(col, row, r, bounds)
+                    if cell in cells]
+                if ids:
+                    ids = np.concatenate(ids)
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        t = (
+                            (px - x1[ids]) * dx[ids] + (py - y1[ids]) * dy[ids]
+                        ) / len2[ids]
+                    # Zero-length segments are their start point
+                    t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+                    dist = np.hypot(
+                        px - (x1[ids] + t * dx[ids]), py - (y1[ids] + t * dy[ids]))
+                    j = int(np.argmin(dist))
+                    if dist[j] < best_dist:
+                        best_dist = float(dist[j])
+                        best_seg = int(ids[j])
+                        best_t = float(t[j])
+                # Unsearched segments are outside rings 0..r, at least r cells away
+                if best_dist <= r * self.cell_size:
+                    break
+                r += 1
+            if best_seg >= 0 and best_dist <= max_distance:
+                line_idx[i] = seg_line[best_seg]
+                distance[i] = best_dist
+                along[i] = seg_start[best_seg] + best_t * math.sqrt(len2[best_seg])
+        return line_idx, distance, along
+
+    # ...............................................
+    def __len__(self):
+        return len(self._segs)
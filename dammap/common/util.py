@@ -9,6 +9,7 @@ import time
 
 from dammap.common.constants import MAC_PATH, IMAGE_EXTENSIONS
 from dammap.common.constants import DAM_PREFIX, SEPARATOR
+from dammap.common.fileplan import FileOpPlan
 
 LOG_FORMAT = ' '.join(["%(asctime)s",
                        "%(module)s.%(funcName)s",
@@ -62,6 +63,42 @@ def stamp(log, msg):
         msg, t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec))
 
 
+# .............................................................................
+class MessageLog(object):
+    """Stand-in for a logger that keeps messages, for workers to return to a parent.
+
+    A logging.Logger is pickled by name only, so in a spawned worker process it has
+    no handlers and its messages are lost.  Workers log to a MessageLog instead, and
+    return its messages for the parent process to log.
+    """
+    # ............................................................................
+    # Constructor
+    # .............................................................................
+    def __init__(self):
+        # [(level, msg), ...] in the order logged
+        self.messages = []
+
+    # ...............................................
+    def log(self, level, msg):
+        self.messages.append((level, msg))
+
+    # ...............................................
+    def debug(self, msg):
+        self.log(logging.DEBUG, msg)
+
+    # ...............................................
+    def info(self, msg):
+        self.log(logging.INFO, msg)
+
+    # ...............................................
+    def warning(self, msg):
+        self.log(logging.WARNING, msg)
+
+    # ...............................................
+    def error(self, msg):
+        self.log(logging.ERROR, msg)
+
+
 # ...............................................
 def do_recognize_image_file(fname):
     # Read only non-hidden image files
@@ -72,24 +109,23 @@ def do_recognize_image_file(fname):
     return False
 
 # ...............................................
-def identify_path_element(full_name):
-    """Identify whether the path element is an image file, a dam name, or arroyo name.
+def classify_path_element(name, is_dir):
+    """Identify whether a name is an image file, a dam name, or arroyo name.
 
     Args:
-        full_name: full path to a filename or directory name
+        name: basename of a file or directory
+        is_dir: True if the name is a directory
 
     Returns:
         One of "image", "dam", "arroyo", or None
     """
-    head, tail = os.path.split(full_name)
     # Read only non-hidden files/dirs
-    if not tail.startswith("."):
-        if os.path.isfile(full_name):
-            for ext in IMAGE_EXTENSIONS:
-                if full_name.lower().endswith(ext):
-                    return "image"
+    if not name.startswith("."):
+        if not is_dir:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                return "image"
         else:
-            parts = tail.split(SEPARATOR)
+            parts = name.split(SEPARATOR)
             try:
                 int(parts[0])
                 return "arroyo"
@@ -99,23 +135,91 @@ def identify_path_element(full_name):
     return None
 
 # ...............................................
-def merge_files_into_tree(frompath, topath):
+def identify_path_element(full_name):
+    """Identify whether the path element is an image file, a dam name, or arroyo name.
+
+    Args:
+        full_name: full path to a filename or directory name
+
+    Returns:
+        One of "image", "dam", "arroyo", or None
+    """
+    head, tail = os.path.split(full_name)
+    return classify_path_element(tail, not os.path.isfile(full_name))
+
+# ...............................................
+def _scan_dir(path):
+    with os.scandir(path) as it:
+        return list(it)
+
+# ...............................................
+def walk_image_tree(image_path, is_dam_separated=False):
+    """Yield image files in an arroyo/image or arroyo/dam/image directory tree.
+
+    Args:
+        image_path: root directory containing arroyo directories
+        is_dam_separated: True if images are organized in arroyo/dam/image
+            directories, False for arroyo/image directories.
+
+    Yields:
+        arroyo_entry (os.DirEntry): arroyo directory containing the image
+        dam_entry (os.DirEntry): dam directory containing the image, None if not
+            is_dam_separated
+        image_entry (os.DirEntry): image file
+
+    Note:
+        Entries are classified by name and the file type returned by os.scandir, so
+        no stat is required.  Entries are yielded in directory order.
+    """
+    for arr_entry in _scan_dir(image_path):
+        if classify_path_element(arr_entry.name, arr_entry.is_dir()) == "arroyo":
+            level2 = _scan_dir(arr_entry.path)
+            if not is_dam_separated:
+                # Level 2 should be images
+                for entry in level2:
+                    if classify_path_element(entry.name, entry.is_dir()) == "image":
+                        yield arr_entry, None, entry
+            else:
+                # Level 2 should be dams
+                for dam_entry in level2:
+                    if classify_path_element(dam_entry.name, dam_entry.is_dir()) == "dam":
+                        for entry in _scan_dir(dam_entry.path):
+                            if classify_path_element(
+                                    entry.name, entry.is_dir()) == "image":
+                                yield arr_entry, dam_entry, entry
+
+# ...............................................
+def merge_files_into_tree(
+        frompath, topath, dry_run=False, journal_fname=None, logger=None):
+    """Move files from directories in one tree into same-named directories in another.
+
+    Args:
+        frompath: base directory of the files to move.
+        topath: base directory receiving the files, in a directory named like the
+            parent directory of each file.
+        dry_run: If True, log the planned moves without moving any files.
+        journal_fname: full filename of a journal of completed moves, to resume or
+            roll back an interrupted run with FileOpPlan.
+        logger: logger for recording messages to file or command line.
+
+    Returns:
+        count of moves performed, or planned if dry_run.
+
+    Note:
+        Moves onto existing files are skipped.
+    """
+    plan = FileOpPlan(logger=logger)
     for root, dirlist, files in os.walk(frompath):
         # for dir in dirlist:
         for fname in files:
             if not fname.startswith("."):
                 arroyo_dir = os.path.split(root)[1]
                 from_filename = os.path.join(root, fname)
-                dest_path = os.path.join(topath, arroyo_dir)
-                to_filename = os.path.join(dest_path, fname)
-                # Test before move
-                if os.path.exists(to_filename):
-                    print(f"Old file {to_filename} already exists")
-                else:
-                    if not os.path.exists(dest_path):
-                        os.mkdir(dest_path)
-                    os.rename(from_filename, to_filename)
-                    print("Rename {} --> {}".format(from_filename, to_filename))
+                to_filename = os.path.join(topath, arroyo_dir, fname)
+                plan.add_rename(from_filename, to_filename)
+    if dry_run:
+        return len(plan.dry_run(skip_invalid=True))
+    return plan.execute(journal_fname=journal_fname, skip_invalid=True)
 
 # ...............................................
 def rename_in_place(from_fullfname, to_basefname):
@@ -326,7 +430,7 @@ def get_csv_writer(datafile, delimiter, doAppend=True):
         mode = 'w'
 
     try:
-        f = open(datafile, mode, newline="")
+        f = open(datafile, mode, newline="", encoding="utf-8")
         writer = csv.writer(f, delimiter=delimiter)
     except Exception as e:
         raise Exception('Failed to read or open {}, ({})'
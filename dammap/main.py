@@ -3,10 +3,14 @@ import datetime
 import os
 
 from dammap.common.constants import (
-    ALL_DATA_KEYS as ADK, AGG_DIR, MAC_PATH, EARLY_DATA_DIR, THUMB_DIR, THUMB_WIDTH, DAM_BUFFER,
-    MAX_X, MAX_Y, MIN_X, MIN_Y, SURVEY_DIR, SURVEY_DAMSEP_DIR, OUT_DIR)
+    ALL_DATA_KEYS as ADK, AGG_DIR, ANC_DIR, MAC_PATH, EARLY_DATA_DIR, THUMB_DIR,
+    DAM_BUFFER, DRAINAGE_DIR, DUPES_FNAME, DUPES_SHPFNAME, FLOWLINE_FNAME,
+    MANIFEST_FNAME, MAX_X, MAX_Y, META_CACHE_FNAME, MIN_X, MIN_Y, SURVEY_DIR,
+    SURVEY_DAMSEP_DIR, OUT_DIR)
+from dammap.common.ancillary import FlowNetwork, read_drainage_index
+from dammap.common.metacache import MetaCache
 from dammap.common.organize import (
-    create_dam_subdir_structure_for_unique_dams, match_dams_to_survey, match_old_coords_to_arroyo,
+    create_dam_subdir_structure_for_unique_dams, match_all_old_coords, match_dams_to_survey,
     standardize_camera_filenames)
 from dammap.common.util import (get_logger, stamp)
 from dammap.transform.dam_map import PicMapper
@@ -14,28 +18,21 @@ from dammap.transform.dam_map import PicMapper
 kml_flag = False
 shp_flag = False
 
-def compare_to_groundtruth(grtruth, early):
-    """
+def compare_to_groundtruth(grtruth, early, logger):
+    """Match early images to the closest ground-truth dam in their arroyo.
 
     Args:
-        grtruth: dict containing ground truth arroyo name keys and values list of
-            relative filenames {arroyo_name: [rel_fname, ...], ...}
-        early: dict containing old survey arroyo name keys and values list of
-            relative filenames {arroyo_name: [rel_fname, ...], ...}
+        grtruth: all_data dict of a PicMapper of ground-truth images.
+        early: all_data dict of a PicMapper of old survey images.
+        logger: logger for recording messages to file or command line.
 
     Returns:
-
+        dam_calcs: {arroyo_name: {dam_name: [DamMeta, ...], ...}, ...}
+        mismatches: list of early images closer to a dam in another arroyo, as
+            returned by match_all_old_coords.
     """
-    gt_arroyo_files = grtruth[ADK.ARROYO_FILES]
-    gt_img_meta = grtruth[ADK.IMAGE_META]
-    old_arroyo_files = early[ADK.ARROYO_FILES]
-    old_img_meta = early[ADK.IMAGE_META]
-    # for each survey/ground-truth arroyo name, list of filenames
-    for arr_name, arr_gt_rfnames in gt_arroyo_files.items():
-        arr_old_fnames = old_arroyo_files[arr_name]
-        match_old_coords_to_arroyo(
-            arr_name, arr_gt_rfnames, arr_old_fnames, gt_img_meta, old_img_meta,
-            AGG_DIR)
+    return match_all_old_coords(
+        grtruth[ADK.IMAGE_META], early[ADK.IMAGE_META], logger)
 
 # ...............................................
 if __name__ == "__main__":
@@ -62,33 +59,62 @@ if __name__ == "__main__":
     csv_fname = "{}.csv".format(base_fname)
     shp_fname = "{}.shp".format(base_fname)
     kml_fname = "{}.kml".format(base_fname)
+    kmz_fname = "{}.kmz".format(base_fname)
 
     is_dev = False
     bbox =( MIN_X, MIN_Y, MAX_X, MAX_Y)
 
     # # Rename image files to be standard
-    # standardize_camera_filenames(surveypath)
+    # standardize_camera_filenames(surveypath, logger)
 
     # Separate 2025_survey data into one image per dam
-    # create_dam_subdir_structure_for_unique_dams(surveypath, organized_surveypath)
+    # create_dam_subdir_structure_for_unique_dams(surveypath, organized_surveypath, logger)
 
     # # Match dams from early surveys to "ground-truth" survey and organize them together
     # dam_calcs = match_dams_to_survey(earlypath, gt_damsep_path, aggregate_path, logger)
 
-    # Reread all dams from the aggregated/organized total
-    pm = PicMapper(aggregate_path, buffer_distance=DAM_BUFFER, logger=logger)
-    read_count = pm.populate_images(is_dam_separated=True)
+    # Cache of image metadata, to skip re-reading unchanged images
+    meta_cache = MetaCache(
+        os.path.join(outpath, META_CACHE_FNAME), MAC_PATH, logger=logger)
+
+    # Reread all dams from the aggregated/organized total, or only new and changed
+    # images if a manifest from a previous run exists
+    manifest_fname = os.path.join(outpath, MANIFEST_FNAME)
+    pm = PicMapper(
+        aggregate_path, buffer_distance=DAM_BUFFER, meta_cache=meta_cache, logger=logger)
+    if os.path.exists(manifest_fname):
+        pm.load_manifest(manifest_fname)
+        pm.update_images(workers=os.cpu_count())
+        read_count = pm.all_data[ADK.IMG_COUNT]
+    else:
+        read_count = pm.populate_images(is_dam_separated=True, workers=os.cpu_count())
+    pm.write_manifest(manifest_fname)
     logger.info(f"Read {read_count} filenames")
+    meta_cache.close()
 
-    # # Rewrite thumbnails of all images
-    # # TODO: failing to resize TIFF images
-    # total = pm.resize_images(outpath, THUMB_WIDTH, overwrite=False)
-    # logger.info(f"Wrote {total} thumbnails")
+    # Tag images with the drainage polygon they fall in, if drainages are available
+    drainage_path = os.path.join(MAC_PATH, ANC_DIR, DRAINAGE_DIR)
+    if os.path.exists(drainage_path):
+        pm.tag_drainages(read_drainage_index(drainage_path, logger=logger))
+    # Snap images to the nearest flowline, with their distance along the channel
+    flowline_fname = os.path.join(MAC_PATH, ANC_DIR, FLOWLINE_FNAME)
+    if os.path.exists(flowline_fname):
+        pm.snap_to_flowlines(FlowNetwork.read(flowline_fname, logger=logger))
+
+    # Rewrite thumbnails of new or changed images, at all THUMB_SIZES
+    total = pm.resize_images(outpath, overwrite=False, workers=os.cpu_count())
+    logger.info(f"Wrote {total} thumbnails")
 
     # Write data to CSV, Shapefile, KML
-    pm.write_outputs(csvfname=csv_fname, shpfname=shp_fname)
+    pm.write_outputs(csvfname=csv_fname, shpfname=shp_fname, kmlfname=kmz_fname)
     # pm.write_outputs(shpfname=shp_fname)
-    logger.info(f"Wrote CSV file {csv_fname}, shapefile {shp_fname}")
+    logger.info(
+        f"Wrote CSV file {csv_fname}, shapefile {shp_fname}, KMZ file {kmz_fname}")
+
+    # Write images sharing coordinates, replacing the duplicate_coords snapshot
+    dupes_fname = os.path.join(outpath, f"{DUPES_FNAME}.json")
+    dupes_shpfname = os.path.join(outpath, DUPES_SHPFNAME)
+    pm.write_duplicates(dupes_fname, shpfname=dupes_shpfname)
 
     # Write out summary
     # pm.print_duplicates()
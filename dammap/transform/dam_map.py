@@ -1,23 +1,217 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import exifread
+import heapq
+import json
 from logging import INFO, WARN
+import numpy as np
 import os
 from osgeo import ogr, osr
 from PIL import Image
+import zlib
 
 from dammap.common.constants import (
-    MAC_PATH, DELIMITER, ANC_DIR, THUMB_DIR, OUT_DIR, SAT_FNAME, RESIZE_WIDTH, ARROYO_COUNT,
-    IMAGE_COUNT, SHP_FIELDS)
+    MAC_PATH, DELIMITER, ANC_DIR, THUMB_DIR, OUT_DIR, SAT_FNAME, ARROYO_COUNT,
+    DUPES_CSV_FIELDS, DUPES_SHP_FIELDS, FEATURE_BATCH, FLOW_MAX_DISTANCE, IMAGE_COUNT,
+    KML_TILE_MAX, SHP_FIELDS, THUMB_SIZES, VECTOR_DRIVERS)
+from dammap.common.columns import ImageColumns
 from dammap.common.name import DamNameOp
 from dammap.common.util import (
-    get_csv_dict_reader, get_csv_dict_writer, get_logger,
-    identify_path_element, ready_filename)
-from dammap.common.dammeta import DamMeta
+    MessageLog, get_csv_dict_reader, get_csv_writer, get_logger, ready_filename,
+    walk_image_tree)
+from dammap.common.dammeta import DamMeta, RECORD_FIELDS
+from dammap.common.spatial import cluster_within_distance
+from dammap.transform.kml import write_kml, write_region_kml
+from dammap.transform.table import read_table, write_table
 
 from dammap.common.constants import ALL_DATA_KEYS as ADK
 from dammap.common.constants import IMAGE_KEYS as IK
 
 # DELETE_CHARS = ["\"", ",", """, " ", "(", ")", "_"]
 
+# Position of coordinates in DamMeta.row
+_LON_IDX = RECORD_FIELDS.index(IK.LON)
+_LAT_IDX = RECORD_FIELDS.index(IK.LAT)
+
+
+# .............................................................................
+def read_image_file(
+        fullfname, image_path, is_dam_separated, logger, img_meta=None,
+        img_filter=None):
+    """Check the filename and read the metadata for one image file.
+
+    Module-level so that it can be dispatched to a process pool.
+
+    Args:
+        fullfname (str): full path to the image file.
+        image_path (str): root path for image files, used for relative filenames.
+        is_dam_separated (bool): True if images are organized in arroyo/dam/image
+            directories, False for arroyo/image directories.
+        logger (object): logger for recording messages to file or command line.
+        img_meta (dict): cached metadata parsed from the image file, if available.
+        img_filter (dammap.common.imgfilter.ImageFilter): optional area and date
+            range of images to keep.
+
+    Returns:
+        ret_fname (str): filename returned by DamNameOp.check_filename, None if the
+            image cannot be read.
+        dimg (DamMeta): object with metadata for the image, None if ret_fname is None
+            or the image is rejected by img_filter.
+        img_meta (dict): metadata parsed from the image file, if it was read before
+            building dimg, otherwise None.
+    """
+    dimg = None
+    # Metadata read to rename a camera-named file is reused for DamMeta
+    ret_fname, img_meta = DamNameOp.check_filename(
+        image_path, fullfname, logger, img_meta=img_meta)
+    if ret_fname is not None:
+        if img_filter is not None:
+            # Test the GPS and date values before building DamMeta
+            if img_meta is None:
+                img_meta = DamMeta.read_image_meta(fullfname, logger)
+            if not img_filter.accepts(img_meta):
+                return ret_fname, None, img_meta
+        dimg = DamMeta(
+            fullfname, image_path, is_dam_separated=is_dam_separated,
+            img_meta=img_meta, logger=logger)
+    return ret_fname, dimg, img_meta
+
+
+# .............................................................................
+def read_image_file_messages(
+        fullfname, image_path, is_dam_separated, img_meta=None, img_filter=None):
+    """Read one image file with read_image_file, returning its log messages.
+
+    Module-level so that it can be dispatched to a process pool, where a logger
+    passed from the parent has no handlers.
+
+    Args:
+        fullfname (str): full path to the image file.
+        image_path (str): root path for image files, used for relative filenames.
+        is_dam_separated (bool): True if images are organized in arroyo/dam/image
+            directories, False for arroyo/image directories.
+        img_meta (dict): cached metadata parsed from the image file, if available.
+        img_filter (dammap.common.imgfilter.ImageFilter): optional area and date
+            range of images to keep.
+
+    Returns:
+        ret_fname, dimg and img_meta as returned by read_image_file, and a list of
+            (level, msg) for the messages logged while reading, for the caller to
+            log.  dimg holds no logger; the caller must set one.
+    """
+    msg_log = MessageLog()
+    ret_fname, dimg, img_meta = read_image_file(
+        fullfname, image_path, is_dam_separated, msg_log, img_meta=img_meta,
+        img_filter=img_filter)
+    if dimg is not None:
+        dimg._logger = None
+    return ret_fname, dimg, img_meta, msg_log.messages
+
+
+# .............................................................................
+def thumbnail_filename(outpath, thumb_dir, relfname):
+    """Construct the filename of a thumbnail for an image.
+
+    Args:
+        outpath (str): output path
+        thumb_dir (str): subdirectory of outpath for thumbnails of one size.
+        relfname (str): filename of the original image relative to image_path.
+
+    Returns:
+        full filename of the thumbnail.  Thumbnails are always JPEG, so TIFF images
+            get a .jpg extension.
+    """
+    basename, ext = os.path.splitext(relfname)
+    if ext.lower() != ".jpg":
+        ext = ".jpg"
+    return os.path.join(outpath, thumb_dir, f"{basename}{ext}")
+
+
+# .............................................................................
+def write_thumbnails(fullfname, targets, overwrite=True):
+    """Write reduced copies of one image file at one or more widths.
+
+    Module-level so that it can be dispatched to a process pool.
+
+    Args:
+        fullfname (str): full path to the original image file.
+        targets (list): list of (thumb_width, thumb_fname) for each thumbnail, with
+            width in pixels and full path to the thumbnail file.  Images narrower
+            than a width are copied at their original size.
+        overwrite (bool): flag indicating whether to rewrite existing thumbnails.
+            If False, rewrite only thumbnails older than the original.
+
+    Returns:
+        list of (thumb_fname, msg) in the same order as targets, where thumb_fname is
+            None if the thumbnail could not be written, and msg describes the result,
+            for logging.
+
+    Note:
+        The original is decoded once.  JPEG images are decoded in draft mode, which
+        scales by 1/2, 1/4 or 1/8 during decoding, to the smallest size no smaller
+        than the largest thumbnail.  Each smaller thumbnail is reduced from the next
+        larger one.
+    """
+    results = [None] * len(targets)
+    todo = []
+    for idx, (thumb_width, thumb_fname) in enumerate(targets):
+        if (not overwrite and os.path.exists(thumb_fname)
+                and os.path.getmtime(thumb_fname) >= os.path.getmtime(fullfname)):
+            results[idx] = (
+                thumb_fname, f"Kept current thumbnail {os.path.basename(thumb_fname)}")
+        else:
+            todo.append(idx)
+    if not todo:
+        return results
+
+    try:
+        image = Image.open(fullfname)
+    except Exception as e:
+        for idx in todo:
+            results[idx] = (None, f" *** Unable to open file {fullfname}, {e}")
+        return results
+    with image:
+        orig_width, orig_height = image.size
+        # Largest first, so each level is reduced from the previous one
+        todo.sort(key=lambda idx: targets[idx][0], reverse=True)
+        try:
+            max_width = targets[todo[0]][0]
+            if max_width < orig_width:
+                # Only affects JPEG images
+                image.draft(
+                    "RGB", (max_width, int(orig_height * max_width / orig_width)))
+            # Thumbnails are JPEG, which requires RGB or L (greyscale) images
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+        except Exception as e:
+            for idx in todo:
+                results[idx] = (None, f"Failed to decode image {fullfname} ({e})")
+            return results
+
+        level = image
+        for idx in todo:
+            thumb_width, thumb_fname = targets[idx]
+            thumb_base = os.path.basename(thumb_fname)
+            try:
+                if thumb_width < orig_width:
+                    thumb_height = int(
+                        float(orig_height) * (thumb_width / float(orig_width)))
+                    if thumb_width < level.size[0]:
+                        level = level.resize(
+                            (thumb_width, thumb_height), Image.LANCZOS)
+                    msg = (f"Reduced image {thumb_base} width {orig_width} to "
+                           f"{thumb_width}")
+                else:
+                    msg = (f"Copied image {thumb_base} original width {orig_width} "
+                           f"as thumbnail")
+                if ready_filename(thumb_fname, overwrite=True):
+                    level.save(thumb_fname, "JPEG")
+            except Exception as e:
+                results[idx] = (
+                    None, f"Failed to copy image {thumb_base} as thumbnail ({e})")
+            else:
+                results[idx] = (thumb_fname, msg)
+    return results
+
 
 # .............................................................................
 class PicMapper(object):
@@ -28,13 +222,17 @@ class PicMapper(object):
 # Constructor
 # .............................................................................
     def __init__(
-            self, image_path, buffer_distance=.0002, bbox=(-180, -90, 180, 90), logger=None):
+            self, image_path, buffer_distance=20.0, bbox=(-180, -90, 180, 90),
+            meta_cache=None, logger=None):
         """
         Args:
             image_path: Root path for image files to be processed
-            buffer_distance: Buffer in which coordinates are considered to be the same location
+            buffer_distance: Buffer, in meters, in which coordinates are considered
+                to be the same location
             bbox: Bounds of the output data, in (min_x, min_y, max_x, max_y) format.  Outside these
                 bounds, images will be discarded
+            meta_cache (dammap.common.metacache.MetaCache): optional cache of image
+                metadata, consulted before reading image files.
             logger (object): logger for error logging
         """
         self.base_path, _ = os.path.split(image_path)
@@ -47,28 +245,73 @@ class PicMapper(object):
         self._min_y = bbox[1]
         self._max_x = bbox[2]
         self._max_y = bbox[3]
+        self._meta_cache = meta_cache
+        self.all_data = {}
+        # Stat and DamMeta (None if skipped) for every image file read,
+        #   {relfname: (size, mtime_ns, DamMeta), ...}
+        self._files = {}
+        # Stat of every image file rejected by img_filter, {relfname: (size, mtime_ns)}
+        self._filtered = {}
+        self._img_filter = None
+        self._is_dam_separated = False
+        # Columnar view of all_data[IMAGE_META], built on demand
+        self._columns = None
+        # Images sharing coordinates, from all_data[UNIQUE_COORDS], built on demand
+        self._duplicates = None
         if not logger:
             logger, logfname = get_logger(os.path.join(self.base_path, OUT_DIR))
         self._logger = logger
 
     # ...............................................
-    def _create_layer(self, fields, shpFname):
+    def _create_layer(self, fields, vector_fname, overwrite=True):
+        """Create a point dataset and layer, with a driver chosen by file extension.
+
+        Args:
+            fields (list): list of (fldname, OGR field type) for layer attributes.
+            vector_fname (str): full filename of the output, with an extension in
+                VECTOR_DRIVERS.
+            overwrite (bool): flag indicating whether to overwrite an existing file.
+
+        Returns:
+            ds (ogr.DataSource): open dataset, None if the file exists and overwrite
+                is False.
+            lyr (ogr.Layer): layer in ds, None if ds is None.
+
+        Raises:
+            Exception: on unsupported file extension.
+            Exception: on failure to create the dataset, layer or a field.
+        """
+        ext = os.path.splitext(vector_fname)[1].lower()
+        try:
+            driver_name = VECTOR_DRIVERS[ext]
+        except KeyError:
+            raise Exception(
+                f"Unsupported vector extension {ext}, use one of "
+                f"{list(VECTOR_DRIVERS.keys())}")
         ogr.RegisterAll()
-        drv = ogr.GetDriverByName("ESRI Shapefile")
+        drv = ogr.GetDriverByName(driver_name)
+        if drv is None:
+            raise Exception(f"OGR driver {driver_name} is not available")
+        if os.path.exists(vector_fname):
+            if not overwrite:
+                return None, None
+            # Driver deletes all files of a dataset, such as .shx and .dbf
+            drv.DeleteDataSource(vector_fname)
+        ready_filename(vector_fname, overwrite=overwrite)
         tSRS = osr.SpatialReference()
         tSRS.ImportFromEPSG(4326)
         try:
             # Create the file object
-            ds = drv.CreateDataSource(shpFname)
+            ds = drv.CreateDataSource(vector_fname)
             if ds is None:
-                raise Exception("Dataset creation failed for %s" % shpFname)
+                raise Exception("Dataset creation failed for %s" % vector_fname)
             # Create a layer
             lyr = ds.CreateLayer("anayaSprings", geom_type=ogr.wkbPoint, srs=tSRS)
             if lyr is None:
-                raise Exception("Layer creation failed for %s." % shpFname)
+                raise Exception("Layer creation failed for %s." % vector_fname)
         except Exception as e:
             raise Exception("Failed creating dataset or layer for %s (%s)"
-                                  % (shpFname, str(e)))
+                                  % (vector_fname, str(e)))
         # Create attributes
         for (fldname, fldtype) in fields:
             fldDefn = ogr.FieldDefn(fldname, fldtype)
@@ -104,131 +347,32 @@ class PicMapper(object):
         return "{}-{}-{}".format(yr, mo, day)
 
     # ...............................................
-    def _create_feat_shp(self, lyr, damrec):
-        if damrec[IK.IN_BNDS] == 1:
-            wkt = damrec[IK.WKT]
-            feat = ogr.Feature( lyr.GetLayerDefn() )
-            for fldname, _fldtype in SHP_FIELDS:
-                val = damrec[fldname]
-                if fldname in (IK.IMG_DATE, IK.DAM_DATE):
-                    val = self._format_date(damrec[fldname])
-                # elif fldname in (IK.VERB_LON, IK.VERB_LON_DIR, IK.VERB_LAT, IK.VERB_LAT_DIR):
-                #     val = f"{damrec[fldname]}"
-                try:
-                    feat.SetField(fldname, val)
-                except Exception as e:
-                    self._logger.warn(f"Failed to SetField for field {fldname}, value {val}, err = {e}")
-            geom = ogr.CreateGeometryFromWkt(wkt)
-            feat.SetGeometryDirectly(geom)
-            # Create new feature, setting FID, in this layer
-            lyr.CreateFeature(feat)
-            feat.Destroy()
+    def _create_feat_shp(self, lyr, defn, field_idxs, row):
+        """Create a point feature in a layer from a DamMeta row.
 
-    # ...............................................
-    def _create_feat_kml(self, kmlf, rel_thumbfname, damrec):
-        """
-        <img style="max-width:500px;"
-         dammap="file:///Users/astewart/Home/2017AnayaPics/18-LL-Spring/SpringL1-20150125_0009.JPG">
-         SpringL1-20150125_0009 in 18-LL-Spring on 2015-1-25
-        """
-        if damrec[IK.IN_BNDS] is False:
-            pass
-        else:
-            [yr, mo, day] = damrec[IK.IMG_DATE]
-            xdd = damrec[IK.LON]
-            ydd = damrec[IK.LAT]
-            arroyo = damrec[IK.ARROYO_NAME]
-            _, basefname = os.path.split(rel_thumbfname)
-            basename, _ = os.path.splitext(basefname)
-            dt = f"{yr}-{mo}-{day}"
-
-            kmlf.write("  <Placemark>\n")
-            kmlf.write(f"    <name>{basefname}</name>\n")
-            kmlf.write(f"    <description>{basename} in {arroyo} on {dt}</description>\n")
-            kmlf.write(f"    <img style='max-width:{RESIZE_WIDTH}px;' dammap='{rel_thumbfname}' />\n")
-            kmlf.write(f"    <Point><coordinates>{xdd},{ydd}</coordinates></Point>\n")
-            kmlf.write("  </Placemark>\n")
-
-    # ...............................................
-    def _create_lookat_kml(self, kmlf, rel_thumbfname, damrec):
-        """
-         <LookAt id="ID">
-              <!-- inherited from AbstractView element -->
-              <Placemark>
-                <name>LookAt.kml</name>
-                <LookAt>
-                  <gx:TimeStamp>
-                    <when>1994</when>
-                  </gx:TimeStamp>
-                  <longitude>-122.363</longitude>
-                  <latitude>37.81</latitude>
-                  <altitude>2000</altitude>
-                  <range>500</range>
-                  <tilt>45</tilt>
-                  <heading>0</heading>
-                  <altitudeMode>relativeToGround</altitudeMode>
-                </LookAt>
-                <Point>
-                  <coordinates>-122.363,37.82,0</coordinates>
-                </Point>
-              </Placemark>
-
-              <!-- specific to LookAt -->
-              <longitude>0</longitude>            <!-- kml:angle180 -->
-              <latitude>0</latitude>              <!-- kml:angle90 -->
-              <altitude>0</altitude>              <!-- double -->
-              <heading>0</heading>                <!-- kml:angle360 -->
-              <tilt>0</tilt>                      <!-- kml:anglepos90 -->
-              <range></range>                     <!-- double -->
-              <altitudeMode>clampToGround</altitudeMode>
-                      <!--kml:altitudeModeEnum:clampToGround, relativeToGround, absolute -->
-                      <!-- or, gx:altitudeMode can be substituted: clampToSeaFloor, relativeToSeaFloor -->
-         </LookAt>
+        Args:
+            lyr (ogr.Layer): layer to write to.
+            defn (ogr.FeatureDefn): feature definition of lyr.
+            field_idxs (list): index in defn of each field in RECORD_FIELDS.
+            row (tuple): DamMeta.row for an image with valid coordinates.
         """
-        if damrec[IK.IN_BNDS] is False:
-            pass
-        else:
+        feat = ogr.Feature(defn)
+        for idx, fldname, val in zip(field_idxs, RECORD_FIELDS, row):
+            if val is None:
+                continue
+            if fldname in (IK.IMG_DATE, IK.DAM_DATE):
+                val = self._format_date(val)
             try:
-                [yr, mo, day] = damrec[IK.IMG_DATE]
-                xdd = damrec[IK.LON]
-                ydd = damrec[IK.LAT]
-                arroyo = damrec[IK.ARROYO_NAME]
+                feat.SetField(idx, val)
             except Exception as e:
-                self._logger.error(f"Failed reading data {e}")
-            else:
-                _, basefname = os.path.split(rel_thumbfname)
-                basename, _ = os.path.splitext(basefname)
-                dt = f"{yr}-{mo}-{day}"
-                kmlf.write("  <Placemark>\n")
-                kmlf.write(f"    <name>{basefname}</name>\n")
-                kmlf.write(f"    <description>{basename} in {arroyo} on {dt}</description>\n")
-                kmlf.write(f"    <img style='max-width:{RESIZE_WIDTH}px;' dammap='{rel_thumbfname}'/>\n")
-                kmlf.write("    <LookAt>")
-                kmlf.write(f"       <longitude>{xdd}</longitude>")
-                kmlf.write(f"       <latitude>{ydd}</latitude>")
-                kmlf.write("       <altitude>2</altitude>")
-                kmlf.write("       <range>4</range>")
-                kmlf.write("       <tilt>45</tilt>")
-                kmlf.write("       <heading>0</heading>")
-                kmlf.write("       <altitudeMode>relativeToGround</altitudeMode>")
-                kmlf.write("    </LookAt>")
-                kmlf.write(f"    <Point><coordinates>{xdd},{ydd}</coordinates></Point>\n")
-                kmlf.write("  </Placemark>\n")
-
-    # ...............................................
-    def _add_coords(self, all_coords, currfname, damrec):
-        currx = float(damrec[IK.LON])
-        curry = float(damrec[IK.LAT])
-        for fname, (x,y) in all_coords.items():
-            dx = abs(abs(x) - abs(currx))
-            dy = abs(abs(y) - abs(curry))
-            if dx < self.buffer_distance or dy < self.buffer_distance:
-                self._logger.info(
-                    "Current file {} is within buffer of {} (dx = {}, dy = {})".format(
-                        currfname, fname, dx, dy))
-                break
-        all_coords[currfname] = (currx, curry)
-        return all_coords
+                self._logger.warn(
+                    f"Failed to SetField for field {fldname}, value {val}, err = {e}")
+        geom = ogr.Geometry(ogr.wkbPoint)
+        geom.AddPoint_2D(row[_LON_IDX], row[_LAT_IDX])
+        feat.SetGeometryDirectly(geom)
+        # Create new feature, setting FID, in this layer
+        lyr.CreateFeature(feat)
+        feat.Destroy()
 
     # # ...............................................
     # def create_thumbnails(self, out_path, img_data, overwrite=True):
@@ -262,41 +406,99 @@ class PicMapper(object):
     #         self._logger.error(f"Failed to write row {row}: {e}")
 
     # ...............................................
-    def write_outputs(self, csvfname=None, shpfname=None, kmlfname=None, overwrite=True):
+    def write_outputs(
+            self, csvfname=None, shpfname=None, kmlfname=None, tablefname=None,
+            overwrite=True, batch_size=FEATURE_BATCH):
+        """Write image metadata to CSV and vector files.
+
+        Args:
+            csvfname (str): full filename for a CSV file of all images.
+            shpfname (str): full filename for a point file of in-bounds images, with a
+                .shp (ESRI Shapefile), .gpkg (GeoPackage) or .fgb (FlatGeobuf)
+                extension.
+            kmlfname (str): full filename for a KML file of in-bounds images, or with
+                a .kmz extension, a KMZ archive also containing their thumbnails.
+            tablefname (str): full filename for a typed columnar file of all images,
+                with a .parquet (Parquet) or .feather/.arrow (Arrow IPC) extension.
+            overwrite (bool): flag indicating whether to overwrite existing files.
+            batch_size (int): features written per transaction, for drivers
+                supporting transactions.
+        """
         csvwriter = csvf = dataset = lyr = None
+        in_transaction = False
+        feat_count = 0
         # Open one or more
         if csvfname is not None:
-            csvfields = [fldname for fldname, tp in SHP_FIELDS]
             if ready_filename(csvfname, overwrite=overwrite):
-                # csvwriter, csvf = get_csv_writer(csvfname, DELIMITER, doAppend=False)
-                csvwriter, csvf = get_csv_dict_writer(csvfname, csvfields, DELIMITER)
+                csvwriter, csvf = get_csv_writer(csvfname, DELIMITER, doAppend=False)
+                csvwriter.writerow(RECORD_FIELDS)
         if shpfname is not None:
-            if ready_filename(shpfname, overwrite=overwrite):
-                dataset, lyr = self._create_layer(SHP_FIELDS, shpfname)
+            dataset, lyr = self._create_layer(SHP_FIELDS, shpfname, overwrite=overwrite)
+        if lyr is not None:
+            defn = lyr.GetLayerDefn()
+            field_idxs = [defn.GetFieldIndex(fldname) for fldname in RECORD_FIELDS]
+            use_transactions = lyr.TestCapability(ogr.OLCTransactions)
 
         # Iterate through features one time writing elements to each requested file
         for relfname, dimg in self.all_data[ADK.IMAGE_META].items():
             # CSV file
             if csvwriter:
                 try:
-                    csvwriter.writerow(dimg.record_for_csv)
+                    csvwriter.writerow(dimg.row_for_csv)
                 except Exception as e:
-                    self._logger.error("Failed to write {}, {}".format(dimg.record, e))
-            if dimg.in_bounds == 1:
-                # Shapefile
-                if dataset and lyr:
-                    self._create_feat_shp(lyr, dimg.record)
+                    self._logger.error("Failed to write {}, {}".format(dimg.row, e))
+            # Vector file
+            if lyr is not None and dimg.in_bounds == 1:
+                if use_transactions and not in_transaction:
+                    lyr.StartTransaction()
+                    in_transaction = True
+                self._create_feat_shp(lyr, defn, field_idxs, dimg.row)
+                feat_count += 1
+                if in_transaction and feat_count % batch_size == 0:
+                    lyr.CommitTransaction()
+                    in_transaction = False
 
         # Close open files
         if csvf:
             csvf.close()
         if dataset:
+            if in_transaction:
+                lyr.CommitTransaction()
             dataset.Destroy()
-            self._logger.info("Closed/wrote dataset {}".format(shpfname))
+            self._logger.info(f"Closed/wrote {feat_count} features to {shpfname}")
+        if tablefname is not None:
+            if ready_filename(tablefname, overwrite=overwrite):
+                write_table(
+                    tablefname, list(self.all_data[ADK.IMAGE_META].values()),
+                    self.image_path, self._is_dam_separated,
+                    cameras=self.all_data[ADK.UNIQUE_CAMERAS])
+                self._logger.info(f"Wrote table {tablefname}")
+        # KML requires images sorted into folders, so is written separately
+        if kmlfname is not None:
+            write_kml(
+                kmlfname, self.all_data[ADK.IMAGE_META].values(),
+                overwrite=overwrite, logger=self._logger)
+
+    # ...............................................
+    def write_region_kml(self, out_dir, overwrite=True, max_placemarks=KML_TILE_MAX):
+        """Write in-bounds images as KML tiles, loaded by Region as the view zooms.
+
+        Args:
+            out_dir (str): output directory for doc.kml and its tiles.
+            overwrite (bool): flag indicating whether to overwrite existing files.
+            max_placemarks (int): most placemarks in a tile before splitting it into
+                quadrants.
+
+        Returns:
+            count of tile files written.
+        """
+        return write_region_kml(
+            out_dir, self.all_data[ADK.IMAGE_META].values(), overwrite=overwrite,
+            max_placemarks=max_placemarks, logger=self._logger)
 
     # ...............................................
     def eval_extent(self, x: float, y: float) -> int:
-        """Return 1 if point is within bbox, 0 if outside.
+        """Return 1 if point is within bbox, 0 if outside, and expand the extent to it.
 
         Args:
             x (float): Longitude value
@@ -305,46 +507,65 @@ class PicMapper(object):
         Returns:
             in_bounds (int): flag indicating if the values are within the expected extent.
         """
-        in_bounds = 1
+        self._expand_extent((x, y, x, y))
         # in assigned bbox (min_x, min_y, max_x, max_y)?
         if (x < self.bbox[0] or
             x > self.bbox[2] or
             y < self.bbox[1] or
             y > self.bbox[3]):
-            in_bounds = 0
-
-        if x < self._min_x:
-            self._min_x = x
-        if x > self._max_x:
-            self._max_x = x
-
-        if y < self._min_y:
-            self._min_y = y
-        if y > self._max_y:
-            self._max_y = y
-
-        if self._min_x is None:
-            self._min_x = x
-            self._max_x = x
-            self._min_y = y
-            self._max_y = y
-        else:
-            if x < self._min_x:
-                self._min_x = x
-            if x > self._max_x:
-                self._max_x = x
+            return 0
+        return 1
 
-            if y < self._min_y:
-                self._min_y = y
-            if y > self._max_y:
-                self._max_y = y
-        return in_bounds
+    # ...............................................
+    def _expand_extent(self, bounds):
+        """Expand the extent to include (min_x, min_y, max_x, max_y) bounds."""
+        self._min_x = min(self._min_x, bounds[0])
+        self._min_y = min(self._min_y, bounds[1])
+        self._max_x = max(self._max_x, bounds[2])
+        self._max_y = max(self._max_y, bounds[3])
 
     # ...............................................
     @property
     def extent(self):
         return (self._min_x, self._min_y, self._max_x, self._max_y)
 
+    # ...............................................
+    @property
+    def columns(self):
+        """Columnar NumPy view of the images in all_data[IMAGE_META].
+
+        Returns:
+            dammap.common.columns.ImageColumns, rebuilt after images are added or
+                removed.
+        """
+        if self._columns is None:
+            self._columns = ImageColumns(self.all_data[ADK.IMAGE_META])
+        return self._columns
+
+    # ...............................................
+    def _reset_extent(self):
+        self._min_x = self.bbox[0]
+        self._min_y = self.bbox[1]
+        self._max_x = self.bbox[2]
+        self._max_y = self.bbox[3]
+
+    # ...............................................
+    def _new_all_data(self):
+        self._columns = None
+        self._duplicates = None
+        return {
+            ADK.BASE_PATH: self.base_path,
+            ADK.ARROYO_FILES: {},
+            ADK.ARROYO_COUNT: 0,
+            ADK.IMAGE_META: {},
+            ADK.IMAGE_OUT_OF_RANGE: {},
+            ADK.IMG_COUNT: 0,
+            ADK.IMG_GEO_COUNT: 0,
+            ADK.UNIQUE_COORDS: {"no_geo": {}},
+            ADK.WITHIN_BUFFER: {"no_geo": {}},
+            ADK.UNIQUE_CAMERAS: {}
+        }
+
     # ...............................................
     def _parse_datestring(self, dtstr):
         parts = dtstr.lstrip("([").rstrip("])").split(",")
@@ -363,18 +584,7 @@ class PicMapper(object):
             delimiter (char): delimiter between fields in CSV file.
         """
         start_idx = len(self.image_path) + 1
-        self.all_data = {
-            ADK.BASE_PATH: self.base_path,
-            ADK.ARROYO_FILES: {},
-            ADK.ARROYO_COUNT: 0,
-            ADK.IMAGE_META: {},
-            ADK.IMAGE_OUT_OF_RANGE: {},
-            ADK.IMG_COUNT: 0,
-            ADK.IMG_GEO_COUNT: 0,
-            ADK.UNIQUE_COORDS: {"no_geo": {}},
-            ADK.WITHIN_BUFFER: {"no_geo": {}},
-            ADK.UNIQUE_CAMERAS: {}
-        }
+        self.all_data = self._new_all_data()
         img_count_total = 0
         img_count_geo = 0
         reader, f = get_csv_dict_reader(csv_fname, delimiter)
@@ -418,6 +628,82 @@ class PicMapper(object):
         self.all_data[ADK.ARROYO_COUNT] = len(self.all_data[ADK.ARROYO_FILES])
         self.all_data[ADK.IMG_COUNT] = len(self.all_data[ADK.IMAGE_META])
 
+    # ...............................................
+    def read_table_data(self, table_fname):
+        """Populate all_data from a Parquet or Feather file written by write_outputs.
+
+        Args:
+            table_fname (str): full filename, with a .parquet, .feather or .arrow
+                extension.
+
+        Returns:
+            count of images with metadata.
+
+        Note:
+            Image files are not opened, but the typed columns are read in one pass,
+            then one DamMeta is built per row, so all_data[IMAGE_META] holds DamMeta
+            objects as from populate_images, unlike read_csv_data.  Verbatim
+            coordinates are restored as strings.  Images without metadata are not
+            in the file, so are not in all_data, but are counted in the camera
+            counts saved with the file.  Cameras are unknown in tables written
+            before cameras were saved.  File paths are taken
+            relative to the image_path the file was written for, and joined to this
+            image_path, so a table still reads after the images are moved.
+
+        Raises:
+            Exception: on a file path outside the image_path the file was written for.
+        """
+        columns, source = read_table(table_fname)
+        self.all_data = self._new_all_data()
+        self._files = {}
+        self._filtered = {}
+        self._img_filter = None
+        self._is_dam_separated = source["is_dam_separated"]
+        table_image_path = source["image_path"]
+        if os.path.normpath(table_image_path) != os.path.normpath(self.image_path):
+            self._logger.log(
+                INFO, f"Table {table_fname} was written for images in "
+                      f"{table_image_path}, reading them from {self.image_path}")
+        # Tables written before a field was added lack its column
+        row_count = len(columns[IK.FILE_PATH])
+        cameras = columns.get(IK.CAMERA, ["unknown"] * row_count)
+        rows = zip(*[
+            columns.get(fldname, [None] * row_count) for fldname in RECORD_FIELDS])
+        for row, camera in zip(rows, cameras):
+            rec = dict(zip(RECORD_FIELDS, row))
+            img_date = rec[IK.IMG_DATE]
+            if img_date is None:
+                # Images without a camera date have [0, 0, 0]
+                img_date = [0, 0, 0]
+            img_meta = {IK.CAMERA: camera, IK.IMG_DATE: img_date}
+            for key in (
+                    IK.VERB_LON, IK.VERB_LON_DIR, IK.VERB_LAT, IK.VERB_LAT_DIR,
+                    IK.X_DEG, IK.X_MIN, IK.X_SEC, IK.X_DIR,
+                    IK.Y_DEG, IK.Y_MIN, IK.Y_SEC, IK.Y_DIR, IK.LON, IK.LAT):
+                img_meta[key] = rec[key]
+            relfname = os.path.relpath(rec[IK.FILE_PATH], table_image_path)
+            if relfname.startswith(os.pardir):
+                raise Exception(
+                    f"Image {rec[IK.FILE_PATH]} in {table_fname} is not in "
+                    f"{table_image_path}")
+            fullfname = os.path.join(self.image_path, relfname)
+            dimg = DamMeta(
+                fullfname, self.image_path, thumb=rec[IK.THUMB],
+                is_dam_separated=self._is_dam_separated, img_meta=img_meta,
+                logger=self._logger)
+            dimg.thumb_kml = rec[IK.THUMB_KML]
+            dimg.thumb_small = rec[IK.THUMB_SMALL]
+            dimg.drainage = rec[IK.DRAINAGE]
+            dimg.flow_id = rec[IK.FLOW_ID]
+            dimg.flow_dist = rec[IK.FLOW_DIST]
+            dimg.chainage = rec[IK.CHAINAGE]
+            self._add_image(fullfname, fullfname, dimg)
+        self.all_data[ADK.ARROYO_COUNT] = len(self.all_data[ADK.ARROYO_FILES])
+        if source.get("cameras") is not None:
+            self.all_data[ADK.UNIQUE_CAMERAS] = dict(source["cameras"])
+        self.cluster_images()
+        return self.all_data[ADK.IMG_COUNT]
+
     # ...............................................
     def test_extent(self, bbox):
         """Compare expected extent against bbox.
@@ -452,7 +738,9 @@ class PicMapper(object):
         """
         ckey = ADK.UNIQUE_COORDS
         geotxt = dimg.wkt
-        if not is_unique:
+        if is_unique:
+            self._duplicates = None
+        else:
             ckey = ADK.WITHIN_BUFFER
             geotxt = f"Point ({dimg.resolved_longitude:.7f}  {dimg.resolved_latitude:.7f})"
         # Track files with same geo, either identical or within a buffer distance
@@ -471,6 +759,180 @@ class PicMapper(object):
             else:
                 self.all_data[ckey]["no_geo"][dimg.arroyo_name] = [dimg.relfname]
 
+    # ...............................................
+    def cluster_images(self):
+        """Group images with coordinates within buffer_distance of one another.
+
+        Returns:
+            count of clusters.
+
+        Postcondition:
+            Each DamMeta in all_data[IMAGE_META] with coordinates has cluster_id and
+            resolved_longitude/resolved_latitude, the mean coordinates of its cluster,
+            and all_data[WITHIN_BUFFER] is rebuilt from the resolved coordinates.
+
+        Note:
+            Clusters link images through chains of neighbors, each within
+            buffer_distance meters, measured in coordinates projected to METRIC_CRS.
+            Each cluster id is derived from the smallest relative filename in the
+            cluster, a 31-bit CRC32 to fit an integer shapefile field, so adding or
+            removing images changes only the ids of the clusters they join or
+            leave.  Ids that collide are incremented, in order of the filenames.
+        """
+        image_meta = self.all_data[ADK.IMAGE_META]
+        cols = self.columns
+        idxs = list(np.flatnonzero(cols.has_geo))
+        idxs.sort(key=lambda i: cols.relfnames[i])
+        cluster_ids = cluster_within_distance(
+            list(zip(cols.x[idxs].tolist(), cols.y[idxs].tolist())),
+            self.buffer_distance)
+        count = max(cluster_ids) + 1 if cluster_ids else 0
+        # Mean coordinates of each cluster
+        cluster_ids = np.array(cluster_ids, dtype=np.int64)
+        sizes = np.bincount(cluster_ids, minlength=count)
+        mean_x = np.bincount(
+            cluster_ids, weights=cols.longitude[idxs], minlength=count) / sizes
+        mean_y = np.bincount(
+            cluster_ids, weights=cols.latitude[idxs], minlength=count) / sizes
+
+        # Images are in relfname order, so each cluster first appears at its smallest
+        stable_ids = {}
+        used = set()
+        for i, cid in zip(idxs, cluster_ids.tolist()):
+            if cid not in stable_ids:
+                sid = zlib.crc32(cols.relfnames[i].encode("utf-8")) & 0x7FFFFFFF
+                while sid in used:
+                    sid = (sid + 1) & 0x7FFFFFFF
+                used.add(sid)
+                stable_ids[cid] = sid
+
+        for dimg in image_meta.values():
+            dimg.cluster_id = dimg.resolved_longitude = dimg.resolved_latitude = None
+        for i, cid in zip(idxs, cluster_ids.tolist()):
+            dimg = image_meta[cols.relfnames[i]]
+            dimg.cluster_id = stable_ids[cid]
+            dimg.resolved_longitude = float(f"{mean_x[cid]:.7f}")
+            dimg.resolved_latitude = float(f"{mean_y[cid]:.7f}")
+        self.all_data[ADK.WITHIN_BUFFER] = {"no_geo": {}}
+        for dimg in image_meta.values():
+            self._add_to_coords(dimg, is_unique=False)
+        self._logger.log(
+            INFO, f"Grouped {len(idxs)} images into {count} clusters within "
+                  f"{self.buffer_distance} meters")
+        return count
+
+    # ...............................................
+    def tag_drainages(self, drainage_index):
+        """Tag each image with the drainage polygon containing its coordinates.
+
+        Args:
+            drainage_index (dammap.common.spatial.PolygonIndex): drainage polygons in
+                METRIC_CRS, keyed by drainage name, as from
+                dammap.common.ancillary.read_drainage_index.
+
+        Returns:
+            list of (relfname, arroyo_name, drainage) for images in a drainage other
+                than the arroyo of their directory.
+
+        Postcondition:
+            Each DamMeta in all_data[IMAGE_META] has drainage set to the name of the
+            polygon containing it, or None if it has no coordinates or is outside all
+            polygons.
+
+        Note:
+            All images are located in one query of the projected coordinates.
+            Drainage names are compared to arroyo names after the same cleanup
+            applied to arroyo directory names.
+        """
+        image_meta = self.all_data[ADK.IMAGE_META]
+        cols = self.columns
+        found = drainage_index.locate(cols.x, cols.y)
+        mismatches = []
+        outside = 0
+        for relfname, pidx, has_geo in zip(
+                cols.relfnames, found.tolist(), cols.has_geo.tolist()):
+            dimg = image_meta[relfname]
+            if pidx < 0:
+                dimg.drainage = None
+                outside += int(has_geo)
+                continue
+            dimg.drainage = drainage_index.keys[pidx]
+            if (DamNameOp.fix_name(str(dimg.drainage)).lower()
+                    != str(dimg.arroyo_name).lower()):
+                mismatches.append((relfname, dimg.arroyo_name, dimg.drainage))
+        for relfname, arroyo_name, drainage in mismatches:
+            self._logger.log(
+                INFO, f"{relfname} in arroyo {arroyo_name} is in drainage {drainage}")
+        self._logger.log(
+            INFO, f"Tagged {int(np.count_nonzero(found >= 0))} images with drainages, "
+                  f"{outside} outside all drainages, {len(mismatches)} in a drainage "
+                  f"other than their arroyo")
+        return mismatches
+
+    # ...............................................
+    def snap_to_flowlines(self, flow_network, max_distance=FLOW_MAX_DISTANCE):
+        """Find the nearest flowline to each image, its distance and chainage.
+
+        Args:
+            flow_network (dammap.common.ancillary.FlowNetwork): flowlines in
+                METRIC_CRS, as from FlowNetwork.read.
+            max_distance (float): greatest distance, in meters, from an image to its
+                flowline.
+
+        Returns:
+            count of images snapped to a flowline.
+
+        Postcondition:
+            Each DamMeta in all_data[IMAGE_META] has flow_id, flow_dist and chainage
+            set, or None if it has no coordinates or no flowline within max_distance.
+        """
+        image_meta = self.all_data[ADK.IMAGE_META]
+        cols = self.columns
+        flow_ids, distance, chainage = flow_network.snap(
+            cols.x, cols.y, max_distance=max_distance)
+        for relfname, flow_id, dist, chain in zip(
+                cols.relfnames, flow_ids, distance.tolist(), chainage.tolist()):
+            dimg = image_meta[relfname]
+            dimg.flow_id = flow_id
+            dimg.flow_dist = dimg.chainage = None
+            if flow_id is not None:
+                dimg.flow_dist = round(dist, 2)
+                if not np.isnan(chain):
+                    dimg.chainage = round(chain, 2)
+        count = len(flow_ids) - flow_ids.count(None)
+        self._logger.log(
+            INFO, f"Snapped {count} of {len(flow_ids)} images to flowlines within "
+                  f"{max_distance} meters")
+        return count
+
+    # ...............................................
+    def images_by_chainage(self):
+        """Order the images of each arroyo downstream, by chainage.
+
+        Returns:
+            dict of {arroyo_name: [relfname, ...], ...} for images with a chainage,
+                upstream first.
+
+        Note:
+            Requires snap_to_flowlines.  Images are sorted in one pass over all
+            arroyos, by arroyo, then decreasing chainage.
+        """
+        image_meta = self.all_data[ADK.IMAGE_META]
+        cols = self.columns
+        chainage = np.array(
+            [image_meta[relfname].chainage for relfname in cols.relfnames],
+            dtype=np.float64)
+        idxs = np.flatnonzero(~np.isnan(chainage))
+        order = idxs[np.lexsort((-chainage[idxs], cols.arroyo_id[idxs]))]
+        ordered = {}
+        for i in order.tolist():
+            dimg = image_meta[cols.relfnames[i]]
+            try:
+                ordered[dimg.arroyo_name].append(dimg.relfname)
+            except KeyError:
+                ordered[dimg.arroyo_name] = [dimg.relfname]
+        return ordered
+
     # ...............................................
     def _add_to_unique_cameras(self, dimg):
         if dimg.guilty_party in self.all_data[ADK.UNIQUE_CAMERAS].keys():
@@ -479,9 +941,25 @@ class PicMapper(object):
             self.all_data[ADK.UNIQUE_CAMERAS][dimg.guilty_party] = 1
 
     # ...............................................
-    def populate_images(self, is_dam_separated=False):
+    def populate_images(
+            self, is_dam_separated=False, workers=1, use_processes=True,
+            img_filter=None):
         """Read metadata from the directory names and filenames within image_path.
 
+        Args:
+            is_dam_separated (bool): True if images are organized in arroyo/dam/image
+                directories, False for arroyo/image directories.
+            workers (int): number of workers reading image metadata in parallel.  If
+                1, read images serially on the calling thread.
+            use_processes (bool): if workers > 1, True to read in a process pool,
+                False to read in a thread pool.
+            img_filter (dammap.common.imgfilter.ImageFilter): optional area and date
+                range of images to keep, also applied by update_images.  Rejected
+                images are left out of all_data.
+
+        Returns:
+            count of images with metadata.
+
         Results in:
             all_data dictionary with keys/values:
                 `base_path`: base path containing input and output directories
@@ -500,171 +978,542 @@ class PicMapper(object):
                                              ...},
                                        wkt2: {...},
                                        ...}
+
+        Note:
+            Results are identical for serial and parallel reads; images are read in
+            any order, but added to all_data in directory order.
         """
-        self.all_data = {
-            ADK.BASE_PATH: self.base_path,
-            ADK.ARROYO_FILES: {},
-            ADK.ARROYO_COUNT: 0,
-            ADK.IMAGE_META: {},
-            ADK.IMAGE_OUT_OF_RANGE: {},
-            ADK.IMG_COUNT: 0,
-            ADK.IMG_GEO_COUNT: 0,
-            ADK.UNIQUE_COORDS: {"no_geo": {}},
-            ADK.WITHIN_BUFFER: {"no_geo": {}},
-            ADK.UNIQUE_CAMERAS: {}
+        self.all_data = self._new_all_data()
+        self._files = {}
+        self._filtered = {}
+        self._img_filter = img_filter
+        self._is_dam_separated = is_dam_separated
+        entries = self._list_image_files(is_dam_separated)
+        self._read_images(entries, is_dam_separated, workers, use_processes)
+
+        self.all_data[ADK.ARROYO_COUNT] = len(self.all_data[ADK.ARROYO_FILES])
+        self.cluster_images()
+        return self.all_data[ADK.IMG_COUNT]
+
+    # ...............................................
+    def update_images(self, workers=1, use_processes=True):
+        """Read only new or changed images, and drop deleted images, from all_data.
+
+        Args:
+            workers (int): number of workers reading image metadata in parallel.
+            use_processes (bool): if workers > 1, True to read in a process pool,
+                False to read in a thread pool.
+
+        Returns:
+            added (int): count of new image files read.
+            modified (int): count of changed image files re-read.
+            deleted (int): count of image files removed.
+
+        Raises:
+            Exception: on PicMapper not populated by populate_images or load_manifest.
+
+        Note:
+            Images are compared to the previous state by file size and modification
+            time.  The previous state is from populate_images or load_manifest.
+            all_data is then rebuilt in directory order, so outputs are written in
+            the same order as after populate_images.
+        """
+        if not self.all_data:
+            raise Exception("PicMapper is not populated")
+        current = {}
+        for entry in self._list_image_files(self._is_dam_separated):
+            current[self._relfname(entry.path)] = entry
+
+        deleted = [rf for rf in self._files if rf not in current]
+        modified = [
+            rf for rf, entry in current.items()
+            if rf in self._files
+            and self._files[rf][:2] != (entry.stat().st_size, entry.stat().st_mtime_ns)]
+        # Images rejected by img_filter are read again only if changed
+        self._filtered = {
+            rf: stat for rf, stat in self._filtered.items()
+            if rf in current
+            and stat == (current[rf].stat().st_size, current[rf].stat().st_mtime_ns)}
+        added = [
+            rf for rf in current if rf not in self._files and rf not in self._filtered]
+        for relfname in deleted + modified:
+            self._remove_image(relfname)
+
+        entries = [current[rf] for rf in modified + added]
+        self._read_images(
+            entries, self._is_dam_separated, workers, use_processes)
+        # Extent may have shrunk, and re-read images were added last
+        self._rebuild_in_order(list(current))
+        self.cluster_images()
+        self._logger.log(
+            INFO, f"Updated {self.image_path}: {len(added)} added, "
+                  f"{len(modified)} modified, {len(deleted)} deleted")
+        return len(added), len(modified), len(deleted)
+
+    # ...............................................
+    def _rebuild_in_order(self, relfnames):
+        """Rebuild all_data and the extent from images already read, in a new order.
+
+        Args:
+            relfnames (list): filenames relative to image_path, in directory order.
+                Images not read are ignored.
+        """
+        files = self._files
+        self._files = {}
+        self.all_data = self._new_all_data()
+        self._reset_extent()
+        for relfname in relfnames:
+            try:
+                self._files[relfname] = files[relfname]
+            except KeyError:
+                continue
+            dimg = files[relfname][2]
+            # Skipped images were never added
+            if dimg is not None:
+                fullfname = os.path.join(self.image_path, relfname)
+                self._add_image(fullfname, fullfname, dimg)
+        self.all_data[ADK.ARROYO_COUNT] = len(self.all_data[ADK.ARROYO_FILES])
+
+    # ...............................................
+    def write_manifest(self, manifest_fname, overwrite=True):
+        """Write the state of all image files read, to restore with load_manifest.
+
+        Args:
+            manifest_fname (str): full filename of the JSON manifest.
+            overwrite (bool): flag indicating whether to overwrite an existing file.
+        """
+        files = {}
+        for relfname, (size, mtime_ns, dimg) in self._files.items():
+            img_meta = None
+            if dimg is not None:
+                img_meta = dimg.image_meta
+            files[relfname] = [size, mtime_ns, img_meta]
+        manifest = {
+            "image_path": self.image_path,
+            "is_dam_separated": self._is_dam_separated,
+            "files": files
         }
-        image_count = 0
-        # Should always be arroyos
-        level1 = os.listdir(self.image_path)
-        for arr in level1:
-            arr_path = os.path.join(self.image_path, arr)
-            if identify_path_element(arr_path) == "arroyo":
-                fnames = []
-                level2 = os.listdir(arr_path)
-                if not is_dam_separated:
-                    # Level 2 should be images
-                    self._iterate_images(arr_path, level2, is_dam_separated)
-                else:
-                    # Level 2 should be dams
-                    for dam in level2:
-                        parent_path = os.path.join(self.image_path, arr, dam)
-                        if identify_path_element(parent_path) == "dam":
-                            fnames = os.listdir(parent_path)
-                            self._iterate_images(parent_path, fnames, is_dam_separated)
+        if ready_filename(manifest_fname, overwrite=overwrite):
+            with open(manifest_fname, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            self._logger.log(
+                INFO, f"Wrote manifest of {len(files)} images to {manifest_fname}")
 
+    # ...............................................
+    def load_manifest(self, manifest_fname, img_filter=None):
+        """Populate all_data from a manifest written by write_manifest.
+
+        Args:
+            manifest_fname (str): full filename of the JSON manifest.
+            img_filter (dammap.common.imgfilter.ImageFilter): optional area and date
+                range of images to keep, also applied by update_images.
+
+        Returns:
+            count of images with metadata.
+
+        Note:
+            Image files are not opened; follow with update_images to read new or
+            changed files.  Images rejected by a filter are not written to the
+            manifest, so update_images reads them as new files.
+        """
+        with open(manifest_fname, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.all_data = self._new_all_data()
+        self._files = {}
+        self._filtered = {}
+        self._img_filter = img_filter
+        self._is_dam_separated = manifest["is_dam_separated"]
+        for relfname, (size, mtime_ns, img_meta) in manifest["files"].items():
+            fullfname = os.path.join(self.image_path, relfname)
+            dimg = ret_fname = None
+            if img_meta is not None:
+                if img_filter is not None and not img_filter.accepts(img_meta):
+                    self._filtered[relfname] = (size, mtime_ns)
+                    continue
+                ret_fname = fullfname
+                dimg = DamMeta(
+                    fullfname, self.image_path,
+                    is_dam_separated=self._is_dam_separated, img_meta=img_meta,
+                    logger=self._logger)
+            self._files[relfname] = (size, mtime_ns, dimg)
+            self._add_image(fullfname, ret_fname, dimg)
         self.all_data[ADK.ARROYO_COUNT] = len(self.all_data[ADK.ARROYO_FILES])
+        self.cluster_images()
+        return self.all_data[ADK.IMG_COUNT]
 
     # ...............................................
-    def _iterate_images(self, parent_path, fnames, is_dam_separated):
-        for fname in fnames:
-            fullfname = os.path.join(parent_path, fname)
-            if identify_path_element(fullfname) == "image":
-                ret_fname = DamNameOp.check_filename(
-                    self.image_path, fullfname, self._logger)
-                # If None, skip this image
-                if ret_fname is None:
-                    self._logger.log(INFO, f"Skipping {fullfname} without tags")
-                else:
-                    # If inconsistent image name AND has tags, rename here
-                    if ret_fname != fullfname:
-                        self._logger.log(
-                            WARN, f"Rename {fullfname} to constructed {ret_fname}")
-                    # Ignore if no metadata
-                    dimg = self._read_one_image(fullfname, is_dam_separated)
-                    if dimg.has_meta is True:
-                        self.all_data[ADK.IMG_COUNT] += 1
-
-                        self.all_data[ADK.IMAGE_META][dimg.relfname] = dimg
-                        if dimg.dd_ok:
-                            self.all_data[ADK.IMG_GEO_COUNT] += 1
-
-                        # Add image filename to ARROYO_FILES dict
-                        try:
-                            self.all_data[ADK.ARROYO_FILES][dimg.arroyo_name].append(
-                                dimg.relfname)
-                        except:
-                            self.all_data[ADK.ARROYO_FILES][dimg.arroyo_name] = [
-                                dimg.relfname]
-
-    # ...............................................
-    def _read_one_image(self, fullfname, is_dam_separated):
-        # Get metadata from directory and filename
-        dimg = DamMeta(
-            fullfname, self.image_path, is_dam_separated=is_dam_separated, logger=self._logger)
-        # Add image metadata object to image_meta list
+    def _relfname(self, fullfname):
+        return fullfname[len(self.image_path.rstrip(os.sep)) + 1:]
+
+    # ...............................................
+    def _read_images(self, entries, is_dam_separated, workers, use_processes):
+        """Read image files and add them to all_data.
+
+        Args:
+            entries (list): os.DirEntry objects for images to read.
+            is_dam_separated (bool): True if images are organized in arroyo/dam/image
+                directories, False for arroyo/image directories.
+            workers (int): number of workers reading image metadata in parallel.
+            use_processes (bool): True to use a process pool, False for threads.
+        """
+        fullfnames = [entry.path for entry in entries]
+        stats = [entry.stat() for entry in entries]
+        # Look up cached metadata here, so workers never touch the cache
+        if self._meta_cache is not None:
+            img_metas = [
+                self._meta_cache.get(fullfname, stat=st)
+                for fullfname, st in zip(fullfnames, stats)]
+        else:
+            img_metas = [None] * len(fullfnames)
+        if workers > 1:
+            results = self._read_images_parallel(
+                fullfnames, img_metas, is_dam_separated, workers, use_processes)
+        else:
+            results = (
+                read_image_file(
+                    fullfname, self.image_path, is_dam_separated, self._logger,
+                    img_meta=img_meta, img_filter=self._img_filter)
+                for fullfname, img_meta in zip(fullfnames, img_metas))
+        filtered = 0
+        for fullfname, st, cached_meta, (ret_fname, dimg, img_meta) in zip(
+                fullfnames, stats, img_metas, results):
+            if dimg is not None:
+                img_meta = dimg.image_meta
+            if (self._meta_cache is not None and cached_meta is None
+                    and img_meta is not None):
+                self._meta_cache.put(fullfname, img_meta, stat=st)
+            relfname = self._relfname(fullfname)
+            if ret_fname is not None and dimg is None:
+                # Rejected by img_filter
+                self._filtered[relfname] = (st.st_size, st.st_mtime_ns)
+                filtered += 1
+                continue
+            self._filtered.pop(relfname, None)
+            self._files[relfname] = (st.st_size, st.st_mtime_ns, dimg)
+            self._add_image(fullfname, ret_fname, dimg)
+        if self._meta_cache is not None:
+            self._meta_cache.save()
+        if filtered:
+            self._logger.log(
+                INFO, f"Skipped {filtered} images rejected by {self._img_filter}")
+
+    # ...............................................
+    def _list_image_files(self, is_dam_separated):
+        """List image files in the arroyo or arroyo/dam directories of image_path.
+
+        Args:
+            is_dam_separated (bool): True if images are organized in arroyo/dam/image
+                directories, False for arroyo/image directories.
+
+        Returns:
+            list of os.DirEntry for images, in directory order.
+        """
+        return [
+            entry for _arr, _dam, entry
+            in walk_image_tree(self.image_path, is_dam_separated=is_dam_separated)]
+
+    # ...............................................
+    def _read_images_parallel(
+            self, fullfnames, img_metas, is_dam_separated, workers, use_processes):
+        """Read image metadata with a pool of workers.
+
+        Args:
+            fullfnames (list): full filenames of images to read.
+            img_metas (list): cached metadata for each image in fullfnames, or None.
+            is_dam_separated (bool): True if images are organized in arroyo/dam/image
+                directories, False for arroyo/image directories.
+            workers (int): number of workers in the pool.
+            use_processes (bool): True to use a process pool, False for threads.
+
+        Returns:
+            list of (ret_fname, dimg, img_meta) tuples in the same order as
+                fullfnames.
+
+        Note:
+            Messages logged while reading each image are returned by the workers and
+            logged here, in the order of fullfnames.
+        """
+        count = len(fullfnames)
+        self._logger.log(
+            INFO, f"Reading {count} images with {workers} "
+                  f"{'processes' if use_processes else 'threads'}")
+        if use_processes:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            chunksize = max(1, count // (workers * 4))
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            chunksize = 1
+        with executor:
+            # map returns results in input order
+            results = list(executor.map(
+                read_image_file_messages,
+                fullfnames,
+                [self.image_path] * count,
+                [is_dam_separated] * count,
+                img_metas,
+                [self._img_filter] * count,
+                chunksize=chunksize))
+        images = []
+        for ret_fname, dimg, img_meta, messages in results:
+            for level, msg in messages:
+                self._logger.log(level, msg)
+            if dimg is not None:
+                dimg._logger = self._logger
+            images.append((ret_fname, dimg, img_meta))
+        return images
+
+    # ...............................................
+    def _add_image(self, fullfname, ret_fname, dimg):
+        """Add one image read by read_image_file to the all_data dictionary.
+
+        Args:
+            fullfname (str): full path to the image file.
+            ret_fname (str): filename returned by DamNameOp.check_filename, None if
+                the image could not be read.
+            dimg (DamMeta): object with metadata for the image.
+        """
+        # If None, skip this image
+        if ret_fname is None:
+            self._logger.log(INFO, f"Skipping {fullfname} without tags")
+        else:
+            # If inconsistent image name AND has tags, rename here
+            if ret_fname != fullfname:
+                self._logger.log(
+                    WARN, f"Rename {fullfname} to constructed {ret_fname}")
+            self._summarize_one_image(dimg)
+            # Ignore if no metadata
+            if dimg.has_meta is True:
+                self._columns = None
+                self.all_data[ADK.IMG_COUNT] += 1
+
+                self.all_data[ADK.IMAGE_META][dimg.relfname] = dimg
+                if dimg.dd_ok:
+                    self.all_data[ADK.IMG_GEO_COUNT] += 1
 
+                # Add image filename to ARROYO_FILES dict
+                try:
+                    self.all_data[ADK.ARROYO_FILES][dimg.arroyo_name].append(
+                        dimg.relfname)
+                except:
+                    self.all_data[ADK.ARROYO_FILES][dimg.arroyo_name] = [
+                        dimg.relfname]
+
+    # ...............................................
+    def _summarize_one_image(self, dimg):
         # Add relfname to unique_coordinate by arroyo
         # For all pre-2023 images, multiple year/images for an individual dam have
         # been edited to have identical coordinates
         self._add_to_coords(dimg, is_unique=True)
 
-        # self._add_to_coords(dimg, is_unique=False)
         # Increment count for each camera in dictionary
         self._add_to_unique_cameras(dimg)
         # Evaluate point within expected boundary
         if dimg.dd_ok:
             dimg.in_bounds = self.eval_extent(dimg.longitude, dimg.latitude)
-        return dimg
 
     # ...............................................
-    def _summarize_duplicates(self):
+    def _remove_image(self, relfname):
+        """Remove an image from the all_data dictionary.
+
+        Args:
+            relfname (str): filename relative to image_path.
         """
-        unique_coord_counts = {wkt:
-                                    arroyo_count: arroyo_count,
-                                    image_count: image_count
-                                    arroyo1_name: x,
-                                    arroyo2_name: y},
-                               wkt2: ...}
-        wkt_by_count = { 45: [wkt]
-                        11: [wkt, wkt, ...]
-                        4:  [...]
-                        ...}
+        _, _, dimg = self._files.pop(relfname)
+        # Skipped images were never added
+        if dimg is None:
+            return
+        # Remove from unique coordinates
+        self._duplicates = None
+        geotxt = "no_geo"
+        if dimg.dd_ok:
+            geotxt = dimg.wkt
+        arroyo_dict = self.all_data[ADK.UNIQUE_COORDS][geotxt]
+        arroyo_dict[dimg.arroyo_name].remove(relfname)
+        if not arroyo_dict[dimg.arroyo_name]:
+            del arroyo_dict[dimg.arroyo_name]
+        if not arroyo_dict and geotxt != "no_geo":
+            del self.all_data[ADK.UNIQUE_COORDS][geotxt]
+        # Decrement camera count
+        self.all_data[ADK.UNIQUE_CAMERAS][dimg.guilty_party] -= 1
+        if self.all_data[ADK.UNIQUE_CAMERAS][dimg.guilty_party] == 0:
+            del self.all_data[ADK.UNIQUE_CAMERAS][dimg.guilty_party]
+        # Remove from image metadata and arroyo files
+        if dimg.has_meta is True:
+            self._columns = None
+            del self.all_data[ADK.IMAGE_META][relfname]
+            self.all_data[ADK.IMG_COUNT] -= 1
+            if dimg.dd_ok:
+                self.all_data[ADK.IMG_GEO_COUNT] -= 1
+            arroyo_files = self.all_data[ADK.ARROYO_FILES][dimg.arroyo_name]
+            arroyo_files.remove(relfname)
+            if not arroyo_files:
+                del self.all_data[ADK.ARROYO_FILES][dimg.arroyo_name]
+
+    # ...............................................
+    def _summarize_duplicates(self):
+        """Group images sharing identical coordinates, largest groups first.
+
+        Returns:
+            list of dictionaries, one per coordinate shared by more than one image,
+                ordered by decreasing image_count, then wkt:
+                    {"wkt": wkt,
+                     "image_count": image_count,
+                     "arroyo_count": arroyo_count,
+                     "arroyos": {arroyo_name: [relfname, ...], ...}}
+                with arroyo names and relfnames sorted.
+
+        Note:
+            The summary is computed once from all_data[UNIQUE_COORDS] and reused until
+            an image is added or removed.  Groups are ordered with a heap, so only
+            shared coordinates, not every unique coordinate, are sorted.
         """
         if not self.all_data:
             self.populate_images()
-        # Counts
-        unique_coord_counts = {}
+        if self._duplicates is not None:
+            return self._duplicates
+        heap = []
         for wkt, arroyo_dict in self.all_data[ADK.UNIQUE_COORDS].items():
-            unique_coord_counts[wkt] = {"arroyo_count": len(arroyo_dict)}
-            image_count = 0
-            for arroyo, relfnames in arroyo_dict.items():
-                unique_coord_counts[wkt][arroyo] = len(relfnames)
-                image_count += len(relfnames)
-            unique_coord_counts[wkt]["image_count"] = image_count
-
-        wkt_by_count = {}
-        for wkt, summary in unique_coord_counts.items():
-            try:
-                wkt_by_count[summary["image_count"]].append(wkt)
-            except KeyError:
-                wkt_by_count[summary["image_count"]] = [wkt]
-
-        return unique_coord_counts, wkt_by_count
+            if wkt == "no_geo":
+                continue
+            image_count = sum(len(relfnames) for relfnames in arroyo_dict.values())
+            if image_count > 1:
+                heap.append((-image_count, wkt))
+        heapq.heapify(heap)
+        duplicates = []
+        while heap:
+            neg_count, wkt = heapq.heappop(heap)
+            arroyo_dict = self.all_data[ADK.UNIQUE_COORDS][wkt]
+            duplicates.append({
+                "wkt": wkt,
+                "image_count": -neg_count,
+                "arroyo_count": len(arroyo_dict),
+                "arroyos": {
+                    arroyo: sorted(arroyo_dict[arroyo])
+                    for arroyo in sorted(arroyo_dict.keys())}})
+        self._duplicates = duplicates
+        return duplicates
 
     # ...............................................
     def _get_location_camera_info(self, relfname):
-        dimg = self.all_data[ADK.IMAGE_META][relfname]
-        if dimg:
-            lon = f"{dimg.verbatim_longitude} {dimg.verbatim_longitude_direction}"
-            lat = f"{dimg.verbatim_latitude} {dimg.verbatim_latitude_direction}"
-            camera = f"{dimg.guilty_party}"
-            return f"{lon},  {lat},  {camera}"
-        else:
-            return f"Cannot find image object for {relfname}"
+        """Verbatim coordinates and camera of an image.
+
+        Args:
+            relfname (str): filename relative to image_path.
+
+        Returns:
+            dictionary of {VERB_LON: str, VERB_LAT: str, CAMERA: str}, with None
+                values if the image has no metadata.
+        """
+        dimg = self.all_data[ADK.IMAGE_META].get(relfname)
+        if dimg is None:
+            return {IK.VERB_LON: None, IK.VERB_LAT: None, IK.CAMERA: None}
+        return {
+            IK.VERB_LON:
+                f"{dimg.verbatim_longitude} {dimg.verbatim_longitude_direction}",
+            IK.VERB_LAT:
+                f"{dimg.verbatim_latitude} {dimg.verbatim_latitude_direction}",
+            IK.CAMERA: f"{dimg.guilty_party}"}
 
     # ...............................................
     def print_duplicates(self):
-        if not self.all_data:
-            self.populate_images()
-        # Counts
-        unique_coord_counts, wkt_by_count = self._summarize_duplicates()
+        """Log counts of images with missing or shared coordinates.
 
-        # Print bad coordinate info
+        Note:
+            Only one line is logged for each arroyo with bad coordinates and each
+            shared coordinate; use write_duplicates for the images in each.
+        """
+        duplicates = self._summarize_duplicates()
         bad_coord_dict = self.all_data[ADK.UNIQUE_COORDS]["no_geo"]
         self._logger.info(f"Missing or bad coordinates:  {len(bad_coord_dict)} arroyos")
         for arr, relfnames in bad_coord_dict.items():
-            self._logger.info(f"   Arroyo {arr}:")
-            for fn in relfnames:
-                self._logger.info(f"      {fn}")
-
-        # Print duplicates, starting with highest number of images per wkt
-        ordered_counts = list(wkt_by_count.keys())
-        ordered_counts.sort(reverse=True)
-        for image_count in ordered_counts:
-            if image_count > 1:
-                wkts = wkt_by_count[image_count]
-                for wkt in wkts:
-                    if wkt != "no_geo":
-                        self._logger.info("")
-                        self._logger.info(f"** {image_count} images with the same coordinates {wkt}")
-                        for key, val in unique_coord_counts[wkt].items():
-                            # key is arroyo_name
-                            if not key.endswith("_count"):
-                                self._logger.info(f"   arroyo: {key} has {val} images for wkt")
-                                for relfname in self.all_data[ADK.UNIQUE_COORDS][wkt][key]:
-                                    coords_camera = self._get_location_camera_info(relfname)
-                                    self._logger.info(f"      image: {relfname}, ({coords_camera})")
+            self._logger.info(f"   Arroyo {arr}: {len(relfnames)} images")
+        self._logger.info(
+            f"Shared coordinates: {len(duplicates)} points, "
+            f"{sum(grp['image_count'] for grp in duplicates)} images")
+        for grp in duplicates:
+            self._logger.info(
+                f"   {grp['image_count']} images in {grp['arroyo_count']} arroyos "
+                f"at {grp['wkt']}")
 
+    # ...............................................
+    def write_duplicates(self, dupes_fname=None, shpfname=None, overwrite=True):
+        """Write images with identical coordinates to a report and a point file.
+
+        Args:
+            dupes_fname (str): full filename of the report; JSON with a .json
+                extension, or CSV, one row per image, with a .csv extension.
+            shpfname (str): full filename for a point file with one feature for each
+                shared coordinate, with an extension in VECTOR_DRIVERS.
+            overwrite (bool): flag indicating whether to overwrite existing files.
+
+        Returns:
+            count of shared coordinates.
+
+        Raises:
+            Exception: on unsupported report extension.
+        """
+        duplicates = self._summarize_duplicates()
+        if dupes_fname is not None:
+            ext = os.path.splitext(dupes_fname)[1].lower()
+            if ext not in (".json", ".csv"):
+                raise Exception(
+                    f"Unsupported duplicates report extension {ext}, use .json or .csv")
+            if ready_filename(dupes_fname, overwrite=overwrite):
+                if ext == ".json":
+                    report = []
+                    for grp in duplicates:
+                        arroyos = {}
+                        for arroyo, relfnames in grp["arroyos"].items():
+                            arroyos[arroyo] = [
+                                dict(relfname=relfname,
+                                     **self._get_location_camera_info(relfname))
+                                for relfname in relfnames]
+                        report.append(dict(grp, arroyos=arroyos))
+                    with open(dupes_fname, "w", encoding="utf-8") as f:
+                        json.dump(report, f, indent=2)
+                else:
+                    csvwriter, csvf = get_csv_writer(
+                        dupes_fname, DELIMITER, doAppend=False)
+                    csvwriter.writerow(DUPES_CSV_FIELDS)
+                    for gidx, grp in enumerate(duplicates):
+                        for arroyo, relfnames in grp["arroyos"].items():
+                            for relfname in relfnames:
+                                info = self._get_location_camera_info(relfname)
+                                csvwriter.writerow([
+                                    gidx, grp["image_count"], grp["arroyo_count"],
+                                    grp["wkt"], arroyo, relfname, info[IK.VERB_LON],
+                                    info[IK.VERB_LAT], info[IK.CAMERA]])
+                    csvf.close()
+                self._logger.info(
+                    f"Wrote {len(duplicates)} shared coordinates to {dupes_fname}")
+
+        if shpfname is not None:
+            dataset, lyr = self._create_layer(
+                DUPES_SHP_FIELDS, shpfname, overwrite=overwrite)
+            if lyr is not None:
+                defn = lyr.GetLayerDefn()
+                for grp in duplicates:
+                    relfnames = [
+                        relfname for rfnames in grp["arroyos"].values()
+                        for relfname in rfnames]
+                    # All images in a group share the coordinates of the first
+                    dimg = self.all_data[ADK.IMAGE_META].get(relfnames[0])
+                    if dimg is None:
+                        continue
+                    feat = ogr.Feature(defn)
+                    feat.SetField("img_count", grp["image_count"])
+                    feat.SetField("arroyo_ct", grp["arroyo_count"])
+                    feat.SetField("arroyos", ",".join(grp["arroyos"].keys()))
+                    feat.SetField("first_img", relfnames[0])
+                    geom = ogr.Geometry(ogr.wkbPoint)
+                    geom.AddPoint_2D(dimg.longitude, dimg.latitude)
+                    feat.SetGeometryDirectly(geom)
+                    lyr.CreateFeature(feat)
+                    feat.Destroy()
+                dataset.Destroy()
+                self._logger.info(
+                    f"Wrote {len(duplicates)} shared coordinates to {shpfname}")
+        return len(duplicates)
 
     # ...............................................
     def print_summary(self):
@@ -692,15 +1541,14 @@ class PicMapper(object):
 
     # ...............................................
     def _test_dir_counts(self):
-        # Count the image files in the directory
-        fcount = dcount = 0
-        for root, dirs, files in os.walk(self.image_path):
-            for fname in files:
-                if not fname.startswith(".") and fname.lower().endswith("jpg"):
-                    fcount += 1
-            for dirname in dirs:
-                if not dirname.startswith("."):
-                    dcount += 1
+        # Count the image files and arroyos in the directory
+        fcount = 0
+        arroyos = set()
+        for arr_entry, _dam_entry, _entry in walk_image_tree(
+                self.image_path, is_dam_separated=self._is_dam_separated):
+            arroyos.add(arr_entry.name)
+            fcount += 1
+        dcount = len(arroyos)
         if dcount != ARROYO_COUNT:
             print("Error: Found {} arroyo directories, expected {}".format(
                 dcount, ARROYO_COUNT))
@@ -732,71 +1580,62 @@ class PicMapper(object):
                 self.all_data[ADK.IMG_COUNT], IMAGE_COUNT))
 
     # ...............................................
-    def _resize_image(
-            self, image, orig_width, thumb_width, thumb_fname, overwrite=True):
-        success = True
-        thumb_base = os.path.basename(thumb_fname)
-        # If original image is smaller than desired thumbnail width, copy original as thumbnail
-        if thumb_width > orig_width:
-            if ready_filename(thumb_fname, overwrite=overwrite):
-                try:
-                    image.save(thumb_fname)
-                except Exception as e:
-                    success = False
-                    self._logger.info(
-                        f"Failed to copy image {thumb_base} as thumbnail ({e})")
-                else:
-                    self._logger.info(
-                        f"Copied image {thumb_base} original width {image.size[0]} as thumbnail")
-        else:
-            if ready_filename(thumb_fname, overwrite=overwrite):
-                wpercent = (thumb_width / float(image.size[0]))
-                thumb_height = int(float(image.size[1]) * float(wpercent))
-                size = (thumb_width, thumb_height)
-                try:
-                    img = image.resize(size)
-                    img.save(thumb_fname)
-                except Exception as e:
-                    success = False
-                    self._logger.info(
-                        f"Failed to copy image {thumb_base} as thumbnail ({e})")
-                else:
-                    self._logger.info(
-                        f"Reduced image {thumb_base} width {image.size[0]} to {thumb_width}")
-        return success
-
-    # ...............................................
-    def resize_images(self, outpath, thumb_width, overwrite=True):
-        """Resize all original images in the image_path tree.
+    def resize_images(
+            self, outpath, thumb_sizes=THUMB_SIZES, overwrite=True, workers=1):
+        """Resize all original images in the image_path tree, to one or more widths.
 
         Args:
             outpath (str): output path
-            resize_width (int): width in pixels for resized images
-            overwrite (bool): flag indicating whether to rewrite existing resized images.
+            thumb_sizes (list): list of (width, thumb_dir, fldname) for each size, with
+                width in pixels, subdirectory of outpath, and the IMAGE_KEYS field of
+                DamMeta recording the thumbnail.  A single int width writes only
+                THUMB_DIR thumbnails.
+            overwrite (bool): flag indicating whether to rewrite existing resized
+                images.  If False, only rewrite thumbnails older than the original.
+            workers (int): number of processes resizing images in parallel.  If 1,
+                resize images serially on the calling thread.
+
+        Returns:
+            count of images with all thumbnails.
+
+        Raises:
+            Exception: on PicMapper not populated.
         """
         count = 0
         if not self.all_data:
             raise Exception("PicMapper is not populated")
-        for relfname, dimg in self.all_data[ADK.IMAGE_META].items():
-            if dimg.dd_ok:
-                # Get the width, regardless of whether writing
-                try:
-                    img = Image.open(dimg.fullpath)
-                except Exception as e:
-                    self._logger.error(f" *** Unable to open file {dimg.fullpath}, {e}")
-                else:
-                    (orig_w, _) = img.size
-
-                # Rewrite the image for one size in largest width smaller than original
-                thumb_fname = os.path.join(
-                    outpath, f"{THUMB_DIR}", dimg.relfname)
-
-                exists = self._resize_image(
-                    img, orig_w, thumb_width, thumb_fname, overwrite=overwrite)
+        if isinstance(thumb_sizes, int):
+            thumb_sizes = [(thumb_sizes, THUMB_DIR, IK.THUMB)]
+        dimgs = [
+            dimg for dimg in self.all_data[ADK.IMAGE_META].values() if dimg.dd_ok]
+        fullfnames = [dimg.fullpath for dimg in dimgs]
+        all_targets = [
+            [(width, thumbnail_filename(outpath, thumb_dir, dimg.relfname))
+             for width, thumb_dir, _fldname in thumb_sizes]
+            for dimg in dimgs]
+        overwrites = [overwrite] * len(dimgs)
+        if workers > 1:
+            self._logger.log(
+                INFO, f"Resizing {len(dimgs)} images with {workers} processes")
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    write_thumbnails, fullfnames, all_targets, overwrites,
+                    chunksize=max(1, len(dimgs) // (workers * 4))))
+        else:
+            results = map(write_thumbnails, fullfnames, all_targets, overwrites)
 
-                if exists:
-                    dimg.thumb = thumb_fname[len(MAC_PATH):]
-                    count += 1
+        for dimg, thumb_results in zip(dimgs, results):
+            success = True
+            for (_width, _thumb_dir, fldname), (thumb_fname, msg) in zip(
+                    thumb_sizes, thumb_results):
+                if thumb_fname is None:
+                    success = False
+                    self._logger.error(msg)
+                else:
+                    self._logger.info(msg)
+                    dimg.set_thumb(fldname, thumb_fname[len(MAC_PATH):])
+            if success:
+                count += 1
         return count
 
 # .............................................................................
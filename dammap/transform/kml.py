@@ -0,0 +1,390 @@
+"""Write dam image placemarks to KML or KMZ files for display in Google Earth."""
+import os
+from xml.sax.saxutils import escape
+import zipfile
+
+from dammap.common.constants import (
+    KML_BATCH, KML_LOD_PIXELS, KML_TEMPLATE_FNAME, KML_TILE_DEPTH, KML_TILE_DIR,
+    KML_TILE_MAX, MAC_PATH, RESIZE_WIDTH)
+from dammap.common.util import ready_filename
+
+# Template in the data directory at the top of the repository
+KML_TEMPLATE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data", KML_TEMPLATE_FNAME)
+# Directory within a KMZ archive for thumbnails
+KMZ_FILES_DIR = "files"
+# Shared style written into the template schema marker
+KML_STYLE = """<Style id="dam">
+  <IconStyle><scale>0.8</scale></IconStyle>
+  <BalloonStyle><text>$[description]</text></BalloonStyle>
+</Style>"""
+
+
+# .............................................................................
+def _date_string(date_seq):
+    try:
+        yr, mo, day = (int(val) for val in date_seq)
+    except (TypeError, ValueError):
+        return None
+    if not yr:
+        return None
+    return f"{yr:04d}-{mo:02d}-{day:02d}"
+
+
+# .............................................................................
+def thumbnail_href(dimg, kml_fname, is_kmz=False):
+    """Find the thumbnail for a placemark, and the reference to it from the KML.
+
+    Args:
+        dimg (DamMeta): object with metadata for one image.
+        kml_fname (str): full filename of the output KML or KMZ file.
+        is_kmz (bool): True if the thumbnail is packaged in a KMZ archive.
+
+    Returns:
+        href (str): reference to the image from the KML document.
+        thumb_fname (str): full filename of the thumbnail to package in a KMZ, None
+            if no thumbnail has been written.
+    """
+    thumb = dimg.thumb_kml or dimg.thumb
+    if thumb is None:
+        # No thumbnails, reference the original
+        return f"file://{dimg.fullpath}", None
+    thumb_fname = f"{MAC_PATH}{thumb}"
+    if is_kmz:
+        return f"{KMZ_FILES_DIR}/{thumb.lstrip('/')}", thumb_fname
+    return os.path.relpath(thumb_fname, os.path.dirname(kml_fname)), thumb_fname
+
+
+# .............................................................................
+def placemark_kml(dimg, href):
+    """Create a KML placemark for one image, viewed from just above the dam.
+
+    Args:
+        dimg (DamMeta): object with metadata for one image with valid coordinates.
+        href (str): reference to the image to display in the placemark balloon.
+
+    Returns:
+        KML Placemark element (str)
+    """
+    dt = _date_string(dimg.img_date)
+    basename = os.path.splitext(dimg.basename)[0]
+    desc = f"{basename} in {dimg.arroyo_name}"
+    timestamp = ""
+    if dt is not None:
+        desc = f"{desc} on {dt}"
+        timestamp = f"    <TimeStamp><when>{dt}</when></TimeStamp>\n"
+    return (
+        "  <Placemark>\n"
+        f"    <name>{escape(dimg.basename)}</name>\n"
+        f"{timestamp}"
+        "    <styleUrl>#dam</styleUrl>\n"
+        f"    <description><![CDATA[<img style='max-width:{RESIZE_WIDTH}px;' "
+        f"src='{href}'/><br/>{escape(desc)}]]></description>\n"
+        "    <LookAt>\n"
+        f"      <longitude>{dimg.longitude}</longitude>\n"
+        f"      <latitude>{dimg.latitude}</latitude>\n"
+        "      <altitude>2</altitude>\n"
+        "      <range>4</range>\n"
+        "      <tilt>45</tilt>\n"
+        "      <heading>0</heading>\n"
+        "      <altitudeMode>relativeToGround</altitudeMode>\n"
+        "    </LookAt>\n"
+        f"    <Point><coordinates>{dimg.longitude},{dimg.latitude}</coordinates>"
+        "</Point>\n"
+        "  </Placemark>\n")
+
+
+# .............................................................................
+def read_template(template_fname=KML_TEMPLATE, name="anaya_dams"):
+    """Split the KML template into the text before and after the placemarks.
+
+    Args:
+        template_fname (str): full filename of a KML template containing #SCHEMA#
+            and #PLACEMARKS# markers.
+        name (str): name for the top folder, replacing the #NAME# marker.
+
+    Returns:
+        head (str): text of the template before the placemarks.
+        tail (str): text of the template after the placemarks.
+
+    Raises:
+        Exception: on template without a #PLACEMARKS# marker.
+    """
+    with open(template_fname, "r", encoding="utf-8") as f:
+        template = f.read()
+    template = template.replace("#SCHEMA#", KML_STYLE)
+    template = template.replace("#NAME#", escape(name))
+    try:
+        head, tail = template.split("#PLACEMARKS#")
+    except ValueError:
+        raise Exception(
+            f"Template {template_fname} has no single #PLACEMARKS# marker")
+    return head, tail
+
+
+# .............................................................................
+def _folder_key(dimg):
+    dt = dimg.img_date
+    year = dt[0] if dt and dt[0] else "unknown"
+    return (dimg.arroyo_name, str(year))
+
+
+# .............................................................................
+def generate_kml(dimgs, kml_fname, is_kmz=False, template_fname=KML_TEMPLATE):
+    """Yield chunks of KML text for images, in Folders by arroyo, then year.
+
+    Args:
+        dimgs (iterable): DamMeta objects; only those in bounds are written.
+        kml_fname (str): full filename of the output KML or KMZ file.
+        is_kmz (bool): True if thumbnails are packaged in a KMZ archive.
+        template_fname (str): full filename of the KML template.
+
+    Yields:
+        text (str): consecutive parts of the KML document, of up to KML_BATCH
+            placemarks each.
+        thumbs (dict): {href: thumb_fname} for thumbnails referenced in text.
+    """
+    name = os.path.splitext(os.path.basename(kml_fname))[0]
+    head, tail = read_template(template_fname, name=name)
+    dimgs = [dimg for dimg in dimgs if dimg.in_bounds == 1]
+    dimgs.sort(key=lambda dimg: _folder_key(dimg) + (dimg.relfname, ))
+
+    parts = [head]
+    thumbs = {}
+    count = 0
+    curr_arroyo = curr_year = None
+    for dimg in dimgs:
+        arroyo, year = _folder_key(dimg)
+        if arroyo != curr_arroyo:
+            if curr_arroyo is not None:
+                parts.append("</Folder>\n</Folder>\n")
+            parts.append(f"<Folder><name>{escape(arroyo)}</name>\n")
+            parts.append(f"<Folder><name>{year}</name>\n")
+            curr_arroyo, curr_year = arroyo, year
+        elif year != curr_year:
+            parts.append(f"</Folder>\n<Folder><name>{year}</name>\n")
+            curr_year = year
+        href, thumb_fname = thumbnail_href(dimg, kml_fname, is_kmz=is_kmz)
+        if thumb_fname is not None:
+            thumbs[href] = thumb_fname
+        parts.append(placemark_kml(dimg, href))
+        count += 1
+        if count % KML_BATCH == 0:
+            yield "".join(parts), thumbs
+            parts = []
+            thumbs = {}
+    if curr_arroyo is not None:
+        parts.append("</Folder>\n</Folder>\n")
+    parts.append(tail)
+    yield "".join(parts), thumbs
+
+
+# .............................................................................
+def write_kml(
+        kml_fname, dimgs, overwrite=True, template_fname=KML_TEMPLATE, logger=None):
+    """Write images as placemarks to a KML file, or to a KMZ file with thumbnails.
+
+    Args:
+        kml_fname (str): full filename of the output; a .kmz extension writes a
+            zipped archive containing the KML document and thumbnails.
+        dimgs (iterable): DamMeta objects; only those in bounds are written.
+        overwrite (bool): flag indicating whether to overwrite an existing file.
+        template_fname (str): full filename of the KML template.
+        logger (object): logger for recording messages to file or command line.
+
+    Returns:
+        count of thumbnails packaged in a KMZ, 0 for KML.
+    """
+    is_kmz = kml_fname.lower().endswith(".kmz")
+    if not ready_filename(kml_fname, overwrite=overwrite):
+        return 0
+    packed = set()
+    if is_kmz:
+        with zipfile.ZipFile(kml_fname, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            all_thumbs = {}
+            with zf.open("doc.kml", "w") as kmlf:
+                for text, thumbs in generate_kml(
+                        dimgs, kml_fname, is_kmz=True, template_fname=template_fname):
+                    kmlf.write(text.encode("utf-8"))
+                    all_thumbs.update(thumbs)
+            for href, thumb_fname in all_thumbs.items():
+                if os.path.exists(thumb_fname):
+                    # JPEG is already compressed
+                    zf.write(thumb_fname, href, compress_type=zipfile.ZIP_STORED)
+                    packed.add(href)
+                elif logger is not None:
+                    logger.warning(f"Missing thumbnail {thumb_fname} for {kml_fname}")
+    else:
+        with open(kml_fname, "w", encoding="utf-8", buffering=1024 * 1024) as kmlf:
+            for text, _thumbs in generate_kml(
+                    dimgs, kml_fname, is_kmz=False, template_fname=template_fname):
+                kmlf.write(text)
+    if logger is not None:
+        logger.info(f"Wrote {kml_fname} with {len(packed)} packaged thumbnails")
+    return len(packed)
+
+
+# .............................................................................
+def region_kml(bbox, min_lod=KML_LOD_PIXELS, max_lod=-1):
+    """Create a KML Region for a bounding box, active within a range of sizes.
+
+    Args:
+        bbox (tuple): bounds in (min_x, min_y, max_x, max_y) format.
+        min_lod (int): on-screen size of the region, in pixels, at which it becomes
+            active.
+        max_lod (int): on-screen size of the region, in pixels, at which it becomes
+            inactive; -1 for never.
+
+    Returns:
+        KML Region element (str)
+    """
+    return (
+        "<Region><LatLonAltBox>"
+        f"<north>{bbox[3]}</north><south>{bbox[1]}</south>"
+        f"<east>{bbox[2]}</east><west>{bbox[0]}</west>"
+        "</LatLonAltBox>"
+        f"<Lod><minLodPixels>{min_lod}</minLodPixels>"
+        f"<maxLodPixels>{max_lod}</maxLodPixels></Lod></Region>\n")
+
+
+# .............................................................................
+def network_link_kml(name, bbox, href, min_lod=KML_LOD_PIXELS):
+    """Create a KML NetworkLink loading a file when its Region becomes active.
+
+    Args:
+        name (str): name of the link.
+        bbox (tuple): bounds of the linked file in (min_x, min_y, max_x, max_y) format.
+        href (str): reference to the linked file, relative to the linking file.
+        min_lod (int): on-screen size of the region, in pixels, at which it loads.
+
+    Returns:
+        KML NetworkLink element (str)
+    """
+    return (
+        f"<NetworkLink><name>{escape(name)}</name>\n"
+        f"{region_kml(bbox, min_lod=min_lod)}"
+        f"<Link><href>{escape(href)}</href>"
+        "<viewRefreshMode>onRegion</viewRefreshMode></Link></NetworkLink>\n")
+
+
+# .............................................................................
+def _split_bbox(bbox, dimgs):
+    # Quadrants SW, SE, NW, NE, with the images in each
+    mid_x = (bbox[0] + bbox[2]) / 2
+    mid_y = (bbox[1] + bbox[3]) / 2
+    quads = [
+        ((bbox[0], bbox[1], mid_x, mid_y), []),
+        ((mid_x, bbox[1], bbox[2], mid_y), []),
+        ((bbox[0], mid_y, mid_x, bbox[3]), []),
+        ((mid_x, mid_y, bbox[2], bbox[3]), [])]
+    for dimg in dimgs:
+        idx = 0 if dimg.longitude < mid_x else 1
+        if dimg.latitude >= mid_y:
+            idx += 2
+        quads[idx][1].append(dimg)
+    return quads
+
+
+# .............................................................................
+def _write_tile(out_dir, key, bbox, dimgs, max_placemarks, max_depth):
+    """Write one tile, and recursively its child tiles, of a region-tiled KML.
+
+    Args:
+        out_dir (str): directory containing the root KML document.
+        key (str): quadtree key of the tile, one digit per level.
+        bbox (tuple): bounds of the tile in (min_x, min_y, max_x, max_y) format.
+        dimgs (list): DamMeta objects within bbox, in output order.
+        max_placemarks (int): most placemarks in a tile before splitting.
+        max_depth (int): deepest level of tiles.
+
+    Returns:
+        count of tile files written.
+    """
+    tile_fname = os.path.join(out_dir, KML_TILE_DIR, f"{key}.kml")
+    ready_filename(tile_fname, overwrite=True)
+    parts = [
+        '<?xml version="1.0" encoding="utf-8" ?>\n'
+        '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+        f"<Document><name>{key}</name>\n{KML_STYLE}\n"]
+    count = 1
+    if len(dimgs) <= max_placemarks or len(key) >= max_depth:
+        # Leaf, all placemarks
+        for dimg in dimgs:
+            href, _thumb_fname = thumbnail_href(dimg, tile_fname)
+            parts.append(placemark_kml(dimg, href))
+    else:
+        # Sample of placemarks, hidden when the child tiles load
+        step = -(-len(dimgs) // max_placemarks)
+        parts.append("<Folder><name>overview</name>\n")
+        parts.append(region_kml(bbox, min_lod=0, max_lod=2 * KML_LOD_PIXELS))
+        for dimg in dimgs[::step]:
+            href, _thumb_fname = thumbnail_href(dimg, tile_fname)
+            parts.append(placemark_kml(dimg, href))
+        parts.append("</Folder>\n")
+        for i, (child_bbox, child_dimgs) in enumerate(_split_bbox(bbox, dimgs)):
+            if child_dimgs:
+                child_key = f"{key}{i}"
+                parts.append(
+                    network_link_kml(child_key, child_bbox, f"{child_key}.kml"))
+                count += _write_tile(
+                    out_dir, child_key, child_bbox, child_dimgs, max_placemarks,
+                    max_depth)
+    parts.append("</Document></kml>\n")
+    with open(tile_fname, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+    return count
+
+
+# .............................................................................
+def write_region_kml(
+        out_dir, dimgs, overwrite=True, max_placemarks=KML_TILE_MAX,
+        max_depth=KML_TILE_DEPTH, template_fname=KML_TEMPLATE, logger=None):
+    """Write images as a quadtree of KML tiles, loaded by Region as the view zooms.
+
+    Args:
+        out_dir (str): output directory for doc.kml, and tiles in KML_TILE_DIR.
+        dimgs (iterable): DamMeta objects; only those in bounds are written.
+        overwrite (bool): flag indicating whether to overwrite an existing output.
+        max_placemarks (int): most placemarks in a tile before splitting it into
+            quadrants.
+        max_depth (int): deepest level of tiles; deeper tiles hold all placemarks.
+        template_fname (str): full filename of the KML template.
+        logger (object): logger for recording messages to file or command line.
+
+    Returns:
+        count of tile files written.
+
+    Note:
+        Each tile with more than max_placemarks images shows an evenly spaced sample
+        of them until it is large on screen, then loads its 4 quadrants through
+        NetworkLinks.  Open doc.kml in Google Earth.
+    """
+    doc_fname = os.path.join(out_dir, "doc.kml")
+    if not ready_filename(doc_fname, overwrite=overwrite):
+        return 0
+    dimgs = [dimg for dimg in dimgs if dimg.in_bounds == 1]
+    if not dimgs:
+        if logger is not None:
+            logger.info(f"No images in bounds for {doc_fname}")
+        return 0
+    dimgs.sort(key=lambda dimg: dimg.relfname)
+    xs = [dimg.longitude for dimg in dimgs]
+    ys = [dimg.latitude for dimg in dimgs]
+    # Square tiles, padded so points are not on the edge
+    size = max(max(xs) - min(xs), max(ys) - min(ys), 0.0001) * 1.01
+    ctr_x = (min(xs) + max(xs)) / 2
+    ctr_y = (min(ys) + max(ys)) / 2
+    bbox = (ctr_x - size / 2, ctr_y - size / 2, ctr_x + size / 2, ctr_y + size / 2)
+    count = _write_tile(out_dir, "0", bbox, dimgs, max_placemarks, max_depth)
+
+    name = os.path.basename(os.path.normpath(out_dir))
+    head, tail = read_template(template_fname, name=name)
+    with open(doc_fname, "w", encoding="utf-8") as f:
+        f.write(head)
+        f.write(network_link_kml(
+            name, bbox, f"{KML_TILE_DIR}/0.kml", min_lod=0))
+        f.write(tail)
+    if logger is not None:
+        logger.info(f"Wrote {doc_fname} with {count} tiles of {len(dimgs)} images")
+    return count
@@ -0,0 +1,192 @@
+"""Write and read image metadata as typed columnar Parquet or Feather (Arrow IPC) files."""
+import datetime
+import json
+import os
+
+from dammap.common.constants import (
+    IMAGE_KEYS as IK, INTEGER_FIELDS, REAL_FIELDS, SHP_FIELDS)
+from dammap.common.dammeta import RECORD_FIELDS
+
+# Optional dependency, only required for columnar files
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:
+    pa = feather = parquet = None
+
+# Table file formats, by filename extension
+TABLE_FORMATS = {".parquet": "parquet", ".feather": "feather", ".arrow": "feather"}
+# Fields with (year, month, day) values, written as dates
+DATE_FIELDS = (IK.IMG_DATE, IK.DAM_DATE)
+# Fields with values other than str, int or float, written as their string
+STRING_FIELDS = (IK.VERB_LON, IK.VERB_LAT)
+# Fields written after SHP_FIELDS, as strings, that are not in shapefiles
+EXTRA_FIELDS = (IK.CAMERA,)
+# Key in the table schema metadata for the PicMapper source
+SOURCE_KEY = b"dammap"
+# Python types of identifiers written to string fields, restored on reading
+FIELD_TYPES = {"int": int, "float": float}
+
+
+# .............................................................................
+def _require_pyarrow():
+    if pa is None:
+        raise Exception(
+            "Columnar export requires the optional package pyarrow; "
+            "install it with `pip install pyarrow`")
+
+
+# .............................................................................
+def _table_format(fname):
+    ext = os.path.splitext(fname)[1].lower()
+    try:
+        return TABLE_FORMATS[ext]
+    except KeyError:
+        raise Exception(
+            f"Unsupported table extension {ext}, use one of "
+            f"{list(TABLE_FORMATS.keys())}")
+
+
+# .............................................................................
+def table_schema():
+    """Arrow schema for the fields in SHP_FIELDS, then EXTRA_FIELDS.
+
+    Returns:
+        pyarrow.Schema with dates as date32, longitude and latitude as float64.
+    """
+    _require_pyarrow()
+    fields = []
+    for fldname, _fldtype in SHP_FIELDS:
+        if fldname in DATE_FIELDS:
+            tp = pa.date32()
+        elif fldname == IK.NO_GEO:
+            tp = pa.bool_()
+        elif fldname in STRING_FIELDS:
+            tp = pa.string()
+        elif fldname in INTEGER_FIELDS:
+            tp = pa.int64()
+        elif fldname in REAL_FIELDS:
+            tp = pa.float64()
+        else:
+            tp = pa.string()
+        fields.append(pa.field(fldname, tp))
+    for fldname in EXTRA_FIELDS:
+        fields.append(pa.field(fldname, pa.string()))
+    return pa.schema(fields)
+
+
+# .............................................................................
+def _to_date(date_seq):
+    try:
+        return datetime.date(*(int(val) for val in date_seq))
+    except (TypeError, ValueError):
+        return None
+
+
+# .............................................................................
+def _to_int(val):
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return None
+
+
+# .............................................................................
+def _value_type(col):
+    # Name in FIELD_TYPES of the type shared by all values in col, or None
+    types = {type(val) for val in col if val is not None}
+    if len(types) == 1:
+        for name, tp in FIELD_TYPES.items():
+            if types == {tp}:
+                return name
+    return None
+
+
+# .............................................................................
+def write_table(fname, dimgs, image_path, is_dam_separated, cameras=None):
+    """Write DamMeta records to a Parquet or Feather file.
+
+    Args:
+        fname (str): full filename, with a .parquet, .feather or .arrow extension.
+        dimgs (list): DamMeta objects to write.
+        image_path (str): root path for the image files, saved in the schema metadata.
+        is_dam_separated (bool): organization of image_path, saved in the schema
+            metadata.
+        cameras (dict): {camera: count} of all images read, including those without
+            metadata that are not in dimgs, saved in the schema metadata.
+
+    Note:
+        Identifiers in string fields, such as flow_id and drainage, that are all int
+        or all float are written as strings, and their type is saved in the schema
+        metadata so read_table can restore them.
+
+    Raises:
+        Exception: on pyarrow not installed, or an unsupported extension.
+    """
+    _require_pyarrow()
+    fmt = _table_format(fname)
+    schema = table_schema()
+    field_types = {}
+    # Transpose rows into columns
+    columns = list(zip(*[dimg.row for dimg in dimgs])) or [()] * len(RECORD_FIELDS)
+    arrays = []
+    for fldname, col, field in zip(RECORD_FIELDS, columns, schema):
+        if fldname in DATE_FIELDS:
+            col = [_to_date(val) for val in col]
+        elif fldname in STRING_FIELDS:
+            col = [None if val is None else str(val) for val in col]
+        elif pa.types.is_integer(field.type):
+            col = [_to_int(val) for val in col]
+        elif pa.types.is_string(field.type):
+            value_type = _value_type(col)
+            if value_type is not None:
+                field_types[fldname] = value_type
+            col = [None if val is None else str(val) for val in col]
+        arrays.append(pa.array(col, type=field.type))
+    arrays.append(pa.array([dimg.guilty_party for dimg in dimgs], type=pa.string()))
+    source = {
+        "image_path": image_path, "is_dam_separated": is_dam_separated,
+        "field_types": field_types, "cameras": cameras}
+    schema = schema.with_metadata({SOURCE_KEY: json.dumps(source)})
+    table = pa.Table.from_arrays(arrays, schema=schema)
+    if fmt == "parquet":
+        parquet.write_table(table, fname)
+    else:
+        feather.write_feather(table, fname)
+
+
+# .............................................................................
+def read_table(fname):
+    """Read a Parquet or Feather file written by write_table.
+
+    Args:
+        fname (str): full filename, with a .parquet, .feather or .arrow extension.
+
+    Returns:
+        columns (dict): {fldname: list of values}, with dates as [yyyy, mm, dd]
+            lists as in DamMeta, and string fields written from int or float values
+            restored to that type.
+        source (dict): image_path, is_dam_separated and cameras of the written
+            PicMapper.
+
+    Raises:
+        Exception: on pyarrow not installed, or an unsupported extension.
+    """
+    _require_pyarrow()
+    fmt = _table_format(fname)
+    if fmt == "parquet":
+        table = parquet.read_table(fname)
+    else:
+        table = feather.read_table(fname)
+    source = json.loads(table.schema.metadata[SOURCE_KEY])
+    columns = table.to_pydict()
+    for fldname in DATE_FIELDS:
+        columns[fldname] = [
+            None if dt is None else [dt.year, dt.month, dt.day]
+            for dt in columns[fldname]]
+    for fldname, value_type in source.get("field_types", {}).items():
+        tp = FIELD_TYPES[value_type]
+        columns[fldname] = [
+            None if val is None else tp(val) for val in columns[fldname]]
+    return columns, source
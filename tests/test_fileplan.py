@@ -0,0 +1,162 @@
+"""Tests for planning, executing, resuming and rolling back file operations."""
+import json
+import os
+
+import pytest
+
+from dammap.common.fileplan import (
+    EVENT_DONE, EVENT_PLAN, EVENT_START, FileOpPlan)
+
+
+# .............................................................................
+def _write(pth, text):
+    os.makedirs(os.path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+
+
+# .............................................................................
+def _read(pth):
+    with open(pth) as f:
+        return f.read()
+
+
+# .............................................................................
+def _contents(path):
+    return {
+        os.path.relpath(os.path.join(root, fname), path): _read(
+            os.path.join(root, fname))
+        for root, _dirs, fnames in os.walk(path) for fname in fnames}
+
+
+# .............................................................................
+def _write_journal(journal_fname, steps, events):
+    with open(journal_fname, "w") as f:
+        f.write(json.dumps({"event": EVENT_PLAN, "steps": steps}) + "\n")
+        for event, sidx in events:
+            f.write(json.dumps({"event": event, "step": sidx}) + "\n")
+
+
+# .............................................................................
+@pytest.fixture
+def files(tmp_path):
+    path = str(tmp_path / "files")
+    for name in ("a", "b", "c"):
+        _write(os.path.join(path, name), name)
+    return path
+
+
+# .............................................................................
+def test_chain_vacates_each_destination_first(files, tmp_path):
+    plan = FileOpPlan()
+    plan.add_rename(os.path.join(files, "a"), os.path.join(files, "b"))
+    plan.add_rename(os.path.join(files, "b"), os.path.join(files, "c"))
+    plan.add_rename(os.path.join(files, "c"), os.path.join(files, "d"))
+    assert plan.execute(journal_fname=str(tmp_path / "journal")) == 3
+    assert _contents(files) == {"b": "a", "c": "b", "d": "c"}
+
+
+# .............................................................................
+def test_cycle_swaps_through_temporary_name(files, tmp_path):
+    plan = FileOpPlan()
+    plan.add_rename(os.path.join(files, "a"), os.path.join(files, "b"))
+    plan.add_rename(os.path.join(files, "b"), os.path.join(files, "a"))
+    assert plan.execute(journal_fname=str(tmp_path / "journal")) == 3
+    assert _contents(files) == {"a": "b", "b": "a", "c": "c"}
+
+
+# .............................................................................
+def test_invalid_operations(files):
+    plan = FileOpPlan()
+    plan.add_rename(os.path.join(files, "a"), os.path.join(files, "c"))
+    plan.add_rename(os.path.join(files, "missing"), os.path.join(files, "e"))
+    plan.add_copy(os.path.join(files, "b"), os.path.join(files, "f"))
+    assert sorted(plan.validate()) == [0, 1]
+    with pytest.raises(Exception):
+        plan.execute()
+    assert plan.execute(skip_invalid=True) == 1
+    assert _contents(files) == {"a": "a", "b": "b", "c": "c", "f": "b"}
+
+
+# .............................................................................
+def test_rollback_restores_renames_and_deletes_new_copies(files, tmp_path):
+    journal_fname = str(tmp_path / "journal")
+    before = _contents(files)
+    plan = FileOpPlan()
+    plan.add_rename(os.path.join(files, "a"), os.path.join(files, "b"))
+    plan.add_rename(os.path.join(files, "b"), os.path.join(files, "a"))
+    plan.add_copy(
+        os.path.join(files, "c"), os.path.join(files, "sub", "c"), overwrite=True)
+    plan.execute(journal_fname=journal_fname)
+    assert FileOpPlan.rollback(journal_fname) == 4
+    assert _contents(files) == before
+    assert FileOpPlan.rollback(journal_fname) == 0
+
+
+# .............................................................................
+def test_rollback_keeps_copies_that_replaced_files(files, tmp_path):
+    journal_fname = str(tmp_path / "journal")
+    plan = FileOpPlan()
+    plan.add_copy(os.path.join(files, "a"), os.path.join(files, "b"), overwrite=True)
+    plan.execute(journal_fname=journal_fname)
+    assert FileOpPlan.rollback(journal_fname) == 0
+    assert _contents(files) == {"a": "a", "b": "a", "c": "c"}
+
+
+# .............................................................................
+def test_rollback_ignores_steps_not_started(files, tmp_path):
+    # A planned swap that never ran looks like it ran, by file existence alone
+    journal_fname = str(tmp_path / "journal")
+    plan = FileOpPlan()
+    plan.add_rename(os.path.join(files, "a"), os.path.join(files, "b"))
+    plan.add_rename(os.path.join(files, "b"), os.path.join(files, "a"))
+    _write_journal(journal_fname, plan.resolve(), [])
+    assert FileOpPlan.rollback(journal_fname) == 0
+    assert _contents(files) == {"a": "a", "b": "b", "c": "c"}
+
+
+# .............................................................................
+def test_rollback_and_resume_after_unjournaled_rename(files, tmp_path):
+    plan = FileOpPlan()
+    plan.add_rename(os.path.join(files, "a"), os.path.join(files, "b"))
+    plan.add_rename(os.path.join(files, "b"), os.path.join(files, "a"))
+    steps = plan.resolve()
+    # Crash after the first rename, before journaling it as done
+    os.rename(steps[0][1], steps[0][2])
+    journal_fname = str(tmp_path / "journal")
+    _write_journal(journal_fname, steps, [(EVENT_START, 0)])
+    assert FileOpPlan.rollback(journal_fname) == 1
+    assert _contents(files) == {"a": "a", "b": "b", "c": "c"}
+
+    os.rename(steps[0][1], steps[0][2])
+    _write_journal(journal_fname, steps, [(EVENT_START, 0)])
+    assert FileOpPlan.resume(journal_fname) == 2
+    assert _contents(files) == {"a": "b", "b": "a", "c": "c"}
+    assert FileOpPlan.resume(journal_fname) == 0
+
+
+# .............................................................................
+def test_resume_performs_remaining_steps(files, tmp_path):
+    plan = FileOpPlan()
+    plan.add_rename(os.path.join(files, "a"), os.path.join(files, "d"))
+    plan.add_copy(os.path.join(files, "b"), os.path.join(files, "e"))
+    plan.add_copy(os.path.join(files, "c"), os.path.join(files, "f"))
+    steps = plan.resolve()
+    os.rename(steps[0][1], steps[0][2])
+    journal_fname = str(tmp_path / "journal")
+    _write_journal(journal_fname, steps, [(EVENT_START, 0), (EVENT_DONE, 0)])
+    assert FileOpPlan.resume(journal_fname) == 2
+    assert _contents(files) == {"b": "b", "c": "c", "d": "a", "e": "b", "f": "c"}
+
+
+# .............................................................................
+def test_rollback_deletes_unjournaled_copy(files, tmp_path):
+    plan = FileOpPlan()
+    plan.add_copy(os.path.join(files, "a"), os.path.join(files, "d"))
+    steps = plan.resolve()
+    # Crash after the copy, before journaling it as done
+    _write(steps[0][2], "a")
+    journal_fname = str(tmp_path / "journal")
+    _write_journal(journal_fname, steps, [(EVENT_START, 0)])
+    assert FileOpPlan.rollback(journal_fname) == 1
+    assert _contents(files) == {"a": "a", "b": "b", "c": "c"}